@@ -0,0 +1,100 @@
+import argparse
+import io
+import time
+
+import pytesseract
+from PIL import Image
+
+from captcha_ocr import ocr_captcha
+from captcha_solver import CORPUS_DIR, TemplateSolver, corpus_files, label_of
+
+
+# The path fix_captcha used before the OCR pool: the raw screenshot straight into
+# pytesseract.image_to_string
+def solve_pytesseract(png_bytes):
+    return pytesseract.image_to_string(Image.open(io.BytesIO(png_bytes))).strip()
+
+
+# Function to time `solve` over the test captchas and score its answers
+def run_solver(name, solve, samples):
+    latencies = []
+    exact = 0
+    characters = 0
+    correct_characters = 0
+    for label, png_bytes in samples:
+        started = time.perf_counter()
+        answer = solve(png_bytes)
+        latencies.append(time.perf_counter() - started)
+        exact += answer == label
+        characters += len(label)
+        correct_characters += sum(a == b for a, b in zip(answer, label))
+    latencies.sort()
+    return {
+        "solver": name,
+        "captchas": len(samples),
+        "accuracy": round(exact / len(samples), 3),
+        "char_accuracy": round(correct_characters / max(characters, 1), 3),
+        "latency_mean_ms": round(sum(latencies) / len(latencies) * 1000, 2),
+        "latency_p95_ms": round(
+            latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000, 2
+        ),
+    }
+
+
+# Holds out every `test_every`-th labelled captcha, trains the template solver on the
+# rest and compares it with the pytesseract paths on the held-out captchas
+def main(corpus_dir=CORPUS_DIR, test_every=5, skip_tesseract=False):
+    files = corpus_files(corpus_dir)
+    test_files = files[::test_every]
+    train_files = [path for path in files if path not in set(test_files)]
+    if not test_files or not train_files:
+        print(f"Not enough labelled captchas in {corpus_dir} ({len(files)} found).")
+        return []
+    print(f"Training on {len(train_files)} captchas, testing on {len(test_files)}.")
+
+    samples = []
+    for path in test_files:
+        with open(path, "rb") as fp:
+            samples.append((label_of(path), fp.read()))
+
+    started = time.perf_counter()
+    solver, skipped = TemplateSolver.train(train_files)
+    print(
+        f"Template training: {time.perf_counter() - started:.2f}s, "
+        f"{len(solver.labels)} glyph templates, {skipped} captchas skipped."
+    )
+
+    solvers = [("template", lambda png_bytes: solver.solve(png_bytes)[0])]
+    if not skip_tesseract:
+        solvers += [
+            ("pytesseract", solve_pytesseract),
+            ("pytesseract_preprocessed", lambda png_bytes: ocr_captcha(png_bytes)[0]),
+        ]
+    results = [run_solver(name, solve, samples) for name, solve in solvers]
+    for result in results:
+        print(", ".join(f"{key}={value}" for key, value in result.items()))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compare the template captcha solver with pytesseract."
+    )
+    parser.add_argument("--corpus", default=CORPUS_DIR)
+    parser.add_argument(
+        "--test-every",
+        type=int,
+        default=5,
+        help="Hold out every n-th labelled captcha for testing.",
+    )
+    parser.add_argument(
+        "--skip-tesseract",
+        action="store_true",
+        help="Only benchmark the template solver.",
+    )
+    args = parser.parse_args()
+    main(
+        corpus_dir=args.corpus,
+        test_every=args.test_every,
+        skip_tesseract=args.skip_tesseract,
+    )
@@ -0,0 +1,279 @@
+import asyncio
+import logging
+import os
+from urllib.parse import urlparse
+
+from playwright.async_api import async_playwright
+
+DEFAULT_STATE_FILE = "browser-state.json"
+# A context is replaced after this many uses, or once its page's JS heap grows past
+# the limit, to cap the memory a long crawl accumulates
+DEFAULT_PAGES_PER_CONTEXT = 25
+DEFAULT_MAX_HEAP_MB = 512
+# A page that does not answer a trivial evaluate within this time is considered hung
+HEALTH_CHECK_TIMEOUT = 10  # seconds
+
+# Lean mode: headless, a small viewport and only the requests needed to drive the form
+PORTAL_HOST = "services.ecourts.gov.in"
+LEAN_VIEWPORT = {"width": 1024, "height": 768}
+LEAN_LAUNCH_ARGS = [
+    "--disable-gpu",
+    "--disable-extensions",
+    "--disable-background-networking",
+    "--disable-renderer-backgrounding",
+    "--mute-audio",
+]
+LEAN_BLOCKED_RESOURCE_TYPES = {"image", "media", "font"}
+# The captcha is an image but has to be solved, so it always goes through
+CAPTCHA_URL_MARKERS = ("captcha", "securimage")
+ANALYTICS_HOSTS = (
+    "google-analytics.com",
+    "googletagmanager.com",
+    "doubleclick.net",
+    "googlesyndication.com",
+)
+
+
+# Counts the requests the browser made and blocked, the bytes it downloaded and how
+# long portal page loads took, so that lean mode can be compared with a full load
+class TrafficStats:
+    def __init__(self):
+        self.requests = 0
+        self.blocked = 0
+        self.bytes = 0
+        self.load_times = []
+
+    def record_load(self, elapsed):
+        self.load_times.append(elapsed)
+
+    async def record_finished(self, request):
+        self.requests += 1
+        try:
+            sizes = await request.sizes()
+        except Exception:
+            return
+        self.bytes += sizes["responseBodySize"] + sizes["responseHeadersSize"]
+
+    def report(self):
+        loads = len(self.load_times)
+        mean_load = sum(self.load_times) / loads if loads else 0.0
+        line = (
+            f"{self.requests} requests, {self.blocked} blocked, "
+            f"{self.bytes / 1024**2:.1f} MB downloaded, {loads} page loads "
+            f"(mean {mean_load:.2f}s)"
+        )
+        print(f"Traffic report: {line}")
+        logging.info(f"Traffic report: {line}")
+
+
+traffic_stats = TrafficStats()
+
+
+# Function to decide whether lean mode lets a request through: scripts, documents and
+# AJAX calls always pass; images, media and fonts (except the captcha), stylesheets
+# from other hosts and analytics are aborted. The portal's own stylesheets pass since
+# the form hides and shows its dropdowns with them.
+def lean_allows(url, resource_type):
+    if any(marker in url.lower() for marker in CAPTCHA_URL_MARKERS):
+        return True
+    host = urlparse(url).hostname or ""
+    if any(host.endswith(analytics_host) for analytics_host in ANALYTICS_HOSTS):
+        return False
+    if resource_type in LEAN_BLOCKED_RESOURCE_TYPES:
+        return False
+    if resource_type == "stylesheet" and host != PORTAL_HOST:
+        return False
+    return True
+
+
+async def _route_lean(route):
+    request = route.request
+    if lean_allows(request.url, request.resource_type):
+        await route.continue_()
+    else:
+        traffic_stats.blocked += 1
+        await route.abort()
+
+
+# Function to apply lean mode routing to a context, and count its traffic either way
+async def prepare_context(context, lean=False):
+    if lean:
+        await context.route("**/*", _route_lean)
+    context.on(
+        "requestfinished",
+        lambda request: asyncio.ensure_future(traffic_stats.record_finished(request)),
+    )
+
+
+# Function to return the new_context arguments of a (lean) context
+def context_options(lean=False):
+    if lean:
+        return {"viewport": LEAN_VIEWPORT, "reduced_motion": "reduce"}
+    return {}
+
+
+# Function to launch Chromium; lean mode forces headless and trims background work
+async def launch_chromium(playwright, headless=True, lean=False):
+    if lean:
+        return await playwright.chromium.launch(headless=True, args=LEAN_LAUNCH_ARGS)
+    return await playwright.chromium.launch(headless=headless)
+
+
+# Keeps one browser, context and page alive across districts. Cookies (PHPSESSID) are
+# saved to `state_file` and loaded into every new context, so neither a recycled
+# context nor the next run starts a fresh portal session. get_page() hands out a
+# healthy page: crashed or hung pages are replaced, a dropped browser is relaunched and
+# the context is recycled when it runs over its page or memory budget.
+# With `browser` set the session lives in a browser shared with other sessions (pool
+# mode) and only its context is its own.
+class BrowserSession:
+    def __init__(
+        self,
+        headless=True,
+        state_file=DEFAULT_STATE_FILE,
+        pages_per_context=DEFAULT_PAGES_PER_CONTEXT,
+        max_heap_mb=DEFAULT_MAX_HEAP_MB,
+        browser=None,
+        lean=False,
+    ):
+        self.headless = headless
+        self.lean = lean
+        self.state_file = state_file
+        self.pages_per_context = pages_per_context
+        self.max_heap_mb = max_heap_mb
+        self.shared_browser = browser is not None
+        self.browser = browser
+        self.playwright = None
+        self.context = None
+        self.page = None
+        # False until the caller has loaded the portal in the current page
+        self.ready = False
+        self.crashed = False
+        self.uses = 0
+        self.browser_launches = 0
+        self.context_recycles = 0
+        self.page_restarts = 0
+
+    async def launch_browser(self):
+        logging.info("Launching browser.")
+        if self.playwright is None:
+            self.playwright = await async_playwright().start()
+        self.browser = await launch_chromium(self.playwright, self.headless, self.lean)
+        self.browser_launches += 1
+
+    async def new_context(self):
+        storage_state = None
+        if self.state_file and os.path.exists(self.state_file):
+            storage_state = self.state_file
+        self.context = await self.browser.new_context(
+            storage_state=storage_state, **context_options(self.lean)
+        )
+        await prepare_context(self.context, self.lean)
+        self.uses = 0
+        await self.new_page()
+
+    async def new_page(self):
+        self.page = await self.context.new_page()
+        self.crashed = False
+        self.ready = False
+        self.page.on("crash", self._on_crash)
+
+    def _on_crash(self, page):
+        logging.error("Browser page crashed.")
+        self.crashed = True
+
+    # Function to write the cookies and local storage of the context to state_file
+    async def save_state(self):
+        if not self.state_file or self.context is None:
+            return
+        try:
+            await self.context.storage_state(path=self.state_file)
+        except Exception as e:
+            logging.error(f"Error saving browser state: {e}")
+
+    async def healthy(self):
+        if self.page is None or self.crashed or self.page.is_closed():
+            return False
+        try:
+            await asyncio.wait_for(self.page.evaluate("1"), HEALTH_CHECK_TIMEOUT)
+        except Exception as e:
+            logging.error(f"Page health check failed: {e}")
+            return False
+        return True
+
+    # Function to read the JS heap of the page in MB (Chromium only, else 0)
+    async def heap_mb(self):
+        try:
+            heap = await self.page.evaluate(
+                "() => performance.memory ? performance.memory.usedJSHeapSize : 0"
+            )
+        except Exception:
+            return 0
+        return heap / 1024**2
+
+    async def recycle_context(self, reason):
+        logging.info(f"Recycling context after {self.uses} uses: {reason}.")
+        await self.save_state()
+        try:
+            await self.context.close()
+        except Exception as e:
+            logging.error(f"Error closing context: {e}")
+        self.context_recycles += 1
+        await self.new_context()
+
+    async def restart_page(self):
+        logging.info("Restarting page.")
+        try:
+            await self.page.close()
+        except Exception as e:
+            logging.error(f"Error closing page: {e}")
+        self.page_restarts += 1
+        await self.new_page()
+
+    # Function to return a page that is alive, within budget and ready for the next
+    # district. Check `ready` to know whether the portal still has to be loaded in it.
+    async def get_page(self):
+        if self.browser is None or not self.browser.is_connected():
+            if self.shared_browser:
+                raise RuntimeError("The shared browser is gone.")
+            await self.launch_browser()
+            await self.new_context()
+        elif self.context is None:
+            await self.new_context()
+        elif self.uses >= self.pages_per_context:
+            await self.recycle_context("page budget")
+        elif not await self.healthy():
+            await self.restart_page()
+        elif await self.heap_mb() > self.max_heap_mb:
+            await self.recycle_context("memory budget")
+        self.uses += 1
+        return self.page
+
+    # Function to force a reload before the next use, e.g. after an error left the form
+    # in an unknown state
+    def mark_broken(self):
+        self.ready = False
+
+    def report(self):
+        line = (
+            f"{self.browser_launches} browser launches, {self.context_recycles} "
+            f"context recycles, {self.page_restarts} page restarts"
+        )
+        print(f"Browser session: {line}")
+        logging.info(f"Browser session: {line}")
+
+    async def close(self):
+        await self.save_state()
+        if self.context is not None:
+            try:
+                await self.context.close()
+            except Exception as e:
+                logging.error(f"Error closing context: {e}")
+            self.context = None
+        if not self.shared_browser and self.browser is not None:
+            await self.browser.close()
+            self.browser = None
+        if self.playwright is not None:
+            await self.playwright.stop()
+            self.playwright = None
+        logging.info("Browser session closed.")
@@ -0,0 +1,345 @@
+import argparse
+import asyncio
+import datetime
+import json
+import logging
+from itertools import groupby
+
+from captcha_ocr import CaptchaRejected, captcha_stats, close_ocr_pool, solve_captcha
+from db2 import (
+    DB_FILE,
+    fetch_stored_act_queries,
+    iter_acts_rows,
+    save_html_to_db,
+    setup_db,
+)
+from db_writer import BatchWriter
+from fetch_engine import DEFAULT_CONCURRENCY, RunStats, create_http_session, run_workers
+from get_html import (
+    DEFAULT_CASE_STATUS,
+    SUBMIT_ACT_ENDPOINT,
+    act_query_form,
+    html_row_from_response,
+)
+from job_queue import complete_job, enqueue_jobs, fail_job, iter_jobs, job_counts
+from portal_session import PortalSession, captcha_accepted, captcha_rejected
+from response_cache import add_cache_arguments, configure_cache
+from section_index import DEFAULT_SECTION
+
+# Configure logging
+logging.basicConfig(
+    filename="court_navigator.log",  # Log to this file
+    level=logging.INFO,  # Log all INFO level and above
+    format="%(asctime)s - %(levelname)s - %(message)s",  # Include timestamp
+)
+
+CASE_STATUSES = ("Pending", "Disposed")
+NO_ACT_CODES = "E005: No Act Codes list found"
+# Submits of one act query before a wrong captcha is given up on
+MAX_CAPTCHA_ATTEMPTS = 4
+
+
+# Function to build a campaign: every (section, case status) pair queried for every
+# act of every court. Its name keys its jobs, so running the same campaign again
+# resumes it.
+def make_campaign(sections, case_statuses, name=None):
+    sections = list(dict.fromkeys(str(section).strip() for section in sections))
+    case_statuses = list(dict.fromkeys(case_statuses))
+    if not sections or "" in sections:
+        raise ValueError("A campaign needs at least one section")
+    for case_status in case_statuses:
+        if case_status not in CASE_STATUSES:
+            raise ValueError(f"Unknown case status {case_status!r}")
+    if not case_statuses:
+        raise ValueError("A campaign needs at least one case status")
+    return {
+        "name": name or f"{','.join(sections)}/{','.join(case_statuses)}",
+        "sections": sections,
+        "case_statuses": case_statuses,
+        "queries": [
+            (section, case_status)
+            for section in sections
+            for case_status in case_statuses
+        ],
+    }
+
+
+# Function to read a campaign file such as
+# {"name": "violent", "sections": ["302", "307"], "case_statuses": ["Pending", "Disposed"]}
+def load_campaign(campaign_file):
+    with open(campaign_file) as fp:
+        definition = json.load(fp)
+    return make_campaign(
+        definition["sections"],
+        definition.get("case_statuses", [DEFAULT_CASE_STATUS]),
+        definition.get("name"),
+    )
+
+
+def campaign_stage(campaign):
+    return f"campaign:{campaign['name']}"
+
+
+# Function to group the Acts rows (in court order) by court establishment:
+# ((state_code, district_code, court_code, establishment_code), [rows])
+def group_court_rows(rows):
+    for court, court_rows in groupby(rows, key=lambda row: tuple(row[2:6])):
+        yield court, list(court_rows)
+
+
+# Function to queue one job per court establishment, holding all of its Acts rows;
+# courts queued by an earlier run of the campaign are kept
+def enqueue_campaign_jobs(connection, campaign):
+    return enqueue_jobs(
+        connection,
+        campaign_stage(campaign),
+        (
+            ("|".join(court), court_rows)
+            for court, court_rows in group_court_rows(iter_acts_rows(connection))
+        ),
+    )
+
+
+# Counts what a campaign run submitted, and what the same queries would have cost as
+# separate runs: one run per (section, case status), each opening its own session
+# and solving a captcha at every court it visits before submitting. Both sides count
+# the successful submits that reached the portal; resubmits (expired sessions, refused
+# captchas) and submits answered by the response cache are reported on their own.
+class CampaignStats:
+    def __init__(self, campaign):
+        self.campaign = campaign
+        self.courts = 0
+        self.submits = 0
+        self.stored = 0
+        # (section, case status) pairs submitted anywhere: the separate runs
+        self.queries_run = set()
+        # Court visits the separate runs would have made: one per court and query
+        self.naive_visits = 0
+
+    def record_court(self, queries_run, submits):
+        self.courts += 1
+        self.queries_run.update(queries_run)
+        self.naive_visits += len(queries_run)
+        self.submits += submits
+
+    def naive_requests(self, live_submits):
+        return len(self.queries_run) + self.naive_visits + live_submits
+
+    def report(self, portal):
+        # The cache never stores a refusal, so every cached submit was a successful one
+        live_submits = self.submits - portal.cache_hits
+        resubmits = portal.requests - live_submits
+        used = portal.handshakes + portal.captchas + live_submits
+        naive = self.naive_requests(live_submits)
+        saved = naive - used
+        lines = [
+            f"{self.courts} courts, {self.submits} queries submitted, "
+            f"{self.stored} already stored",
+            f"{used} requests ({portal.handshakes} sessions, {portal.captchas} "
+            f"captchas, {live_submits} submits) against {naive} for separate runs "
+            f"({len(self.queries_run)} sessions, {self.naive_visits} "
+            f"captchas, {live_submits} submits)",
+            f"saved {saved} requests ({saved / naive if naive else 0:.0%})",
+            f"not counted: {resubmits} resubmits, {portal.cache_hits} submits "
+            f"answered from the cache",
+        ]
+        for line in lines:
+            print(f"Campaign {self.campaign['name']}: {line}")
+            logging.info(f"Campaign {self.campaign['name']}: {line}")
+
+
+# Function to submit one act query with the session captcha. A refused answer, or a
+# response that is no clear result, drops the captcha and the query is submitted
+# again with a new one, up to MAX_CAPTCHA_ATTEMPTS times. Returns the COURTS_HTML row
+# of the result page.
+async def submit_act_query(
+    portal, state_code, district_code, court_code, est_code, act_code, query
+):
+    section_number, case_status = query
+    for attempt in range(1, MAX_CAPTCHA_ATTEMPTS + 1):
+        answer = await portal.captcha(solve_captcha)
+        status, response_text = await portal.post(
+            SUBMIT_ACT_ENDPOINT,
+            act_query_form(
+                state_code,
+                district_code,
+                court_code,
+                est_code,
+                act_code,
+                section_number,
+                case_status,
+                answer,
+            ),
+        )
+        if status != 200:
+            raise RuntimeError(f"submitAct returned status {status}")
+        rejected = captcha_rejected(response_text)
+        if not rejected and not captcha_accepted(response_text):
+            # Neither refused nor clearly accepted (e.g. "Invalid Request"): nothing
+            # is stored, and the query is submitted again with a new captcha
+            captcha_stats.record_unknown()
+            logging.warning(
+                f"No clear submitAct response for act {act_code} on attempt "
+                f"{attempt}; trying again."
+            )
+            portal.reject_captcha(answer)
+            continue
+        captcha_stats.record_submit(not rejected)
+        if not rejected:
+            return html_row_from_response(
+                datetime.date.today(),
+                state_code,
+                district_code,
+                court_code,
+                est_code,
+                act_code,
+                response_text,
+                section_number,
+                case_status,
+            )
+        logging.warning(f"Captcha '{answer}' rejected on attempt {attempt}.")
+        portal.reject_captcha(answer)
+
+    captcha_stats.given_up += 1
+    raise CaptchaRejected(
+        f"Captcha not accepted in {MAX_CAPTCHA_ATTEMPTS} submits for act {act_code} of "
+        f"{(state_code, district_code, court_code, est_code)}"
+    )
+
+
+# Function to run every query of the campaign for one court establishment in one
+# visit: all acts, sections and case statuses back to back on the session captcha and
+# app_token. Queries whose page is already stored are skipped.
+async def run_court(portal, connection, writer, campaign, court_rows, stats):
+    state_code, district_code, court_code, est_code = court_rows[0][2:6]
+    stored = fetch_stored_act_queries(
+        connection, state_code, district_code, court_code, est_code
+    )
+    queries_run = set()
+    submits = 0
+    for row in court_rows:
+        act_code = row[6]
+        for query in campaign["queries"]:
+            if (act_code, *query) in stored:
+                stats.stored += 1
+                continue
+            if act_code == NO_ACT_CODES:
+                save_html_to_db(
+                    connection,
+                    datetime.date.today(),
+                    state_code,
+                    district_code,
+                    court_code,
+                    est_code,
+                    NO_ACT_CODES,
+                    query[1],
+                    NO_ACT_CODES,
+                    query[0],
+                    writer=writer,
+                )
+                continue
+            html_row = await submit_act_query(
+                portal, state_code, district_code, court_code, est_code, act_code, query
+            )
+            save_html_to_db(connection, *html_row, writer=writer)
+            queries_run.add(query)
+            submits += 1
+    stats.record_court(queries_run, submits)
+
+
+# Streams the courts of a campaign into `concurrency` workers sharing one portal
+# session; each worker runs all queries of its court before taking the next one
+async def main(campaign, concurrency=DEFAULT_CONCURRENCY, batch_size=100):
+    connection = setup_db()
+    stage = campaign_stage(campaign)
+    enqueue_campaign_jobs(connection, campaign)
+    print(
+        f"Campaign {campaign['name']}: {len(campaign['queries'])} queries per act, "
+        f"courts: {job_counts(connection, stage)}"
+    )
+
+    stats = RunStats(stage)
+    campaign_stats = CampaignStats(campaign)
+
+    async with create_http_session(concurrency) as session:
+        portal = PortalSession(session)
+        with BatchWriter(DB_FILE, batch_size=batch_size) as writer:
+
+            async def worker(job):
+                job_id, court_rows = job
+                with writer.unit():
+                    try:
+                        await run_court(
+                            portal,
+                            connection,
+                            writer,
+                            campaign,
+                            court_rows,
+                            campaign_stats,
+                        )
+                    except Exception as e:
+                        fail_job(connection, job_id, e)
+                        raise
+                    complete_job(connection, job_id, writer)
+
+            await run_workers(
+                iter_jobs(connection, stage),
+                worker,
+                concurrency=concurrency,
+                stats=stats,
+            )
+        portal.report()
+
+    stats.report()
+    captcha_stats.report()
+    campaign_stats.report(portal)
+    close_ocr_pool()
+    connection.close()
+    return campaign_stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Query several sections and case statuses per court in one visit."
+    )
+    parser.add_argument(
+        "--campaign",
+        help="JSON file with the campaign's name, sections and case_statuses.",
+    )
+    parser.add_argument(
+        "--sections",
+        nargs="+",
+        default=[DEFAULT_SECTION],
+        help="IPC sections to query when no campaign file is given.",
+    )
+    parser.add_argument(
+        "--statuses",
+        nargs="+",
+        choices=CASE_STATUSES,
+        default=[DEFAULT_CASE_STATUS],
+        help="Case statuses to query when no campaign file is given.",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=DEFAULT_CONCURRENCY,
+        help="Number of courts queried at once.",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=100,
+        help="Number of pages written per transaction.",
+    )
+    add_cache_arguments(parser)
+    args = parser.parse_args()
+    if args.campaign:
+        campaign = load_campaign(args.campaign)
+    else:
+        campaign = make_campaign(args.sections, args.statuses)
+    cache = configure_cache(args.cache, args.cache_file)
+    asyncio.run(
+        main(campaign, concurrency=args.concurrency, batch_size=args.batch_size)
+    )
+    if cache is not None:
+        cache.report()
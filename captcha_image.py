@@ -0,0 +1,73 @@
+import io
+
+import numpy as np
+from PIL import Image
+
+# Ink pixels with fewer ink neighbours than this (out of 8) are noise specks
+MIN_INK_NEIGHBOURS = 2
+# Column runs narrower than this, or with less ink, are noise rather than glyphs
+MIN_GLYPH_WIDTH = 2
+MIN_GLYPH_INK = 8
+# A column run wider than this many times the median glyph width is several glyphs
+# touching each other and is cut into equal parts
+MAX_GLYPH_WIDTH_RATIO = 1.6
+
+
+# Function to pick the grey level that best separates ink from background (Otsu)
+def otsu_threshold(gray):
+    histogram = np.bincount(gray.astype(np.uint8).ravel(), minlength=256)
+    levels = np.arange(256)
+    weight_dark = np.cumsum(histogram)
+    weight_light = weight_dark[-1] - weight_dark
+    mass_dark = np.cumsum(histogram * levels)
+    mean_dark = mass_dark / np.maximum(weight_dark, 1)
+    mean_light = (mass_dark[-1] - mass_dark) / np.maximum(weight_light, 1)
+    between = weight_dark * weight_light * (mean_dark - mean_light) ** 2
+    return int(np.argmax(between))
+
+
+# Function to drop ink pixels that have fewer than `min_neighbours` ink neighbours
+def remove_specks(ink, min_neighbours=MIN_INK_NEIGHBOURS):
+    height, width = ink.shape
+    padded = np.pad(ink, 1).astype(np.uint8)
+    neighbours = sum(
+        padded[1 + dy : 1 + dy + height, 1 + dx : 1 + dx + width]
+        for dy in (-1, 0, 1)
+        for dx in (-1, 0, 1)
+    ) - ink.astype(np.uint8)
+    return ink & (neighbours >= min_neighbours)
+
+
+# Function to turn screenshot bytes into a boolean ink mask: grayscale, Otsu threshold
+# and speck removal, all in memory
+def ink_mask(png_bytes):
+    rgb = np.asarray(Image.open(io.BytesIO(png_bytes)).convert("RGB"), np.float32)
+    gray = rgb @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+    return remove_specks(gray <= otsu_threshold(gray))
+
+
+# Function to cut an ink mask into glyphs, left to right: runs of columns holding ink,
+# each cropped to its rows. Runs that are too wide are split into equal parts.
+def segment_glyphs(mask):
+    columns = np.concatenate(([False], mask.any(axis=0), [False]))
+    edges = np.flatnonzero(columns[1:] != columns[:-1])
+    runs = [
+        (start, end)
+        for start, end in zip(edges[::2], edges[1::2])
+        if end - start >= MIN_GLYPH_WIDTH and mask[:, start:end].sum() >= MIN_GLYPH_INK
+    ]
+    if not runs:
+        return []
+    median_width = float(np.median([end - start for start, end in runs]))
+    glyphs = []
+    for start, end in runs:
+        parts = max(1, int(round((end - start) / median_width)))
+        if (end - start) <= median_width * MAX_GLYPH_WIDTH_RATIO:
+            parts = 1
+        bounds = np.linspace(start, end, parts + 1).round().astype(int)
+        for left, right in zip(bounds[:-1], bounds[1:]):
+            glyph = mask[:, left:right]
+            rows = np.flatnonzero(glyph.any(axis=1))
+            if rows.size:
+                glyphs.append(glyph[rows[0] : rows[-1] + 1])
+    return glyphs
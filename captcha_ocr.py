@@ -0,0 +1,201 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pytesseract
+from PIL import Image
+
+from captcha_image import ink_mask
+from captcha_solver import MODEL_FILE, TemplateSolver
+
+try:
+    import tesserocr
+except ImportError:  # tesserocr is optional, workers fall back to pytesseract
+    tesserocr = None
+
+DEFAULT_OCR_WORKERS = 2
+# Upscaling factor applied after cleaning; tesseract reads small glyphs badly
+OCR_SCALE = 2
+# The captcha is one line of letters and digits
+CAPTCHA_CHARACTERS = "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789"
+TESSERACT_CONFIG = f"--psm 7 -c tessedit_char_whitelist={CAPTCHA_CHARACTERS}"
+# Template answers below this confidence are read again by OCR
+MIN_TEMPLATE_CONFIDENCE = 30
+
+
+# Function to render an ink mask as black text on white, upscaled for OCR
+def preprocess(png_bytes, scale=OCR_SCALE):
+    clean = np.where(ink_mask(png_bytes), 0, 255).astype(np.uint8)
+    if scale > 1:
+        clean = clean.repeat(scale, axis=0).repeat(scale, axis=1)
+    return clean
+
+
+# Per worker process: one tesserocr API kept open for every solve, so tesseract and
+# its language data are loaded once instead of once per captcha, and the template
+# solver when a trained model exists (python captcha_solver.py)
+_tess_api = None
+_template_solver = None
+
+
+def _init_ocr_worker():
+    global _tess_api, _template_solver
+    if os.path.exists(MODEL_FILE):
+        _template_solver = TemplateSolver.load(MODEL_FILE)
+    if tesserocr is not None:
+        _tess_api = tesserocr.PyTessBaseAPI(psm=tesserocr.PSM.SINGLE_LINE)
+        _tess_api.SetVariable("tessedit_char_whitelist", CAPTCHA_CHARACTERS)
+
+
+# Function run in a worker: preprocess and OCR one captcha. Returns
+# (answer, confidence 0-100, preprocess seconds, OCR seconds).
+def ocr_captcha(png_bytes):
+    started = time.perf_counter()
+    image = Image.fromarray(preprocess(png_bytes))
+    preprocessed = time.perf_counter()
+    if _tess_api is not None:
+        _tess_api.SetImage(image)
+        text = _tess_api.GetUTF8Text()
+        confidence = float(_tess_api.MeanTextConf())
+    else:
+        data = pytesseract.image_to_data(
+            image, config=TESSERACT_CONFIG, output_type=pytesseract.Output.DICT
+        )
+        words = [
+            (word, float(conf))
+            for word, conf in zip(data["text"], data["conf"])
+            if word.strip() and float(conf) >= 0
+        ]
+        text = "".join(word for word, _ in words)
+        confidence = sum(conf for _, conf in words) / len(words) if words else 0.0
+    answer = re.sub(r"[^0-9A-Za-z]", "", text)
+    return (
+        answer,
+        confidence,
+        preprocessed - started,
+        time.perf_counter() - preprocessed,
+    )
+
+
+def ocr_solver_name():
+    return "tesserocr" if tesserocr is not None else "pytesseract"
+
+
+# Function run in a worker: try the template solver first and fall back to OCR when
+# there is no model or it is unsure. Returns (solver, answer, confidence, preprocess
+# seconds, solve seconds).
+def solve_in_worker(png_bytes):
+    if _template_solver is not None:
+        started = time.perf_counter()
+        answer, confidence = _template_solver.solve(png_bytes)
+        if answer and confidence >= MIN_TEMPLATE_CONFIDENCE:
+            return "template", answer, confidence, 0.0, time.perf_counter() - started
+    return (ocr_solver_name(),) + ocr_captcha(png_bytes)
+
+
+class CaptchaRejected(Exception):
+    pass
+
+
+# Collects the latency and confidence of every solve, per solver, and how many
+# submitted answers the portal accepted. Submits without a readable answer (e.g. a
+# timeout) are counted as unknown.
+class CaptchaStats:
+    def __init__(self):
+        self.solvers = {}
+        self.submits = 0
+        self.accepted = 0
+        self.unknown = 0
+        self.given_up = 0
+
+    def record_submit(self, accepted):
+        self.submits += 1
+        self.accepted += int(accepted)
+
+    def record_unknown(self):
+        self.submits += 1
+        self.unknown += 1
+
+    def record(self, solver, latency, confidence):
+        count, total_latency, total_confidence, slowest = self.solvers.get(
+            solver, (0, 0.0, 0.0, 0.0)
+        )
+        self.solvers[solver] = (
+            count + 1,
+            total_latency + latency,
+            total_confidence + confidence,
+            max(slowest, latency),
+        )
+
+    def report(self):
+        for solver, (count, latency, confidence, slowest) in sorted(
+            self.solvers.items()
+        ):
+            line = (
+                f"{solver}: {count} solves, mean {latency / count * 1000:.0f} ms "
+                f"(max {slowest * 1000:.0f} ms), mean confidence {confidence / count:.0f}"
+            )
+            print(f"Captcha report: {line}")
+            logging.info(f"Captcha report: {line}")
+        if self.submits:
+            line = (
+                f"{self.submits} submitted, {self.accepted} accepted "
+                f"({self.accepted / self.submits:.0%}), {self.unknown} unknown, "
+                f"{self.given_up} queries given up"
+            )
+            print(f"Captcha report: {line}")
+            logging.info(f"Captcha report: {line}")
+
+
+captcha_stats = CaptchaStats()
+
+_ocr_pool = None
+
+
+# Function to return the long-lived OCR worker pool, starting it on first use. That is
+# inside a running event loop, next to the BatchWriter thread and the Playwright
+# driver; spawning the workers (rather than forking) keeps them clear of their locks.
+def get_ocr_pool(workers=DEFAULT_OCR_WORKERS):
+    global _ocr_pool
+    if _ocr_pool is None:
+        _ocr_pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_ocr_worker,
+        )
+    return _ocr_pool
+
+
+def close_ocr_pool():
+    global _ocr_pool
+    if _ocr_pool is not None:
+        _ocr_pool.shutdown()
+        _ocr_pool = None
+
+
+# Function to solve a captcha screenshot (PNG bytes) on the worker pool. Returns
+# (answer, confidence); the solve is logged and recorded in captcha_stats.
+async def solve_captcha(png_bytes):
+    started = time.perf_counter()
+    (
+        solver,
+        answer,
+        confidence,
+        preprocess_time,
+        solve_time,
+    ) = await asyncio.get_running_loop().run_in_executor(
+        get_ocr_pool(), solve_in_worker, png_bytes
+    )
+    latency = time.perf_counter() - started
+    captcha_stats.record(solver, latency, confidence)
+    logging.info(
+        f"Captcha solved by {solver} as '{answer}' with confidence {confidence:.0f} "
+        f"in {latency * 1000:.0f} ms (preprocess {preprocess_time * 1000:.0f} ms, "
+        f"solve {solve_time * 1000:.0f} ms)."
+    )
+    return answer, confidence
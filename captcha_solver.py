@@ -0,0 +1,150 @@
+import argparse
+import logging
+import os
+import time
+
+import numpy as np
+
+from captcha_image import ink_mask, segment_glyphs
+
+# Labelled captchas are saved as <answer>.png or <answer>_<anything>.png
+CORPUS_DIR = os.path.join("files", "captchas")
+# Accepted captchas stop being added to the corpus beyond this many files
+MAX_CORPUS_SIZE = 5000
+MODEL_FILE = os.path.join("files", "captcha-templates.npz")
+# Every glyph is scaled to GLYPH_SIZE x GLYPH_SIZE before it is compared
+GLYPH_SIZE = 20
+
+
+# Function to scale a glyph mask to size x size (nearest neighbour) and flatten it
+def glyph_vector(glyph, size=GLYPH_SIZE):
+    height, width = glyph.shape
+    rows = (np.arange(size) * height // size).clip(0, height - 1)
+    columns = (np.arange(size) * width // size).clip(0, width - 1)
+    return glyph[np.ix_(rows, columns)].astype(np.float32).ravel()
+
+
+# Function to turn a captcha screenshot into one vector per glyph, left to right
+def glyph_vectors(png_bytes):
+    glyphs = segment_glyphs(ink_mask(png_bytes))
+    if not glyphs:
+        return np.empty((0, GLYPH_SIZE * GLYPH_SIZE), np.float32)
+    return np.stack([glyph_vector(glyph) for glyph in glyphs])
+
+
+# Function to read the answer a corpus file is labelled with
+def label_of(file_name):
+    return os.path.splitext(os.path.basename(file_name))[0].split("_")[0]
+
+
+# Function to list the labelled captcha files of a corpus directory
+def corpus_files(corpus_dir=CORPUS_DIR):
+    if not os.path.isdir(corpus_dir):
+        return []
+    return sorted(
+        os.path.join(corpus_dir, name)
+        for name in os.listdir(corpus_dir)
+        if name.lower().endswith(".png")
+    )
+
+
+# Function to add a solved captcha to the corpus, e.g. once the portal accepted it.
+# Returns the new file, or None when the corpus is full.
+def save_labelled_captcha(png_bytes, answer, corpus_dir=CORPUS_DIR):
+    os.makedirs(corpus_dir, exist_ok=True)
+    if len(os.listdir(corpus_dir)) >= MAX_CORPUS_SIZE:
+        return None
+    path = os.path.join(corpus_dir, f"{answer}_{time.time_ns()}.png")
+    with open(path, "wb") as fp:
+        fp.write(png_bytes)
+    return path
+
+
+# Nearest-neighbour glyph classifier. Every glyph of every labelled captcha becomes a
+# template; a glyph is read as the character of the closest template (squared
+# Euclidean distance, computed for all glyphs and templates in one matrix product).
+class TemplateSolver:
+    def __init__(self, templates, labels):
+        self.templates = templates
+        self.labels = labels
+        self.template_norms = (templates**2).sum(axis=1)
+
+    # Builds a solver from labelled captcha files; captchas whose glyph count does not
+    # match their label could not be segmented and are skipped
+    @classmethod
+    def train(cls, files):
+        vectors = []
+        labels = []
+        skipped = 0
+        for path in files:
+            label = label_of(path)
+            with open(path, "rb") as fp:
+                sample = glyph_vectors(fp.read())
+            if len(sample) != len(label):
+                skipped += 1
+                continue
+            vectors.append(sample)
+            labels.extend(label)
+        if not vectors:
+            raise ValueError("No usable labelled captchas to train on.")
+        logging.info(
+            f"Trained captcha templates on {len(files) - skipped} captchas, "
+            f"skipped {skipped} that did not segment."
+        )
+        return cls(np.concatenate(vectors), np.array(labels)), skipped
+
+    @classmethod
+    def load(cls, model_file=MODEL_FILE):
+        with np.load(model_file) as model:
+            return cls(model["templates"], model["labels"])
+
+    def save(self, model_file=MODEL_FILE):
+        np.savez_compressed(model_file, templates=self.templates, labels=self.labels)
+
+    # Returns (answer, confidence 0-100). The confidence of a glyph compares its
+    # distance to the best template with the nearest template of any other character.
+    def solve(self, png_bytes):
+        vectors = glyph_vectors(png_bytes)
+        if not len(vectors):
+            return "", 0.0
+        distances = (
+            (vectors**2).sum(axis=1)[:, None]
+            + self.template_norms[None, :]
+            - 2 * vectors @ self.templates.T
+        ).clip(min=0)
+        best = distances.argmin(axis=1)
+        characters = self.labels[best]
+        best_distance = distances[np.arange(len(best)), best]
+        other_distance = np.where(
+            self.labels[None, :] == characters[:, None], np.inf, distances
+        ).min(axis=1)
+        confidence = 100 * (1 - best_distance / np.maximum(other_distance, 1e-9))
+        return "".join(characters), float(confidence.clip(0, 100).mean())
+
+
+def main(corpus_dir=CORPUS_DIR, model_file=MODEL_FILE):
+    files = corpus_files(corpus_dir)
+    print(f"Training on {len(files)} labelled captchas in {corpus_dir}.")
+    solver, skipped = TemplateSolver.train(files)
+    solver.save(model_file)
+    print(
+        f"Saved {len(solver.labels)} glyph templates "
+        f"({len(set(solver.labels))} characters, {skipped} captchas skipped) "
+        f"to {model_file}."
+    )
+
+
+if __name__ == "__main__":
+    # Configure logging
+    logging.basicConfig(
+        filename="court_navigator.log",  # Log to this file
+        level=logging.INFO,  # Log all INFO level and above
+        format="%(asctime)s - %(levelname)s - %(message)s",  # Include timestamp
+    )
+    parser = argparse.ArgumentParser(
+        description="Train the template captcha solver from labelled captchas."
+    )
+    parser.add_argument("--corpus", default=CORPUS_DIR)
+    parser.add_argument("--model", default=MODEL_FILE)
+    args = parser.parse_args()
+    main(corpus_dir=args.corpus, model_file=args.model)
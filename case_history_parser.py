@@ -0,0 +1,202 @@
+import datetime as dt
+import re
+
+from bs4 import BeautifulSoup
+
+try:
+    import lxml.html
+except ImportError:  # lxml is optional, pages are then read with BeautifulSoup
+    lxml = None
+
+from db2 import DATE_COLUMNS, HEADER_COLUMNS
+
+# Columns of CaseHeaders (db2.HEADER_COLUMNS) filled from the label/value cells of the
+# case details and case status tables, keyed by the label as it reads on the page
+# (lower case, without the trailing colon)
+HEADER_LABELS = {
+    "case type": "case_type",
+    "filing number": "filing_number",
+    "filing date": "filing_date",
+    "registration number": "registration_number",
+    "registration date": "registration_date",
+    "first hearing date": "first_hearing_date",
+    "next hearing date": "next_hearing_date",
+    "decision date": "decision_date",
+    "case status": "case_status",
+    "stage of case": "stage_of_case",
+    "nature of disposal": "nature_of_disposal",
+    "court number and judge": "court_and_judge",
+}
+HEADER_TABLE_CLASSES = ("case_details_table", "case_status_table")
+PARTY_TABLE_CLASSES = {
+    "petitioner": "Petitioner_Advocate_table",
+    "respondent": "Respondent_Advocate_table",
+}
+ACTS_TABLE_CLASS = "acts_table"
+HISTORY_TABLE_CLASS = "history_table"
+
+# "1) Name", "2)Name" - a new party in the party tables
+_PARTY_START = re.compile(r"^\s*(\d+)\s*\)\s*")
+_ADVOCATE = re.compile(r"^\s*advocate\s*[-:]?\s*", re.I)
+_SECTION_SEPARATOR = re.compile(r"\s*(?:,|/|&|\band\b)\s*", re.I)
+# "27th March 2019", "1st Feb 2020"
+_ORDINAL = re.compile(r"(\d+)(st|nd|rd|th)\b", re.I)
+_DATE_FORMATS = ("%d-%m-%Y", "%d/%m/%Y", "%d %B %Y", "%d %b %Y", "%Y-%m-%d")
+# Line breaks inside cells separate parties and advocates; they are turned into
+# newlines before parsing so that the cell text keeps them
+_LINE_BREAK = re.compile(r"<br\s*/?>", re.I)
+
+
+# Function to turn the dates the portal prints ("27-03-2019", "27th March 2019") into
+# ISO dates; text that is not a date (e.g. "Not Available") comes back unchanged
+def normalize_date(text):
+    text = " ".join((text or "").split())
+    if not text:
+        return None
+    plain = _ORDINAL.sub(r"\1", text)
+    for date_format in _DATE_FORMATS:
+        try:
+            return dt.datetime.strptime(plain, date_format).date().isoformat()
+        except ValueError:
+            continue
+    return text
+
+
+# The page is read with lxml when it is installed (several times faster) and with
+# BeautifulSoup otherwise; these helpers hide the difference
+def _parse_page(html_content):
+    html_content = _LINE_BREAK.sub("\n", html_content)
+    if lxml is not None:
+        return lxml.html.fromstring(html_content)
+    return BeautifulSoup(html_content, "html.parser")
+
+
+def _tables(page, class_name):
+    if lxml is not None:
+        return page.xpath(f"//table[contains(@class, '{class_name}')]")
+    return page.find_all("table", class_=lambda value: value and class_name in value)
+
+
+def _rows(table):
+    if lxml is not None:
+        return table.iter("tr")
+    return table.find_all("tr")
+
+
+def _cells(row, tags=("td",)):
+    if lxml is not None:
+        return [cell for cell in row if cell.tag in tags]
+    return row.find_all(list(tags), recursive=False)
+
+
+def _raw_text(element):
+    if lxml is not None:
+        return element.text_content()
+    return element.get_text()
+
+
+def _cell_text(cell):
+    return " ".join(_raw_text(cell).split())
+
+
+# Function to read the label/value pairs of the case details and status tables into a
+# dict of CaseHeaders columns
+def parse_header(soup):
+    header = dict.fromkeys(HEADER_COLUMNS)
+    for class_name in HEADER_TABLE_CLASSES:
+        for table in _tables(soup, class_name):
+            for row in _rows(table):
+                cells = [_cell_text(cell) for cell in _cells(row, ("td", "th"))]
+                for label, value in zip(cells[::2], cells[1::2]):
+                    column = HEADER_LABELS.get(label.rstrip(": ").strip().lower())
+                    if column is not None and value:
+                        header[column] = value
+    for column in DATE_COLUMNS:
+        header[column] = normalize_date(header[column])
+    return header
+
+
+# Function to read the parties of one side as (position, name, advocate) rows. The
+# cell lists "1) Name", optionally followed by "Advocate - Name", per party.
+def parse_parties(soup, class_name):
+    parties = []
+    for table in _tables(soup, class_name):
+        for row in _rows(table):
+            for cell in _cells(row):
+                parties.extend(_parse_party_cell(cell, len(parties)))
+    return parties
+
+
+# Function to read the parties listed in one cell, numbered after `known` earlier ones
+def _parse_party_cell(cell, known):
+    parties = []
+    lines = [" ".join(line.split()) for line in _raw_text(cell).split("\n")]
+    for line in filter(None, lines):
+        advocate = _ADVOCATE.match(line)
+        if advocate and parties:
+            position, name, _ = parties[-1]
+            parties[-1] = (position, name, line[advocate.end() :].strip())
+            continue
+        start = _PARTY_START.match(line)
+        if start or not parties:
+            position = int(start.group(1)) if start else known + 1
+            name = line[start.end() :] if start else line
+            parties.append((position, name.strip(), None))
+        else:
+            position, name, advocate_name = parties[-1]
+            parties[-1] = (position, f"{name} {line}", advocate_name)
+    return parties
+
+
+# Function to read the acts table as (act, section) rows, one per section
+def parse_acts(soup):
+    acts = []
+    for table in _tables(soup, ACTS_TABLE_CLASS):
+        for row in _rows(table):
+            cells = [_cell_text(cell) for cell in _cells(row)]
+            if len(cells) < 2 or not cells[0]:
+                continue
+            sections = [s for s in _SECTION_SEPARATOR.split(cells[1]) if s] or [None]
+            acts.extend((cells[0], section) for section in sections)
+    return acts
+
+
+# Function to read the hearing history as (position, judge, business_date,
+# hearing_date, purpose) rows, oldest first as on the page
+def parse_hearings(soup):
+    hearings = []
+    for table in _tables(soup, HISTORY_TABLE_CLASS):
+        for row in _rows(table):
+            cells = [_cell_text(cell) for cell in _cells(row)]
+            if len(cells) < 4:
+                continue
+            judge, business_date, hearing_date, purpose = cells[:4]
+            hearings.append(
+                (
+                    len(hearings) + 1,
+                    judge or None,
+                    normalize_date(business_date),
+                    normalize_date(hearing_date),
+                    purpose or None,
+                )
+            )
+    return hearings
+
+
+# Function to parse one viewHistory page into a dict of rows: "header" (dict of
+# CaseHeaders columns), "parties" ((role, position, name, advocate)), "acts"
+# ((act, section)) and "hearings" ((position, judge, business_date, hearing_date,
+# purpose))
+def parse_case_history(html_content):
+    soup = _parse_page(html_content)
+    parties = [
+        (role,) + party
+        for role, class_name in PARTY_TABLE_CLASSES.items()
+        for party in parse_parties(soup, class_name)
+    ]
+    return {
+        "header": parse_header(soup),
+        "parties": parties,
+        "acts": parse_acts(soup),
+        "hearings": parse_hearings(soup),
+    }
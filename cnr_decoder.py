@@ -0,0 +1,275 @@
+import argparse
+import logging
+import time
+from collections import Counter
+
+import numpy as np
+
+from db2 import (
+    DB_FILE,
+    create_connection,
+    fetch_processing_state,
+    save_processing_state,
+)
+from migrations import migrate
+
+# A CNR is 16 characters, e.g. ASHJ010003602021: state (AS) and district (HJ) letters,
+# establishment number (01), case number (000360) and filing year (2021)
+CNR_LENGTH = 16
+STATE = slice(0, 2)
+DISTRICT = slice(2, 4)
+ESTABLISHMENT = slice(4, 6)
+NUMBER = slice(6, 12)
+YEAR = slice(12, 16)
+# The first six characters name the establishment, and with it the request parameters
+PREFIX_LENGTH = 6
+MIN_YEAR = 1950
+MAX_YEAR = 2100
+
+NO_COURT = -1
+
+# The tables the prefix index is built from. The highest rowid of each at build time
+# is kept in ProcessingState, and a saved index is rebuilt once either table has
+# grown since.
+PREFIX_INDEX_VERSION = 1
+PREFIX_INDEX_SOURCES = ("CNR", "Courts")
+
+
+# Function to turn CNR strings into an (n, 16) array of ASCII codes, upper-cased and
+# stripped. Strings of any other length (or non-ASCII) become rows of zeros, which
+# validate_cnrs rejects.
+def cnr_array(cnrs):
+    cleaned = [str(cnr).strip().upper() for cnr in cnrs]
+    fixed = [cnr if len(cnr) == CNR_LENGTH and cnr.isascii() else "" for cnr in cleaned]
+    raw = np.array(fixed, dtype=f"S{CNR_LENGTH}")
+    return raw.view(np.uint8).reshape(len(fixed), CNR_LENGTH)
+
+
+# Function to read columns of digits as numbers, e.g. the year of every CNR at once
+def _digits_value(codes):
+    weights = 10 ** np.arange(codes.shape[1] - 1, -1, -1)
+    return (codes.astype(np.int64) - ord("0")) @ weights
+
+
+# Function to check an (n, 16) CNR array: four letters, twelve digits, a plausible year
+# and a case number other than zero. Returns a boolean mask.
+def validate_cnrs(codes):
+    letters = codes[:, :4]
+    digits = codes[:, 4:]
+    valid = ((letters >= ord("A")) & (letters <= ord("Z"))).all(axis=1)
+    valid &= ((digits >= ord("0")) & (digits <= ord("9"))).all(axis=1)
+    years = np.where(valid, _digits_value(codes[:, YEAR]), 0)
+    numbers = np.where(valid, _digits_value(codes[:, NUMBER]), 0)
+    return valid & (years >= MIN_YEAR) & (years <= MAX_YEAR) & (numbers > 0)
+
+
+# Function to split CNRs into their fields, all as arrays: valid, prefix (S6),
+# establishment, number and year (0 where invalid)
+def decode_cnrs(cnrs):
+    codes = cnr_array(cnrs)
+    valid = validate_cnrs(codes)
+    prefixes = np.ascontiguousarray(codes[:, :PREFIX_LENGTH]).view(f"S{PREFIX_LENGTH}")[
+        :, 0
+    ]
+    return {
+        "valid": valid,
+        "prefix": np.where(valid, prefixes, b""),
+        "establishment": np.where(valid, _digits_value(codes[:, ESTABLISHMENT]), 0),
+        "number": np.where(valid, _digits_value(codes[:, NUMBER]), 0),
+        "year": np.where(valid, _digits_value(codes[:, YEAR]), 0),
+    }
+
+
+# Function to read the establishment numbers of a complex code such as
+# "1010261@15,16@N"; the part before the first "@" is the complex itself
+def complex_establishments(court_code):
+    parts = court_code.split("@")
+    if len(parts) < 2:
+        return []
+    return [int(number) for number in parts[1].split(",") if number.strip().isdigit()]
+
+
+# Maps CNR prefixes (state and district letters plus establishment number) to the
+# state_code, dist_code, court_complex_code and court_code the portal expects.
+# The letters of a district are learned from the CNRs already in the CNR table; every
+# establishment of that district is then taken from the Courts table, so CNRs of
+# establishments never crawled still resolve. The index is kept in CnrPrefixes and
+# looked up for whole arrays of CNRs with a binary search.
+class PrefixIndex:
+    def __init__(self, prefixes, params):
+        order = np.argsort(prefixes)
+        self.prefixes = np.asarray(prefixes, dtype=f"S{PREFIX_LENGTH}")[order]
+        self.params = [params[i] for i in order]
+
+    # Builds the index from the CNR and Courts tables
+    @classmethod
+    def build(cls, connection):
+        # (letters) -> most common (state_code, district_code) among known CNRs
+        districts = {}
+        # prefix -> most common (state, district, complex, court) among known CNRs
+        seen = {}
+        rows = connection.execute("""
+            SELECT substr(cnr_number, 1, 6), state_code, district_code, court_code,
+                COUNT(*)
+            FROM CNR
+            WHERE length(cnr_number) = 16
+            GROUP BY 1, 2, 3, 4
+            """)
+        district_votes = {}
+        prefix_votes = {}
+        for prefix, state_code, district_code, court_code, count in rows:
+            prefix = prefix.upper()
+            district_votes.setdefault(prefix[:4], Counter())[
+                (state_code, district_code)
+            ] += count
+            establishment = prefix[4:]
+            if establishment.isdigit():
+                prefix_votes.setdefault(prefix, Counter())[
+                    (
+                        state_code,
+                        district_code,
+                        court_code.split("@")[0],
+                        str(int(establishment)),
+                    )
+                ] += count
+        for letters, votes in district_votes.items():
+            districts[letters] = votes.most_common(1)[0][0]
+        for prefix, votes in prefix_votes.items():
+            seen[prefix] = votes.most_common(1)[0][0]
+
+        # (state_code, district_code) -> {establishment number: complex code}
+        complexes = {}
+        for state_code, district_code, court_code in connection.execute(
+            "SELECT DISTINCT state_code, district_code, court_code FROM Courts"
+        ):
+            for establishment in complex_establishments(court_code):
+                complexes.setdefault((state_code, district_code), {})[establishment] = (
+                    court_code.split("@")[0]
+                )
+
+        index = dict(seen)
+        for letters, (state_code, district_code) in districts.items():
+            for establishment, complex_code in complexes.get(
+                (state_code, district_code), {}
+            ).items():
+                if establishment > 99:
+                    continue
+                index[f"{letters}{establishment:02d}"] = (
+                    state_code,
+                    district_code,
+                    complex_code,
+                    str(establishment),
+                )
+        return cls([prefix.encode("ascii") for prefix in index], list(index.values()))
+
+    @classmethod
+    def load(cls, connection):
+        rows = connection.execute(
+            "SELECT prefix, state_code, district_code, court_complex_code, court_code "
+            "FROM CnrPrefixes"
+        ).fetchall()
+        return cls([row[0].encode("ascii") for row in rows], [row[1:] for row in rows])
+
+    def save(self, connection):
+        with connection:
+            connection.execute("DELETE FROM CnrPrefixes")
+            connection.executemany(
+                "INSERT INTO CnrPrefixes VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    (prefix.decode("ascii"),) + tuple(params) + (time.time(),)
+                    for prefix, params in zip(self.prefixes, self.params)
+                ),
+            )
+
+    def __len__(self):
+        return len(self.prefixes)
+
+    # Returns, for every CNR, the position of its parameters in self.params, or
+    # NO_COURT when the CNR is invalid or its prefix is unknown
+    def lookup(self, cnrs):
+        decoded = decode_cnrs(cnrs)
+        if not len(self.prefixes):
+            return np.full(len(decoded["valid"]), NO_COURT)
+        positions = np.searchsorted(self.prefixes, decoded["prefix"])
+        positions = positions.clip(0, len(self.prefixes) - 1)
+        found = decoded["valid"] & (self.prefixes[positions] == decoded["prefix"])
+        return np.where(found, positions, NO_COURT)
+
+    # Function to yield (cnr, state_code, district_code, court_complex_code,
+    # court_code) for every CNR that resolves; the others are counted in `unresolved`
+    def resolve(self, cnrs, unresolved=None):
+        cnrs = list(cnrs)
+        for cnr, position in zip(cnrs, self.lookup(cnrs)):
+            if position == NO_COURT:
+                if unresolved is not None:
+                    unresolved[0] += 1
+                continue
+            yield (cnr.strip().upper(),) + tuple(self.params[position])
+
+
+# Function to read the highest rowid of every table the prefix index is built from
+def _source_marks(connection):
+    return {
+        table: connection.execute(
+            f"SELECT COALESCE(MAX(rowid), 0) FROM {table}"
+        ).fetchone()[0]
+        for table in PREFIX_INDEX_SOURCES
+    }
+
+
+# Function to load the saved prefix index, building and saving it when it is empty,
+# `rebuild` is set or the CNR or Courts table gained rows since it was built
+def get_prefix_index(connection, rebuild=False):
+    marks = _source_marks(connection)
+    current = all(
+        fetch_processing_state(connection, f"cnr_prefix_index:{table}")
+        == (PREFIX_INDEX_VERSION, mark)
+        for table, mark in marks.items()
+    )
+    index = PrefixIndex.load(connection) if current and not rebuild else None
+    if index is None or not len(index):
+        index = PrefixIndex.build(connection)
+        index.save(connection)
+        for table, mark in marks.items():
+            save_processing_state(
+                connection, f"cnr_prefix_index:{table}", PREFIX_INDEX_VERSION, mark
+            )
+        logging.info(f"Built the CNR prefix index: {len(index)} prefixes.")
+    return index
+
+
+def main(rebuild=True):
+    connection = create_connection(DB_FILE)
+    migrate(connection)
+    index = get_prefix_index(connection, rebuild=rebuild)
+    print(f"CNR prefix index: {len(index)} establishment prefixes.")
+
+    cnrs = [row[0] for row in connection.execute("SELECT DISTINCT cnr_number FROM CNR")]
+    started = time.perf_counter()
+    positions = index.lookup(cnrs)
+    elapsed = time.perf_counter() - started
+    resolved = int((positions != NO_COURT).sum())
+    print(
+        f"Resolved {resolved} of {len(cnrs)} CNR numbers in the CNR table "
+        f"({elapsed * 1000:.0f} ms)."
+    )
+    connection.close()
+
+
+if __name__ == "__main__":
+    # Configure logging
+    logging.basicConfig(
+        filename="court_navigator.log",  # Log to this file
+        level=logging.INFO,  # Log all INFO level and above
+        format="%(asctime)s - %(levelname)s - %(message)s",  # Include timestamp
+    )
+    parser = argparse.ArgumentParser(
+        description="Build the CNR prefix index and check how many CNRs it resolves."
+    )
+    parser.add_argument(
+        "--keep",
+        action="store_true",
+        help="Use the saved index instead of rebuilding it.",
+    )
+    args = parser.parse_args()
+    main(rebuild=not args.keep)
@@ -0,0 +1,307 @@
+import logging
+from html.parser import HTMLParser
+
+from bs4 import BeautifulSoup
+
+try:
+    import lxml.etree
+    import lxml.html
+except ImportError:  # lxml is optional, the "lxml" engine falls back to "stream"
+    lxml = None
+
+# Engines that turn a COURTS_HTML page into [case_type_number_year,
+# petitioner_vs_respondent, CNR...] rows:
+#   bs4    - the original BeautifulSoup prettify/reparse parser, kept as the reference
+#   lxml   - lxml tree, no prettify round trip
+#   stream - single pass over the html.parser tokenizer, builds nothing outside <table>
+# The fast engines reproduce the text the reference reads after prettify() and the
+# reparse. "stream" follows the same html.parser tree building and returns identical
+# rows; lxml repairs malformed markup its own way (an unclosed <td> is closed at the
+# next <td> instead of nesting it), so on such pages its rows can differ and it is
+# only used when asked for.
+ENGINES = ("bs4", "lxml", "stream")
+DEFAULT_ENGINE = "stream"
+
+# Same void elements as BeautifulSoup's HTMLTreeBuilder
+_VOID_TAGS = {
+    "area",
+    "base",
+    "br",
+    "col",
+    "embed",
+    "hr",
+    "img",
+    "input",
+    "keygen",
+    "link",
+    "menuitem",
+    "meta",
+    "param",
+    "source",
+    "track",
+    "wbr",
+    "basefont",
+    "bgsound",
+    "command",
+    "frame",
+    "image",
+    "isindex",
+    "nextid",
+    "spacer",
+}
+# prettify() leaves the content of these alone; pages using them go to the bs4 engine
+_RAW_TAGS = {"pre", "textarea", "script", "style", "template"}
+_ASCII_SPACES = "\x20\x0a\x09\x0c\x0d"
+
+
+class _Fallback(Exception):
+    pass
+
+
+# Minimal element used by the fast engines; children are _Node, str (text) or
+# None (a comment, which only separates text)
+class _Node:
+    __slots__ = ("tag", "attrs", "children")
+
+    def __init__(self, tag, attrs):
+        self.tag = tag
+        self.attrs = attrs
+        self.children = []
+
+
+# Function to extract CNR rows with the chosen engine
+def extract_cnr(html_content, engine=DEFAULT_ENGINE):
+    if engine == "bs4":
+        return extract_bs4(html_content)
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown extractor engine '{engine}', pick one of {ENGINES}")
+    try:
+        if engine == "lxml" and lxml is not None:
+            tables = _lxml_tables(html_content)
+        else:
+            tables = _stream_tables(html_content)
+        return _rows_from_tables(tables)
+    except _Fallback:
+        logging.info("Page uses raw-text tags, parsing it with the bs4 engine.")
+        return extract_bs4(html_content)
+
+
+# Reference engine: the original parse_html_files without the debug prints
+def extract_bs4(html_content):
+    all_CNR_2 = []
+    soup = BeautifulSoup(html_content, "html.parser")
+
+    # Find all "table" tags
+    for each_table in soup.find_all("table"):
+        pretty_table = each_table.prettify()
+
+        # Re-parse the pretty table to search for specific elements
+        soup_doc = BeautifulSoup(pretty_table, "html.parser")
+
+        for row in soup_doc.find_all("tr"):
+            all_CNR = []
+            columns = row.find_all("td")  # This will give you a list of columns
+            if not columns:
+                # This will give you a list of columns from headers
+                columns = row.find_all("th")
+            if len(columns) >= 3:
+                case_type_number_year = columns[1].text.strip()
+                petitioner_vs_respondent = (
+                    columns[2].text.replace("<br/>", " ").replace("Vs", " Vs ").strip()
+                )
+                all_CNR.append(case_type_number_year)
+                all_CNR.append(petitioner_vs_respondent)
+
+                # Find all elements with class "someclass"
+                elements_with_someclass = columns[3].find_all("a", class_="someclass")
+
+                if not elements_with_someclass:
+                    all_CNR.append("E004: No CNR found")
+
+                for element in elements_with_someclass:
+                    onclick_value = element.get("onclick")
+
+                    # Extract the CNR number from the onclick attribute
+                    data_values = onclick_value.split("'")[1:-1]
+                    all_CNR.append(data_values[0])
+
+                all_CNR_2.append(all_CNR)
+
+    return all_CNR_2
+
+
+# Function to apply the reference row logic to _Node tables. Errors on malformed rows
+# (a 3 column row, an anchor without onclick) are raised exactly like the reference.
+def _rows_from_tables(tables):
+    all_CNR_2 = []
+    for table in tables:
+        for row, row_depth in _find_all(table, "tr", 0):
+            columns = list(_find_all(row, "td", row_depth))
+            if not columns:
+                columns = list(_find_all(row, "th", row_depth))
+            if len(columns) >= 3:
+                all_CNR = [
+                    _pretty_text(*columns[1]).strip(),
+                    _pretty_text(*columns[2])
+                    .replace("<br/>", " ")
+                    .replace("Vs", " Vs ")
+                    .strip(),
+                ]
+                anchors = [
+                    anchor
+                    for anchor, _ in _find_all(columns[3][0], "a", 0)
+                    if _has_class(anchor, "someclass")
+                ]
+                if not anchors:
+                    all_CNR.append("E004: No CNR found")
+                for anchor in anchors:
+                    onclick_value = anchor.attrs.get("onclick")
+                    data_values = onclick_value.split("'")[1:-1]
+                    all_CNR.append(data_values[0])
+                all_CNR_2.append(all_CNR)
+    return all_CNR_2
+
+
+# Function to yield (descendant, depth) pairs with the given tag in document order,
+# like BeautifulSoup's recursive find_all
+def _find_all(node, tag, depth):
+    for child in node.children:
+        if isinstance(child, _Node):
+            if child.tag == tag:
+                yield child, depth + 1
+            yield from _find_all(child, tag, depth + 1)
+
+
+def _has_class(node, class_name):
+    value = node.attrs.get("class")
+    return value is not None and (value == class_name or class_name in value.split())
+
+
+# Function to compute node.text as the reference sees it: prettify() puts every tag and
+# every stripped string on its own line indented one space per level, and the reparse
+# turns whitespace-only runs between tags into a single "\n"
+def _pretty_text(node, depth):
+    chunks = []
+    current = ["\n"]
+
+    def close_chunk(indent):
+        current.append(" " * indent)
+        chunks.append("".join(current))
+        current[:] = ["\n"]
+
+    def walk(parent, indent):
+        for child in parent.children:
+            if child is None:
+                close_chunk(indent)
+            elif isinstance(child, str):
+                text = child.strip()
+                if text:
+                    current.append(" " * indent + text + "\n")
+            else:
+                close_chunk(indent)
+                if child.tag not in _VOID_TAGS:
+                    walk(child, indent + 1)
+                    close_chunk(indent)
+
+    walk(node, depth + 1)
+    current.append(" " * depth)
+    chunks.append("".join(current))
+    return "".join(
+        "\n" if not chunk.strip(_ASCII_SPACES) else chunk for chunk in chunks
+    )
+
+
+# Tokenizer that builds _Node trees for <table> elements only, following the
+# html.parser tree builder of BeautifulSoup: void tags never nest, an end tag closes
+# the nearest open tag of the same name and is ignored when none is open
+class _TableStreamParser(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.tables = []
+        self.stack = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag in _RAW_TAGS:
+            raise _Fallback()
+        if not self.stack and tag != "table":
+            return
+        node = _Node(tag, {name: value or "" for name, value in attrs})
+        if self.stack:
+            self._append(node)
+        else:
+            self.tables.append(node)
+        if tag not in _VOID_TAGS:
+            self.stack.append(node)
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in _VOID_TAGS and self.stack and self.stack[-1].tag == tag:
+            self.stack.pop()
+
+    def handle_endtag(self, tag):
+        for index in range(len(self.stack) - 1, -1, -1):
+            if self.stack[index].tag == tag:
+                del self.stack[index:]
+                return
+
+    def handle_data(self, data):
+        if self.stack:
+            self._append(data)
+
+    def handle_comment(self, data):
+        if self.stack:
+            self.stack[-1].children.append(None)
+
+    def _append(self, item):
+        children = self.stack[-1].children
+        # Adjacent strings are one string for BeautifulSoup
+        if isinstance(item, str) and children and isinstance(children[-1], str):
+            children[-1] += item
+        else:
+            children.append(item)
+
+
+def _stream_tables(html_content):
+    parser = _TableStreamParser()
+    parser.feed(html_content)
+    parser.close()
+    return _nested_tables(parser.tables)
+
+
+# Function to list every table, nested ones included, in document order; the
+# reference processes a nested table both as part of its parent and on its own
+def _nested_tables(roots):
+    tables = []
+    for root in roots:
+        tables.append(root)
+        tables.extend(table for table, _ in _find_all(root, "table", 0))
+    return tables
+
+
+def _lxml_tables(html_content):
+    document = lxml.html.document_fromstring(html_content)
+    roots = []
+    for element in document.iter("table"):
+        if not any(ancestor.tag == "table" for ancestor in element.iterancestors()):
+            roots.append(_from_lxml(element))
+    return _nested_tables(roots)
+
+
+# Function to convert an lxml element into a _Node tree
+def _from_lxml(element):
+    if element.tag in _RAW_TAGS:
+        raise _Fallback()
+    node = _Node(element.tag, dict(element.attrib))
+    if element.text:
+        node.children.append(element.text)
+    for child in element:
+        if child.tag is lxml.etree.Comment:
+            node.children.append(None)
+        elif isinstance(child.tag, str):
+            node.children.append(_from_lxml(child))
+        if child.tail:
+            if node.children and isinstance(node.children[-1], str):
+                node.children[-1] += child.tail
+            else:
+                node.children.append(child.tail)
+    return node
@@ -1,107 +1,236 @@
+import argparse
+import json
+import logging
+import os
 import sqlite3
+import time
 from sqlite3 import Error
 
+from html_store import decompress_html, html_blob_row, html_hash
+from migrations import apply_pragmas, migrate
+
+DB_FILE = "jd-master-db.db"
+NO_ESTABLISHMENT = "E003: No court establishment found"
+
+# Parameterized upserts shared by the save_* helpers and the BatchWriter (db_writer.py).
+# The conflict targets are the unique keys created by migration 3 (migrations.py):
+# master data is refreshed in place, pages are written once and CNR rows are tagged
+# with the page and parser version that last produced them.
+INSERT_STATE_SQL = """
+    INSERT INTO States (state_name, state_code) VALUES (?, ?)
+    ON CONFLICT (state_code) DO UPDATE SET state_name = excluded.state_name
+    """
+INSERT_DISTRICT_SQL = """
+    INSERT INTO Districts (state_code, district_name, district_code) VALUES (?, ?, ?)
+    ON CONFLICT (state_code, district_code)
+    DO UPDATE SET district_name = excluded.district_name
+    """
+INSERT_HTML_SQL = """
+    INSERT INTO COURTS_HTML(date_scraped, state_code, district_code, court_code, establishment_code, act_code, case_status, html_content, html_hash, section_number)
+    VALUES (?, ?, ?, ?, ?, ?, ?, '', ?, ?)
+    ON CONFLICT DO NOTHING
+    """
+# A page stored for the same query with different content is replaced: its row, its
+# parse jobs (keyed "<page id>:v<parser version>") and the CNR rows parsed from it are
+# deleted before the new row is inserted. The new row gets a new id, so process_html
+# parses it on its next run.
+_REPLACED_HTML_WHERE = """
+    state_code = ? AND district_code = ? AND court_code = ? AND establishment_code = ?
+    AND act_code = ? AND section_number = ? AND case_status = ? AND html_hash IS NOT ?
+    """
+DELETE_REPLACED_CNR_SQL = f"""
+    DELETE FROM CNR WHERE page_id IN (SELECT id FROM COURTS_HTML WHERE {_REPLACED_HTML_WHERE})
+    """
+DELETE_REPLACED_PARSE_JOBS_SQL = f"""
+    DELETE FROM Jobs WHERE stage = 'parse' AND CAST(job_key AS INTEGER) IN (
+        SELECT id FROM COURTS_HTML WHERE {_REPLACED_HTML_WHERE}
+    )
+    """
+DELETE_REPLACED_HTML_SQL = f"DELETE FROM COURTS_HTML WHERE {_REPLACED_HTML_WHERE}"
+# Parse jobs of pages that no longer exist, e.g. replaced before this was cleaned up
+DELETE_ORPHAN_PARSE_JOBS_SQL = """
+    DELETE FROM Jobs
+    WHERE stage = 'parse' AND CAST(job_key AS INTEGER) NOT IN (SELECT id FROM COURTS_HTML)
+    """
+# Pages stored when the portal answered nothing usable; they do not count as stored,
+# so the query is submitted again and the page replaced
+RETRY_PAGES = ("", "E006: No Records found")
+# Identical pages (e.g. every "No Records found" page) share one blob
+INSERT_HTML_BLOB_SQL = """
+    INSERT INTO HtmlBlobs (hash, codec, size, content) VALUES (?, ?, ?, ?)
+    ON CONFLICT (hash) DO NOTHING
+    """
+# COURTS_HTML rows as they looked before migration 5 (html_content holding the page
+# text, section_number last) plus the blob of the page, resolved by _court_page_row
+COURT_PAGE_SELECT = """
+    SELECT c.id, c.date_scraped, c.state_code, c.district_code, c.court_code,
+        c.establishment_code, c.act_code, c.case_status, c.html_content,
+        c.section_number, b.codec, b.content
+    FROM COURTS_HTML c LEFT JOIN HtmlBlobs b ON b.hash = c.html_hash
+    """
+INSERT_COURT_SQL = """
+    INSERT INTO Courts (date_scraped, state_code, district_code, court_code, court_name, establishment_code, establishment_name)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (state_code, district_code, court_code, establishment_code)
+    DO UPDATE SET date_scraped = excluded.date_scraped, court_name = excluded.court_name,
+        establishment_name = excluded.establishment_name
+    """
+INSERT_ACT_SQL = """
+    INSERT INTO Acts (date_scraped, state_code, district_code, court_code, establishment_code, act_code, act_name)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (state_code, district_code, court_code, establishment_code, act_code)
+    DO UPDATE SET date_scraped = excluded.date_scraped, act_name = excluded.act_name
+    """
+INSERT_CNR_SQL = """
+    INSERT INTO CNR (date_processed, date_scraped, state_code, district_code, court_code, est_code, act_code, section_number, case_status, case_type_number_year, petitioner_responder, cnr_number, page_id, parser_version)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (state_code, district_code, court_code, est_code, act_code, section_number, case_status, case_type_number_year, cnr_number)
+    DO UPDATE SET date_processed = excluded.date_processed, page_id = excluded.page_id,
+        parser_version = excluded.parser_version
+    """
+DELETE_STALE_CNR_SQL = "DELETE FROM CNR WHERE page_id = ? AND parser_version < ?"
+INSERT_CASE_HISTORY_SQL = """
+    INSERT INTO CaseHistories (cnr_number, date_scraped, html_hash, error) VALUES (?, ?, ?, ?)
+    ON CONFLICT (cnr_number) DO UPDATE SET date_scraped = excluded.date_scraped,
+        html_hash = excluded.html_hash, error = excluded.error
+    """
+# One CNR table row per CNR number still without a stored case history, in CNR order
+# from `cnr_number > ?`; the NOT EXISTS check is a primary key lookup in CaseHistories.
+# Placeholders such as "E004: No CNR found" are not 16 characters long and left out.
+PENDING_CNR_SELECT = """
+    SELECT c.cnr_number, c.state_code, c.district_code, c.court_code, c.est_code
+    FROM CNR c
+    WHERE c.cnr_number > ? AND length(c.cnr_number) = 16 AND NOT EXISTS (
+        SELECT 1 FROM CaseHistories h
+        WHERE h.cnr_number = c.cnr_number AND h.html_hash IS NOT NULL
+    )
+    GROUP BY c.cnr_number ORDER BY c.cnr_number LIMIT ?
+    """
+# Stored case histories that were not parsed yet, were parsed by an older parser
+# version or were fetched again since, in CNR order from `cnr_number > ?`
+UNPARSED_HISTORY_SELECT = """
+    SELECT h.cnr_number FROM CaseHistories h
+    LEFT JOIN CaseHeaders c ON c.cnr_number = h.cnr_number
+    WHERE h.cnr_number > ? AND h.html_hash IS NOT NULL
+      AND (c.cnr_number IS NULL OR c.parser_version < ? OR c.html_hash != h.html_hash)
+    ORDER BY h.cnr_number LIMIT ?
+    """
+# Columns of CaseHeaders (migration 10) after its bookkeeping columns, in table order;
+# case_history_parser.py maps the labels of the case page onto them
+HEADER_COLUMNS = [
+    "case_type",
+    "filing_number",
+    "filing_date",
+    "registration_number",
+    "registration_date",
+    "first_hearing_date",
+    "next_hearing_date",
+    "decision_date",
+    "case_status",
+    "stage_of_case",
+    "nature_of_disposal",
+    "court_and_judge",
+]
+# CaseHeaders columns stored as ISO dates
+DATE_COLUMNS = {
+    "filing_date",
+    "registration_date",
+    "first_hearing_date",
+    "next_hearing_date",
+    "decision_date",
+}
+INSERT_CASE_HEADER_SQL = f"""
+    INSERT OR REPLACE INTO CaseHeaders (cnr_number, html_hash, parser_version, date_processed, {", ".join(HEADER_COLUMNS)})
+    VALUES ({", ".join("?" * (4 + len(HEADER_COLUMNS)))})
+    """
+INSERT_CASE_PARTY_SQL = """
+    INSERT INTO CaseParties (cnr_number, role, position, name, advocate) VALUES (?, ?, ?, ?, ?)
+    """
+INSERT_CASE_ACT_SQL = "INSERT INTO CaseActs (cnr_number, act, section) VALUES (?, ?, ?)"
+INSERT_CASE_SECTION_SQL = """
+    INSERT OR IGNORE INTO CaseSections (cnr_number, section_number) VALUES (?, ?)
+    """
+INSERT_CASE_HEARING_SQL = """
+    INSERT INTO CaseHearings (cnr_number, position, judge, business_date, hearing_date, purpose)
+    VALUES (?, ?, ?, ?, ?, ?)
+    """
+# Rows of an earlier parse of a case, dropped before it is stored again
+DELETE_CASE_ROWS_SQL = [
+    "DELETE FROM CaseParties WHERE cnr_number = ?",
+    "DELETE FROM CaseActs WHERE cnr_number = ?",
+    "DELETE FROM CaseHearings WHERE cnr_number = ?",
+    "DELETE FROM CaseSections WHERE cnr_number = ?",
+]
+INSERT_CAPTCHA_ATTEMPT_SQL = """
+    INSERT INTO CaptchaAttempts (attempted_at, state_code, district_code, court_code, establishment_code, attempt, answer, confidence, accepted)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """
+INSERT_DROPDOWN_SQL = """
+    INSERT INTO DropdownSnapshots (dropdown, state_code, district_code, court_complex_code, options, captured_at)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT (dropdown, state_code, district_code, court_complex_code)
+    DO UPDATE SET options = excluded.options, captured_at = excluded.captured_at
+    """
+
+
+# Function to insert one row, either directly (one commit per row) or through a
+# BatchWriter that commits many rows per transaction
+def _insert_row(connection, insert_sql, row, writer=None):
+    if writer is not None:
+        writer.put(insert_sql, row)
+        return
+    cursor = connection.cursor()
+    cursor.execute(insert_sql, row)
+    connection.commit()
+
+
+# Function to insert many rows with executemany in one transaction, or through a BatchWriter
+def _insert_rows(connection, insert_sql, rows, writer=None):
+    if writer is not None:
+        writer.put_many(insert_sql, rows)
+        return
+    with connection:
+        connection.executemany(insert_sql, rows)
+
 
 # Function to create a connection to the SQLite database
 def create_connection(db_file):
     connection = None
     try:
-        connection = sqlite3.connect(db_file)
+        connection = sqlite3.connect(db_file, timeout=30)
+        apply_pragmas(connection)
         print(f"Connected to SQLite database: {db_file}")
     except Error as e:
         print(f"Error connecting to SQLite: {e}")
     return connection
 
 
-# Function to create a table
-def create_table(connection):
-    create_table_sql = """
-    CREATE TABLE IF NOT EXISTS States (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        state_name TEXT NOT NULL,
-        state_code TEXT NOT NULL
-    )
-    """
-    try:
-        cursor = connection.cursor()
-        cursor.execute(create_table_sql)
-        connection.commit()
-        print("Table 'States' created successfully.")
-    except Error as e:
-        print(f"Error creating table: {e}")
+# Function to open a script's database, creating it when missing, and bring its schema
+# up to date; returns None when the connection fails
+def setup_db(db_file=DB_FILE):
+    if not os.path.exists(db_file):
+        print("Database file does not exist.")
+        logging.error("Database file does not exist.")
+    connection = create_connection(db_file)
+    if not connection:
+        return None
+    # create or upgrade the tables
+    migrate(connection)
+    logging.info("Connection to SQLite database established and schema up to date.")
+    return connection
 
 
-def create_district_table(connection):
-    print("Creating district table from here")
-    create_table_sql = """
-        CREATE TABLE IF NOT EXISTS Districts (
-            state_code TEXT NOT NULL,
-            district_name TEXT NOT NULL,
-            district_code TEXT NOT NULL
-        )
-        """
-    try:
-        cursor = connection.cursor()
-        cursor.execute(create_table_sql)
-        connection.commit()
-        print("Table created successfully.")
-    except Error as e:
-        print(f"Error creating table: {e}")
-
-
-# Function to create the HTML storage table
-def create_html_table(connection):
-    create_table_sql = """
-    CREATE TABLE IF NOT EXISTS COURTS_HTML (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        date_scraped TEXT NOT NULL,
-        state_code TEXT NOT NULL,
-        district_code TEXT NOT NULL,
-        court_code TEXT NOT NULL,
-        establishment_code TEXT NOT NULL,
-        act_code TEXT NOT NULL,
-        case_status TEXT NOT NULL,
-        html_content TEXT NOT NULL
-    )
-    """
-    try:
-        cursor = connection.cursor()
-        cursor.execute(create_table_sql)
-        connection.commit()
-        print("Table 'COURTS_HTML' created successfully.")
-    except Error as e:
-        print(f"Error creating table: {e}")
-
-
-# Function to create the HTML storage table
-def create_cnr_table(connection):
-    create_table_sql = """
-    CREATE TABLE IF NOT EXISTS CNR (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        date_processed TEXT NOT NULL,
-        date_scraped TEXT NOT NULL,
-        state_code TEXT NOT NULL,
-        district_code TEXT NOT NULL,
-        court_code TEXT NOT NULL,
-        est_code TEXT NOT NULL,
-        act_code TEXT NOT NULL,
-        section_number TEXT NOT NULL,
-        case_status TEXT NOT NULL,
-        case_type_number_year TEXT NOT NULL,
-        petitioner_responder TEXT NOT NULL, 
-        cnr_number TEXT NOT NULL
-    )
-    """
-    try:
-        cursor = connection.cursor()
-        cursor.execute(create_table_sql)
-        connection.commit()
-        print("Table 'CNR' created successfully.")
-    except Error as e:
-        print(f"Error creating table: {e}")
+# Function to turn a COURT_PAGE_SELECT row into a COURTS_HTML row with the page text in
+# html_content, whether the page is stored compressed or (legacy rows) as text
+def _court_page_row(row):
+    codec, content = row[10], row[11]
+    if codec is None:
+        return row[:10]
+    return row[:8] + (decompress_html(codec, content), row[9])
 
 
-# Function to save to the HTML storage table
+# Function to save to the HTML storage table. The page is stored compressed in
+# HtmlBlobs and the COURTS_HTML row references it by hash.
 def save_html_to_db(
     connection,
     date_scraped,
@@ -112,15 +241,28 @@ def save_html_to_db(
     act_code,
     case_status,
     html_content,
+    section_number="302",
+    writer=None,
 ):
-    insert_sql = """
-    INSERT INTO COURTS_HTML(date_scraped, state_code, district_code, court_code, establishment_code, act_code, case_status, html_content)
-    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-    """
     try:
-        cursor = connection.cursor()
-        cursor.execute(
-            insert_sql,
+        blob_row = html_blob_row(html_content)
+        _insert_row(connection, INSERT_HTML_BLOB_SQL, blob_row, writer)
+        replaced_key = (
+            state_code,
+            district_code,
+            court_code,
+            establishment_code,
+            act_code,
+            section_number,
+            case_status,
+            blob_row[0],
+        )
+        _insert_row(connection, DELETE_REPLACED_CNR_SQL, replaced_key, writer)
+        _insert_row(connection, DELETE_REPLACED_PARSE_JOBS_SQL, replaced_key, writer)
+        _insert_row(connection, DELETE_REPLACED_HTML_SQL, replaced_key, writer)
+        _insert_row(
+            connection,
+            INSERT_HTML_SQL,
             (
                 date_scraped,
                 state_code,
@@ -129,61 +271,16 @@ def save_html_to_db(
                 establishment_code,
                 act_code,
                 case_status,
-                html_content,
+                blob_row[0],
+                section_number,
             ),
+            writer,
         )
-        connection.commit()
         print(f"HTML content saved successfully.")
     except Error as e:
         print(f"Error saving HTML content to database: {e}")
 
 
-# Function to create the HTML storage table
-def create_court_table(connection):
-    create_table_sql = """
-    CREATE TABLE IF NOT EXISTS Courts (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        date_scraped TEXT NOT NULL,
-        state_code TEXT NOT NULL,
-        district_code TEXT NOT NULL,
-        court_code TEXT NOT NULL,
-        court_name TEXT NOT NULL,
-        establishment_code TEXT,
-        establishment_name TEXT
-    )
-    """
-    try:
-        cursor = connection.cursor()
-        cursor.execute(create_table_sql)
-        connection.commit()
-        print("Table 'Courts' created successfully.")
-    except Error as e:
-        print(f"Error creating table: {e}")
-
-
-# Function to create the HTML storage table
-def create_act_table(connection):
-    create_table_sql = """
-    CREATE TABLE IF NOT EXISTS Acts (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        date_scraped TEXT NOT NULL,
-        state_code TEXT NOT NULL,
-        district_code TEXT NOT NULL,
-        court_code TEXT NOT NULL,
-        establishment_code TEXT,
-        act_code TEXT NOT NULL,
-        act_name TEXT NOT NULL
-    )
-    """
-    try:
-        cursor = connection.cursor()
-        cursor.execute(create_table_sql)
-        connection.commit()
-        print("Table 'Acts' created successfully.")
-    except Error as e:
-        print(f"Error creating table: {e}")
-
-
 # Function to save to the HTML storage table
 def save_codes_to_db(
     connection,
@@ -194,15 +291,12 @@ def save_codes_to_db(
     court_name,
     establishment_code,
     establishment_name,
+    writer=None,
 ):
-    insert_sql = """
-    INSERT INTO Courts (date_scraped, state_code, district_code, court_code, court_name, establishment_code, establishment_name)
-    VALUES (?, ?, ?, ?, ?, ?, ?)
-    """
     try:
-        cursor = connection.cursor()
-        cursor.execute(
-            insert_sql,
+        _insert_row(
+            connection,
+            INSERT_COURT_SQL,
             (
                 date_scraped,
                 state_code,
@@ -212,13 +306,41 @@ def save_codes_to_db(
                 establishment_code,
                 establishment_name,
             ),
+            writer,
         )
-        connection.commit()
         print(f"Court details saved successfully.")
     except Error as e:
         print(f"Error saving Court details to database: {e}")
 
 
+# Function to save one Courts row per (text, value) option of a court complex's
+# establishment dropdown, or the E003 marker row when the complex has none
+def save_establishments_to_db(
+    connection,
+    date_scraped,
+    state_code,
+    district_code,
+    court_code,
+    court_name,
+    est_options,
+    writer=None,
+):
+    if not est_options:
+        est_options = [(NO_ESTABLISHMENT, NO_ESTABLISHMENT)]
+    for est_name, est_code in est_options:
+        save_codes_to_db(
+            connection,
+            date_scraped,
+            state_code,
+            district_code,
+            court_code,
+            court_name,
+            est_code,
+            est_name,
+            writer=writer,
+        )
+
+
 # Function to save to the HTML storage table
 def save_acts_to_db(
     connection,
@@ -229,15 +351,12 @@ def save_acts_to_db(
     establishment_code,
     act_code,
     act_name,
+    writer=None,
 ):
-    insert_sql = """
-    INSERT INTO Acts (date_scraped, state_code, district_code, court_code, establishment_code, act_code, act_name)
-    VALUES (?, ?, ?, ?, ?, ?, ?)
-    """
     try:
-        cursor = connection.cursor()
-        cursor.execute(
-            insert_sql,
+        _insert_row(
+            connection,
+            INSERT_ACT_SQL,
             (
                 date_scraped,
                 state_code,
@@ -247,13 +366,82 @@ def save_acts_to_db(
                 act_code,
                 act_name,
             ),
+            writer,
         )
-        connection.commit()
         print(f"Act details saved successfully.")
     except Error as e:
         print(f"Error saving Court details to database: {e}")
 
 
+# Function to save one extracted CNR row (the 14 columns of INSERT_CNR_SQL)
+def save_cnr_to_db(connection, cnr_row, writer=None):
+    try:
+        _insert_row(connection, INSERT_CNR_SQL, cnr_row, writer)
+    except Error as e:
+        print(f"Error saving CNR details to database: {e}")
+
+
+# Function to drop the CNR rows an older parser version extracted from a page
+def delete_stale_cnr_rows(connection, page_id, parser_version, writer=None):
+    try:
+        _insert_row(connection, DELETE_STALE_CNR_SQL, (page_id, parser_version), writer)
+    except Error as e:
+        print(f"Error deleting stale CNR rows: {e}")
+
+
+# Function to delete the parse jobs whose COURTS_HTML row is gone; returns their number
+def delete_orphan_parse_jobs(connection):
+    try:
+        with connection:
+            return connection.execute(DELETE_ORPHAN_PARSE_JOBS_SQL).rowcount
+    except Error as e:
+        print(f"Error deleting orphan parse jobs: {e}")
+        return 0
+
+
+# Function to read (parser_version, high_water_id) of a processor, or None on first run
+def fetch_processing_state(connection, processor):
+    query_sql = """
+    SELECT parser_version, high_water_id FROM ProcessingState WHERE processor = ?
+    """
+    return connection.execute(query_sql, (processor,)).fetchone()
+
+
+# Function to store the high-water mark of a processor
+def save_processing_state(connection, processor, parser_version, high_water_id):
+    upsert_sql = """
+    INSERT INTO ProcessingState (processor, parser_version, high_water_id, updated_at)
+    VALUES (?, ?, ?, datetime('now'))
+    ON CONFLICT (processor) DO UPDATE SET
+        parser_version = excluded.parser_version,
+        high_water_id = excluded.high_water_id,
+        updated_at = excluded.updated_at
+    """
+    try:
+        with connection:
+            connection.execute(upsert_sql, (processor, parser_version, high_water_id))
+    except Error as e:
+        print(f"Error saving processing state: {e}")
+
+
+# Function to save (state_name, state_code) rows to the States table
+def save_states_to_db(connection, state_rows, writer=None):
+    try:
+        _insert_rows(connection, INSERT_STATE_SQL, state_rows, writer)
+        print(f"{len(state_rows)} states saved successfully.")
+    except Error as e:
+        print(f"Error saving States to database: {e}")
+
+
+# Function to save (state_code, district_name, district_code) rows to the Districts table
+def save_districts_to_db(connection, district_rows, writer=None):
+    try:
+        _insert_rows(connection, INSERT_DISTRICT_SQL, district_rows, writer)
+        print(f"{len(district_rows)} districts saved successfully.")
+    except Error as e:
+        print(f"Error saving Districts to database: {e}")
+
+
 # Function to insert data into the table
 def insert_data(connection, insert_sql):
     print("We are here in db2.py")
@@ -305,6 +493,21 @@ def fetch_court_rows(connection):
         return None
 
 
+# Function to stream rows from the Courts table in batches instead of loading them all
+def iter_court_rows(connection, batch_size=500):
+    query_sql = "SELECT * FROM Courts"
+    try:
+        cursor = connection.cursor()
+        cursor.execute(query_sql)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield from rows
+    except Error as e:
+        print(f"Error fetching rows: {e}")
+
+
 # Function to fetch the first 2 rows from the Acts table
 def fetch_acts_rows(connection):
     query_sql = "SELECT * FROM Acts"
@@ -318,6 +521,25 @@ def fetch_acts_rows(connection):
         return None
 
 
+# Function to stream Acts rows grouped by court and establishment, so that
+# consecutive requests hit the same court
+def iter_acts_rows(connection, batch_size=500):
+    query_sql = """
+    SELECT * FROM Acts
+    ORDER BY state_code, district_code, court_code, establishment_code, act_code
+    """
+    try:
+        cursor = connection.cursor()
+        cursor.execute(query_sql)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield from rows
+    except Error as e:
+        print(f"Error fetching rows: {e}")
+
+
 def custom_query(connection, query_sql):
     try:
         cursor = connection.cursor()
@@ -341,17 +563,318 @@ def drop_table(connection, table_name):
 
 
 def fetch_court_pages(connection):
-    query_sql = "SELECT * FROM COURTS_HTML"
+    query_sql = COURT_PAGE_SELECT
     try:
         cursor = connection.cursor()
         cursor.execute(query_sql)
-        rows = cursor.fetchall()
+        rows = [_court_page_row(row) for row in cursor]
         return rows
     except Error as e:
         print(f"Error querying table: {e}")
         return None
 
 
+# Function to fetch a single page from the COURTS_HTML table by id
+def fetch_court_page(connection, page_id):
+    query_sql = COURT_PAGE_SELECT + " WHERE c.id = ?"
+    try:
+        cursor = connection.cursor()
+        cursor.execute(query_sql, (page_id,))
+        row = cursor.fetchone()
+        return None if row is None else _court_page_row(row)
+    except Error as e:
+        print(f"Error querying table: {e}")
+        return None
+
+
+# Function to fetch the COURTS_HTML pages with first_id <= id <= last_id, in id order
+def fetch_court_pages_in_range(connection, first_id, last_id):
+    query_sql = COURT_PAGE_SELECT + " WHERE c.id BETWEEN ? AND ? ORDER BY c.id"
+    try:
+        cursor = connection.cursor()
+        cursor.execute(query_sql, (first_id, last_id))
+        return [_court_page_row(row) for row in cursor]
+    except Error as e:
+        print(f"Error querying table: {e}")
+        return []
+
+
+# Function to record one captcha submission; `scope` is (state_code, district_code,
+# court_code, establishment_code) as far as known
+def save_captcha_attempt(
+    connection, scope, attempt, answer, confidence, accepted, writer=None
+):
+    scope = tuple(scope) + (None,) * (4 - len(scope))
+    try:
+        _insert_row(
+            connection,
+            INSERT_CAPTCHA_ATTEMPT_SQL,
+            (time.time(),) + scope + (attempt, answer, confidence, int(accepted)),
+            writer,
+        )
+    except Error as e:
+        print(f"Error saving captcha attempt to database: {e}")
+
+
+# Function to save the viewHistory page of a CNR, compressed in HtmlBlobs, or the
+# error of a failed fetch (html_content None) so that the CNR is fetched again later
+def save_case_history(
+    connection, cnr_number, date_scraped, html_content, error=None, writer=None
+):
+    try:
+        content_hash = None
+        if html_content is not None:
+            blob_row = html_blob_row(html_content)
+            _insert_row(connection, INSERT_HTML_BLOB_SQL, blob_row, writer)
+            content_hash = blob_row[0]
+        _insert_row(
+            connection,
+            INSERT_CASE_HISTORY_SQL,
+            (cnr_number, date_scraped, content_hash, error),
+            writer,
+        )
+    except Error as e:
+        print(f"Error saving case history to database: {e}")
+
+
+# Function to stream (cnr_number, state_code, district_code, court_code, est_code) for
+# every CNR without a stored case history. Rows are read `batch_size` at a time by
+# CNR number, so no read stays open while the pages are written.
+def iter_pending_cnrs(connection, batch_size=500):
+    last_cnr = ""
+    try:
+        while True:
+            rows = connection.execute(
+                PENDING_CNR_SELECT, (last_cnr, batch_size)
+            ).fetchall()
+            if not rows:
+                break
+            yield from rows
+            last_cnr = rows[-1][0]
+    except Error as e:
+        print(f"Error fetching rows: {e}")
+
+
+# Function to return which of `cnr_numbers` already have a stored case history, with
+# one indexed query per `batch_size` numbers
+def fetch_stored_histories(connection, cnr_numbers, batch_size=500):
+    cnr_numbers = list(cnr_numbers)
+    stored = set()
+    try:
+        for start in range(0, len(cnr_numbers), batch_size):
+            batch = cnr_numbers[start : start + batch_size]
+            query_sql = (
+                "SELECT cnr_number FROM CaseHistories WHERE html_hash IS NOT NULL "
+                f"AND cnr_number IN ({', '.join('?' * len(batch))})"
+            )
+            stored.update(row[0] for row in connection.execute(query_sql, batch))
+    except Error as e:
+        print(f"Error querying table: {e}")
+    return stored
+
+
+# Function to stream the CNR numbers whose stored case history still has to be parsed
+# by `parser_version`, read `batch_size` at a time
+def iter_unparsed_histories(connection, parser_version, batch_size=500):
+    last_cnr = ""
+    try:
+        while True:
+            rows = connection.execute(
+                UNPARSED_HISTORY_SELECT, (last_cnr, parser_version, batch_size)
+            ).fetchall()
+            if not rows:
+                break
+            for row in rows:
+                yield row[0]
+            last_cnr = rows[-1][0]
+    except Error as e:
+        print(f"Error fetching rows: {e}")
+
+
+# Function to fetch (cnr_number, html_hash, page text) for the stored case histories
+# of `cnr_numbers`, in one query
+def fetch_case_histories(connection, cnr_numbers):
+    query_sql = f"""
+    SELECT h.cnr_number, h.html_hash, b.codec, b.content
+    FROM CaseHistories h JOIN HtmlBlobs b ON b.hash = h.html_hash
+    WHERE h.cnr_number IN ({", ".join("?" * len(cnr_numbers))})
+    """
+    try:
+        rows = connection.execute(query_sql, list(cnr_numbers)).fetchall()
+        return [(row[0], row[1], decompress_html(row[2], row[3])) for row in rows]
+    except Error as e:
+        print(f"Error querying table: {e}")
+        return []
+
+
+# Function to store parsed case histories in bulk. `records` holds (cnr_number,
+# html_hash, parsed) with `parsed` as returned by parse_case_history, plus the IPC
+# section numbers of the case under "sections"; the rows of an earlier parse of the
+# same case are replaced.
+def save_case_records(connection, records, parser_version, date_processed, writer=None):
+    cnr_keys = [(cnr_number,) for cnr_number, _, _ in records]
+    header_rows = [
+        (cnr_number, content_hash, parser_version, date_processed)
+        + tuple(parsed["header"][column] for column in HEADER_COLUMNS)
+        for cnr_number, content_hash, parsed in records
+    ]
+    party_rows = [
+        (cnr_number,) + party
+        for cnr_number, _, parsed in records
+        for party in parsed["parties"]
+    ]
+    act_rows = [
+        (cnr_number,) + act
+        for cnr_number, _, parsed in records
+        for act in parsed["acts"]
+    ]
+    section_rows = [
+        (cnr_number, section_number)
+        for cnr_number, _, parsed in records
+        for section_number in parsed.get("sections", [])
+    ]
+    hearing_rows = [
+        (cnr_number,) + hearing
+        for cnr_number, _, parsed in records
+        for hearing in parsed["hearings"]
+    ]
+    try:
+        for delete_sql in DELETE_CASE_ROWS_SQL:
+            _insert_rows(connection, delete_sql, cnr_keys, writer)
+        _insert_rows(connection, INSERT_CASE_HEADER_SQL, header_rows, writer)
+        _insert_rows(connection, INSERT_CASE_PARTY_SQL, party_rows, writer)
+        _insert_rows(connection, INSERT_CASE_ACT_SQL, act_rows, writer)
+        _insert_rows(connection, INSERT_CASE_HEARING_SQL, hearing_rows, writer)
+        _insert_rows(connection, INSERT_CASE_SECTION_SQL, section_rows, writer)
+    except Error as e:
+        print(f"Error saving case records to database: {e}")
+
+
+# Function to fetch the (act_code, section_number, case_status) queries already stored
+# in COURTS_HTML for one court establishment; RETRY_PAGES are left out
+def fetch_stored_act_queries(
+    connection, state_code, district_code, court_code, establishment_code
+):
+    retry_hashes = [html_hash(page) for page in RETRY_PAGES]
+    query_sql = f"""
+    SELECT act_code, section_number, case_status FROM COURTS_HTML
+    WHERE state_code = ? AND district_code = ? AND court_code = ?
+      AND establishment_code = ?
+      AND (html_hash IS NULL OR html_hash NOT IN ({', '.join('?' * len(retry_hashes))}))
+    """
+    try:
+        rows = connection.execute(
+            query_sql,
+            (state_code, district_code, court_code, establishment_code, *retry_hashes),
+        ).fetchall()
+        return set(rows)
+    except Error as e:
+        print(f"Error querying table: {e}")
+        return set()
+
+
+# Function to fetch the stored viewHistory page of a CNR, or None
+def fetch_case_history(connection, cnr_number):
+    query_sql = """
+    SELECT b.codec, b.content FROM CaseHistories h JOIN HtmlBlobs b ON b.hash = h.html_hash
+    WHERE h.cnr_number = ?
+    """
+    try:
+        row = connection.execute(query_sql, (cnr_number,)).fetchone()
+        return None if row is None else decompress_html(*row)
+    except Error as e:
+        print(f"Error querying table: {e}")
+        return None
+
+
+# Function to pad a (state, district, complex) scope with '' to the three key columns
+def _dropdown_scope(scope):
+    scope = tuple(str(code) for code in scope)
+    return scope + ("",) * (3 - len(scope))
+
+
+# Function to save the (text, value) options of a dropdown for a scope such as
+# (state_code, district_code)
+def save_dropdown_snapshot(connection, dropdown, scope, options, writer=None):
+    try:
+        _insert_row(
+            connection,
+            INSERT_DROPDOWN_SQL,
+            (dropdown,)
+            + _dropdown_scope(scope)
+            + (json.dumps([list(option) for option in options]), time.time()),
+            writer,
+        )
+    except Error as e:
+        print(f"Error saving dropdown snapshot to database: {e}")
+
+
+# Function to fetch the options saved for a dropdown and scope, or None when there is
+# no snapshot younger than max_age seconds
+def fetch_dropdown_snapshot(connection, dropdown, scope, max_age):
+    query_sql = """
+    SELECT options FROM DropdownSnapshots
+    WHERE dropdown = ? AND state_code = ? AND district_code = ?
+      AND court_complex_code = ? AND captured_at > ?
+    """
+    try:
+        row = connection.execute(
+            query_sql,
+            (dropdown,) + _dropdown_scope(scope) + (time.time() - max_age,),
+        ).fetchone()
+    except Error as e:
+        print(f"Error querying table: {e}")
+        return None
+    if row is None:
+        return None
+    return [tuple(option) for option in json.loads(row[0])]
+
+
+# Function to fetch the text of a stored page by its hash
+def fetch_html(connection, content_hash):
+    query_sql = "SELECT codec, content FROM HtmlBlobs WHERE hash = ?"
+    try:
+        row = connection.execute(query_sql, (content_hash,)).fetchone()
+        return None if row is None else decompress_html(*row)
+    except Error as e:
+        print(f"Error querying table: {e}")
+        return None
+
+
+# Function to move pages saved before migration 5 from COURTS_HTML.html_content into
+# HtmlBlobs, `batch_size` rows per transaction. Safe to stop and run again; VACUUM
+# afterwards to give the freed pages back to the filesystem.
+def compress_stored_html(connection, batch_size=500):
+    select_sql = """
+    SELECT id, html_content FROM COURTS_HTML
+    WHERE html_hash IS NULL AND id > ? ORDER BY id LIMIT ?
+    """
+    update_sql = "UPDATE COURTS_HTML SET html_hash = ?, html_content = '' WHERE id = ?"
+    last_id, moved, text_bytes, blob_bytes = 0, 0, 0, 0
+    while True:
+        rows = connection.execute(select_sql, (last_id, batch_size)).fetchall()
+        if not rows:
+            break
+        blob_rows = [html_blob_row(html_content) for _, html_content in rows]
+        with connection:
+            connection.executemany(INSERT_HTML_BLOB_SQL, blob_rows)
+            connection.executemany(
+                update_sql,
+                ((blob_row[0], row[0]) for row, blob_row in zip(rows, blob_rows)),
+            )
+        last_id = rows[-1][0]
+        moved += len(rows)
+        text_bytes += sum(blob_row[2] for blob_row in blob_rows)
+        blob_bytes += sum(len(blob_row[3]) for blob_row in blob_rows)
+        print(f"Compressed {moved} pages (up to id {last_id}).")
+    blob_count = connection.execute("SELECT COUNT(*) FROM HtmlBlobs").fetchone()[0]
+    print(
+        f"Moved {moved} pages ({text_bytes} characters, {blob_bytes} compressed bytes "
+        f"before dedupe); HtmlBlobs now holds {blob_count} distinct pages."
+    )
+    return moved
+
+
 def add_column(connection, table_name, column_name, column_type, default_value):
     add_column_sql = f"ALTER TABLE {table_name} ADD COLUMN {column_name} {column_type} DEFAULT {default_value}"
     try:
@@ -363,7 +886,7 @@ def add_column(connection, table_name, column_name, column_type, default_value):
         print(f"Error adding column '{column_name}': {e}")
 
 
-def main():
+def main(compress_html=False):
     # Step 1: Create a connection to the local SQLite database
     db_file = "jd-master-db.db"
     connection = create_connection(db_file)
@@ -380,7 +903,11 @@ def main():
     # # Step 4: Query data from the table
     # query_table(connection)
 
-    # add_column(connection, "COURTS_HTML", "section_number", "TEXT", "302")
+    # Create or upgrade the schema (replaces the manual add_column calls)
+    migrate(connection)
+
+    if compress_html:
+        compress_stored_html(connection)
 
     # Close the connection
     if connection:
@@ -388,4 +915,11 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Create or upgrade the database.")
+    parser.add_argument(
+        "--compress-html",
+        action="store_true",
+        help="Move pages saved as text into the compressed HtmlBlobs table.",
+    )
+    args = parser.parse_args()
+    main(compress_html=args.compress_html)
@@ -0,0 +1,161 @@
+import contextlib
+import contextvars
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from itertools import groupby
+
+from migrations import apply_pragmas
+
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_FLUSH_INTERVAL = 2.0
+
+_STOP = object()
+
+# (writer, statements) of the unit open in the current thread or asyncio task
+_current_unit = contextvars.ContextVar("batch_writer_unit", default=None)
+
+
+# Function to open writer.unit(), or nothing when rows are written without a writer
+def write_unit(writer):
+    return writer.unit() if writer is not None else contextlib.nullcontext()
+
+
+# Background writer that owns its own SQLite connection. Rows are queued with put() and
+# written with executemany, one transaction per batch; a batch is flushed when it
+# reaches `batch_size` rows or `flush_interval` seconds after its first row arrived.
+# Statements are applied in the order they were queued. Rows queued inside unit() (the
+# rows of one job and its completion) are queued together and stay together: when a
+# batch fails and is retried row by row, a unit is committed or dropped as a whole.
+class BatchWriter:
+    def __init__(
+        self,
+        db_file,
+        batch_size=DEFAULT_BATCH_SIZE,
+        flush_interval=DEFAULT_FLUSH_INTERVAL,
+    ):
+        self.db_file = db_file
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.rows_written = 0
+        self.batches_written = 0
+        self._queue = queue.Queue()
+        self._closed = False
+        self._thread = threading.Thread(
+            target=self._run, name="BatchWriter", daemon=True
+        )
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    # Queue one row for `sql`; inside unit() it is held until the unit ends
+    def put(self, sql, params):
+        if self._closed:
+            raise RuntimeError("BatchWriter is closed")
+        unit = _current_unit.get()
+        if unit is not None and unit[0] is self:
+            unit[1].append((sql, tuple(params)))
+            return
+        self._queue.put([(sql, tuple(params))])
+
+    # Queue many rows for the same `sql`
+    def put_many(self, sql, rows):
+        for params in rows:
+            self.put(sql, params)
+
+    # Context manager collecting the rows put() in the current thread or asyncio task
+    # into one unit, queued when the block ends (also when it raises)
+    @contextlib.contextmanager
+    def unit(self):
+        statements = []
+        token = _current_unit.set((self, statements))
+        try:
+            yield self
+        finally:
+            _current_unit.reset(token)
+            if statements:
+                self._queue.put(statements)
+
+    # Block until everything queued so far is committed
+    def flush(self):
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait()
+
+    # Flush what is left and stop the writer thread
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join()
+        logging.info(
+            f"BatchWriter closed: {self.rows_written} rows in {self.batches_written} batches."
+        )
+
+    def _run(self):
+        connection = sqlite3.connect(self.db_file, timeout=30)
+        apply_pragmas(connection)
+        batch = []
+        rows = 0
+        deadline = None
+        try:
+            while True:
+                timeout = None if deadline is None else max(0, deadline - time.time())
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    item = None
+
+                if item is _STOP:
+                    self._write(connection, batch)
+                    return
+                if isinstance(item, threading.Event):
+                    self._write(connection, batch)
+                    batch, rows, deadline = [], 0, None
+                    item.set()
+                    continue
+                if item is not None:
+                    batch.append(item)
+                    rows += len(item)
+                    if deadline is None:
+                        deadline = time.time() + self.flush_interval
+                if item is None or rows >= self.batch_size:
+                    self._write(connection, batch)
+                    batch, rows, deadline = [], 0, None
+        finally:
+            connection.close()
+
+    # Function to write a batch of units in one transaction
+    def _write(self, connection, batch):
+        if not batch:
+            return
+        statements = [statement for unit in batch for statement in unit]
+        try:
+            with connection:
+                for sql, group in groupby(statements, key=lambda item: item[0]):
+                    connection.executemany(sql, [params for _, params in group])
+            self.rows_written += len(statements)
+            self.batches_written += 1
+        except sqlite3.Error as e:
+            # Fall back to one unit at a time so that one bad row does not lose the
+            # batch; a unit with a bad row is rolled back whole, so a job is never
+            # marked done without its rows
+            logging.error(f"Batch write of {len(statements)} rows failed: {e}")
+            for unit in batch:
+                try:
+                    with connection:
+                        for sql, params in unit:
+                            connection.execute(sql, params)
+                    self.rows_written += len(unit)
+                except sqlite3.Error as row_error:
+                    print(f"Error writing row to database: {row_error}")
+                    logging.error(
+                        f"Dropped {len(unit)} rows, from {unit[0][1]}: {row_error}"
+                    )
@@ -0,0 +1,201 @@
+import asyncio
+import logging
+import statistics
+import time
+
+import aiohttp
+import requests
+from tenacity import (
+    AsyncRetrying,
+    retry_if_exception_type,
+    stop_after_attempt,
+    wait_exponential,
+)
+
+from response_cache import get_cache
+
+ECOURTS_BASE_URL = "https://services.ecourts.gov.in/ecourtindia_v6/"
+
+# Headers shared by every AJAX call we make against the eCourts portal
+FORM_HEADERS = {
+    "Accept": "application/json, text/javascript, */*; q=0.01",
+    "Content-Type": "application/x-www-form-urlencoded; charset=UTF-8",
+    "Origin": "https://services.ecourts.gov.in",
+    "Referer": "https://services.ecourts.gov.in/",
+    "X-Requested-With": "XMLHttpRequest",
+}
+
+DEFAULT_CONCURRENCY = 8
+DEFAULT_RETRIES = 4
+
+# Status codes worth retrying: the portal throttles with 429 and drops to 5xx under load
+TRANSIENT_STATUSES = {429, 500, 502, 503, 504}
+
+
+class TransientHTTPError(Exception):
+    pass
+
+
+# Function to build the full URL of an eCourts endpoint, e.g. "casestatus/fillActType"
+def endpoint_url(endpoint):
+    return f"{ECOURTS_BASE_URL}?p={endpoint}"
+
+
+# Function to open one pooled, keep-alive HTTP session shared by all workers
+def create_http_session(concurrency=DEFAULT_CONCURRENCY, timeout=60):
+    connector = aiohttp.TCPConnector(
+        limit=concurrency,
+        limit_per_host=concurrency,
+        ttl_dns_cache=300,
+        keepalive_timeout=60,
+    )
+    return aiohttp.ClientSession(
+        connector=connector,
+        headers=FORM_HEADERS,
+        timeout=aiohttp.ClientTimeout(total=timeout),
+    )
+
+
+# Function to POST a form to an endpoint and return (status, body text). When a
+# response cache is configured (response_cache.configure_cache) it is answered from
+# the cache if possible and successful responses are stored.
+async def post_form(session, endpoint, data):
+    status, text, _ = await _post_form(session, endpoint, data)
+    return status, text
+
+
+# post_form that also tells whether the response came from the cache
+async def _post_form(session, endpoint, data):
+    cache = get_cache()
+    if cache is not None:
+        cached = cache.get(endpoint, data)
+        if cached is not None:
+            return cached + (True,)
+    async with session.post(endpoint_url(endpoint), data=data) as response:
+        status, text = response.status, await response.text()
+    if cache is not None:
+        cache.put(endpoint, data, status, text)
+    return status, text, False
+
+
+# Blocking version of post_form for the requests based scripts and the notebook
+def post_form_blocking(endpoint, data, headers=None, timeout=60):
+    cache = get_cache()
+    if cache is not None:
+        cached = cache.get(endpoint, data)
+        if cached is not None:
+            return cached
+    response = requests.post(
+        endpoint_url(endpoint),
+        headers=headers or FORM_HEADERS,
+        data=data,
+        timeout=timeout,
+    )
+    if cache is not None:
+        cache.put(endpoint, data, response.status_code, response.text)
+    return response.status_code, response.text
+
+
+# Function to POST a form, retrying timeouts, dropped connections and 429/5xx replies.
+# Returns (status, body text, from_cache); a cached body never reached the portal, so
+# it says nothing about the current session (e.g. its app_token is an old one).
+async def post_form_with_retry(session, endpoint, data, attempts=DEFAULT_RETRIES):
+    async for attempt in AsyncRetrying(
+        stop=stop_after_attempt(attempts),
+        wait=wait_exponential(multiplier=1, min=1, max=20),
+        retry=retry_if_exception_type(
+            (TransientHTTPError, aiohttp.ClientError, asyncio.TimeoutError)
+        ),
+        reraise=True,
+    ):
+        with attempt:
+            status, text, from_cache = await _post_form(session, endpoint, data)
+            if status in TRANSIENT_STATUSES:
+                raise TransientHTTPError(f"{endpoint} returned status {status}")
+    return status, text, from_cache
+
+
+# Collects per-request latencies and outcomes for one run
+class RunStats:
+    def __init__(self, name):
+        self.name = name
+        self.latencies = []
+        self.succeeded = 0
+        self.failed = 0
+        self.started = time.perf_counter()
+        self.finished = None
+
+    def record(self, latency, ok=True):
+        self.latencies.append(latency)
+        if ok:
+            self.succeeded += 1
+        else:
+            self.failed += 1
+
+    def stop(self):
+        self.finished = time.perf_counter()
+
+    def summary(self):
+        elapsed = (self.finished or time.perf_counter()) - self.started
+        total = self.succeeded + self.failed
+        summary = {
+            "run": self.name,
+            "requests": total,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "elapsed_s": round(elapsed, 2),
+            "throughput_rps": round(total / elapsed, 2) if elapsed > 0 else 0.0,
+        }
+        if self.latencies:
+            ordered = sorted(self.latencies)
+            summary["latency_mean_s"] = round(statistics.fmean(ordered), 3)
+            summary["latency_p50_s"] = round(ordered[len(ordered) // 2], 3)
+            summary["latency_p95_s"] = round(
+                ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 3
+            )
+            summary["latency_max_s"] = round(ordered[-1], 3)
+        return summary
+
+    def report(self):
+        summary = self.summary()
+        line = ", ".join(f"{key}={value}" for key, value in summary.items())
+        print(f"Run report: {line}")
+        logging.info(f"Run report: {line}")
+        return summary
+
+
+# Function to stream items from an iterable into N concurrent workers.
+# The queue is bounded so a large table is never loaded into memory at once.
+async def run_workers(items, worker, concurrency=DEFAULT_CONCURRENCY, stats=None):
+    queue = asyncio.Queue(maxsize=concurrency * 2)
+
+    async def consume():
+        while True:
+            item = await queue.get()
+            if item is None:
+                queue.task_done()
+                return
+            started = time.perf_counter()
+            ok = True
+            try:
+                await worker(item)
+            except Exception as e:
+                ok = False
+                logging.error(f"Worker failed for {item}: {e}")
+            finally:
+                if stats is not None:
+                    stats.record(time.perf_counter() - started, ok)
+                queue.task_done()
+
+    consumers = [asyncio.create_task(consume()) for _ in range(concurrency)]
+    try:
+        for item in items:
+            await queue.put(item)
+        for _ in consumers:
+            await queue.put(None)
+        await asyncio.gather(*consumers)
+    finally:
+        for task in consumers:
+            task.cancel()
+        if stats is not None:
+            stats.stop()
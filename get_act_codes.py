@@ -1,15 +1,35 @@
-import requests
+import argparse
+import asyncio
 import re
 from bs4 import BeautifulSoup
 import json
 import logging
 from db2 import (
     save_acts_to_db,
-    create_act_table,
     create_connection,
+    DB_FILE,
     drop_table,
-    fetch_court_rows,
+    iter_court_rows,
 )
+from job_queue import (
+    STAGE_ACTS,
+    complete_job,
+    enqueue_jobs,
+    fail_job,
+    iter_jobs,
+    job_counts,
+)
+from db_writer import BatchWriter
+from migrations import migrate
+from response_cache import add_cache_arguments, configure_cache
+from fetch_engine import (
+    DEFAULT_CONCURRENCY,
+    RunStats,
+    create_http_session,
+    post_form_blocking,
+    run_workers,
+)
+from portal_session import PortalSession
 import datetime
 import os
 
@@ -27,15 +47,13 @@ def get_act_codes(
     district_code="1",
     court_complex_code="1280004",
     est_code="",
+    writer=None,
 ):
 
     # Get today's date
     date_scraped = datetime.date.today()
     logging.basicConfig(level=logging.INFO)
 
-    # Define the URL
-    url = "https://services.ecourts.gov.in/ecourtindia_v6/?p=casestatus/fillActType"
-
     # Define the headers
     headers = {
         "Content-Type": "application/x-www-form-urlencoded; charset=UTF-8",
@@ -53,70 +71,153 @@ def get_act_codes(
     }
 
     # Send the POST request
-    response = requests.post(url, headers=headers, data=data)
+    status, response_text = post_form_blocking(
+        "casestatus/fillActType", data, headers=headers
+    )
 
     # Print the response
-    # print("Status Code:", response.status_code)
-    # print("Response Text:", response.text)
-
-    if response.status_code == 200:
-        print("Request Successful")
-
-        response_text = response.text
-
-        # Parse the JSON response
-
-        if not response_text:
-            logging.error("Response text is None.")
-            save_acts_to_db(
-                connection,
-                date_scraped,
-                state_code,
-                district_code,
-                court_complex_code,
-                est_code,
-                "E005: No Act Codes list found",
-                "E005: No Act Codes list found",
-            )
-        else:
-            response_data = json.loads(response_text)
+    # print("Status Code:", status)
+    # print("Response Text:", response_text)
 
-            # Extract the act_list HTML
-            act_list_html = response_data.get("act_list", "")
+    if status != 200:
+        raise RuntimeError(f"fillActType returned status {status}")
 
-            # Use BeautifulSoup to parse the HTML options
-            soup = BeautifulSoup(act_list_html, "html.parser")
+    print("Request Successful")
+    save_act_codes(
+        connection,
+        date_scraped,
+        state_code,
+        district_code,
+        court_complex_code,
+        est_code,
+        response_text,
+        writer=writer,
+    )
 
-            # Initialize an empty dictionary for storing the ACT codes and their corresponding details
-            filtered_act_dict = {}
 
-            # Compile your regex for filtering act names
-            ipc_regex = re.compile(
-                r"^(I.P.C|IPC|Indian Penal Code)\b.*$", re.IGNORECASE
-            )
+# Function to pull the IPC related (act_code, act_name) pairs out of a fillActType response
+def parse_act_list(response_text):
+    # Parse the JSON response
+    response_data = json.loads(response_text)
+
+    # Extract the act_list HTML
+    act_list_html = response_data.get("act_list", "")
+
+    # Use BeautifulSoup to parse the HTML options
+    soup = BeautifulSoup(act_list_html, "html.parser")
+
+    # Compile your regex for filtering act names
+    ipc_regex = re.compile(r"^(I.P.C|IPC|Indian Penal Code)\b.*$", re.IGNORECASE)
+
+    ipc_acts = []
+    # Loop through each <option> tag and extract the value and text
+    for option in soup.find_all("option"):
+        act_code = option.get("value")
+        act_name = option.text.strip()
+
+        # Apply regex filtering
+        if act_code and act_name and act_code != "":
+            if ipc_regex.search(act_name):
+                logging.info(f"REGEX MATCHED: {act_name}")
+                ipc_acts.append((act_code, act_name))
+    return ipc_acts
+
+
+# Function to save the acts of a fillActType response, or the E005 marker if it is empty
+def save_act_codes(
+    connection,
+    date_scraped,
+    state_code,
+    district_code,
+    court_complex_code,
+    est_code,
+    response_text,
+    writer=None,
+):
+    if not response_text:
+        logging.error("Response text is None.")
+        save_acts_to_db(
+            connection,
+            date_scraped,
+            state_code,
+            district_code,
+            court_complex_code,
+            est_code,
+            "E005: No Act Codes list found",
+            "E005: No Act Codes list found",
+            writer=writer,
+        )
+        return
+
+    for act_code, act_name in parse_act_list(response_text):
+        save_acts_to_db(
+            connection,
+            date_scraped,
+            state_code,
+            district_code,
+            court_complex_code,
+            est_code,
+            act_code,
+            act_name,
+            writer=writer,
+        )
+
+
+# Function to turn a Courts row into fillActType parameters, or None if it should be skipped
+def court_row_to_params(row):
+    state_code = row[2]
+    district_code = row[3]
+    court_code = row[4]
+    est_code = row[6]
+    est_name = row[7]
+    court_code = court_code.split("@")[0]
+    if est_code == "E003: No court establishment found":
+        est_code = ""
+    if est_name == "Select court establishment":
+        return None  # skipping Select court establishment
+    return {
+        "state_code": state_code,
+        "district_code": district_code,
+        "court_complex_code": court_code,
+        "est_code": est_code,
+    }
+
+
+# Async version of get_act_codes; requests go through the shared portal session of the
+# caller, which supplies the cookies and app_token
+async def get_act_codes_async(
+    portal,
+    connection=None,
+    state_code="28",
+    district_code="1",
+    court_complex_code="1280004",
+    est_code="",
+    writer=None,
+):
+    date_scraped = datetime.date.today()
+
+    data = {
+        "state_code": state_code,
+        "dist_code": district_code,
+        "court_complex_code": court_complex_code,
+        "est_code": est_code,
+        "search_act": "",
+    }
 
-            options = soup.find_all("option")
-            # print("Number of Options:", len(options))
-
-            # Loop through each <option> tag and extract the value and text
-            for index, option in enumerate(soup.find_all("option")):
-                act_code = option.get("value")
-                act_name = option.text.strip()
-
-                # Apply regex filtering
-                if act_code and act_name and act_code != "":
-                    if ipc_regex.search(act_name):
-                        logging.info(f"REGEX MATCHED: {act_name}")
-                        save_acts_to_db(
-                            connection,
-                            date_scraped,
-                            state_code,
-                            district_code,
-                            court_complex_code,
-                            est_code,
-                            act_code,
-                            act_name,
-                        )
+    status, response_text = await portal.post("casestatus/fillActType", data)
+    if status != 200:
+        raise RuntimeError(f"fillActType returned status {status}")
+
+    save_act_codes(
+        connection,
+        date_scraped,
+        state_code,
+        district_code,
+        court_complex_code,
+        est_code,
+        response_text,
+        writer=writer,
+    )
 
 
 def setup_db():
@@ -136,40 +237,106 @@ def setup_db():
     return connection
 
 
+# Function to queue one 'acts' job per Courts row; rows queued by an earlier run are kept
+def enqueue_court_jobs(connection):
+    enqueue_jobs(
+        connection, STAGE_ACTS, ((row[0], row) for row in iter_court_rows(connection))
+    )
+
+
 def main():
     connection = setup_db()
     # drop_table(connection, "Acts")
-    create_act_table(connection)
-    logging.info("ACT Table created.")
-    rows = fetch_court_rows(connection)
-    if rows:
-        for row in rows:
-            state_code = row[2]
-            district_code = row[3]
-            court_code = row[4]
-            court_name = row[5]
-            est_code = row[6]
-            est_name = row[7]
-            court_code = court_code.split("@")[0]
-            if est_code == "E003: No court establishment found":
-                est_code = ""
-            if est_name == "Select court establishment":
-                continue  # skipping Select court establishment
+    migrate(connection)
+    logging.info("Database schema up to date.")
+    enqueue_court_jobs(connection)
+    if not job_counts(connection, STAGE_ACTS):
+        logging.error("No rows found.")
+        return
+
+    with BatchWriter(DB_FILE) as writer:
+        for job_id, row in iter_jobs(connection, STAGE_ACTS):
+            params = court_row_to_params(row)
+            if params is None:
+                complete_job(connection, job_id, writer)
+                continue
             print(
-                f"State Code: {state_code}, District Name: {district_code}, Court Code: {court_code}, Establishment Code: {est_code}"
-            )
-            get_act_codes(
-                connection=connection,
-                state_code=state_code,
-                district_code=district_code,
-                court_complex_code=court_code,
-                est_code=est_code,
+                f"State Code: {params['state_code']}, District Name: {params['district_code']}, Court Code: {params['court_complex_code']}, Establishment Code: {params['est_code']}"
             )
+            with writer.unit():
+                try:
+                    get_act_codes(connection=connection, writer=writer, **params)
+                except Exception as e:
+                    logging.error(f"Error fetching act codes for {params}: {e}")
+                    fail_job(connection, job_id, e)
+                    continue
+                complete_job(connection, job_id, writer)
             print("Processing next row.")
-            # break
-    else:
-        logging.error("No rows found.")
+    print(f"Act code jobs: {job_counts(connection, STAGE_ACTS)}")
+
+
+# Async mode: streams pending 'acts' jobs into `concurrency` workers sharing one connection pool
+async def main_async(concurrency=DEFAULT_CONCURRENCY):
+    connection = setup_db()
+    migrate(connection)
+    logging.info("Database schema up to date.")
+    enqueue_court_jobs(connection)
+
+    stats = RunStats("get_act_codes")
+
+    async with create_http_session(concurrency) as session:
+        # One handshake for the run; every worker uses its cookies and app_token
+        portal = PortalSession(session)
+        with BatchWriter(DB_FILE) as writer:
+
+            async def worker(job):
+                job_id, row = job
+                params = court_row_to_params(row)
+                with writer.unit():
+                    try:
+                        if params is not None:
+                            await get_act_codes_async(
+                                portal, connection=connection, writer=writer, **params
+                            )
+                    except Exception as e:
+                        fail_job(connection, job_id, e)
+                        raise
+                    complete_job(connection, job_id, writer)
+
+            await run_workers(
+                iter_jobs(connection, STAGE_ACTS),
+                worker,
+                concurrency=concurrency,
+                stats=stats,
+            )
+        portal.report()
+
+    stats.report()
+    print(f"Act code jobs: {job_counts(connection, STAGE_ACTS)}")
+    connection.close()
+    return stats
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Fetch IPC act codes per court.")
+    parser.add_argument(
+        "--async",
+        dest="use_async",
+        action="store_true",
+        help="Fetch concurrently over a pooled HTTP session.",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=DEFAULT_CONCURRENCY,
+        help="Number of concurrent requests in async mode.",
+    )
+    add_cache_arguments(parser)
+    args = parser.parse_args()
+    cache = configure_cache(args.cache, args.cache_file)
+    if args.use_async:
+        asyncio.run(main_async(concurrency=args.concurrency))
+    else:
+        main()
+    if cache is not None:
+        cache.report()
@@ -0,0 +1,287 @@
+import argparse
+import asyncio
+import datetime as dt
+import json
+import logging
+
+from bs4 import BeautifulSoup
+
+from db2 import (
+    DB_FILE,
+    save_districts_to_db,
+    save_dropdown_snapshot,
+    save_establishments_to_db,
+    save_states_to_db,
+    setup_db,
+)
+from db_writer import BatchWriter
+from fetch_engine import (
+    DEFAULT_CONCURRENCY,
+    RunStats,
+    create_http_session,
+    run_workers,
+)
+from job_queue import (
+    STAGE_COURTS,
+    STAGE_DISTRICTS,
+    complete_job,
+    enqueue_jobs,
+    fail_job,
+    iter_jobs,
+    job_counts,
+    reset_jobs,
+)
+from portal_session import PortalSession
+from response_cache import add_cache_arguments, configure_cache
+
+# Configure logging
+logging.basicConfig(
+    filename="court_navigator.log",  # Log to this file
+    level=logging.INFO,  # Log all INFO level and above
+    format="%(asctime)s - %(levelname)s - %(message)s",  # Include timestamp
+)
+
+# The AJAX endpoints behind the state -> district -> complex -> establishment dropdowns
+# of the case status form, and the key of the <option> list in their JSON answer
+FILL_DISTRICT_ENDPOINT = "casestatus/fillDistrict"
+FILL_COMPLEX_ENDPOINT = "casestatus/fillcomplex"
+FILL_ESTABLISHMENT_ENDPOINT = "casestatus/fillCourtEstablishment"
+OPTION_LIST_KEYS = {
+    FILL_DISTRICT_ENDPOINT: "dist_list",
+    FILL_COMPLEX_ENDPOINT: "complex_list",
+    FILL_ESTABLISHMENT_ENDPOINT: "establishment_list",
+}
+CASE_STATUS_PAGE = "casestatus"
+
+
+# Function to read the (text, value) pairs of the <option> tags in an HTML fragment
+def parse_options(options_html):
+    soup = BeautifulSoup(options_html, "html.parser")
+    return [(option.text, option.get("value")) for option in soup.find_all("option")]
+
+
+def is_placeholder(option_text):
+    return "select" in option_text.lower()
+
+
+# Function to pull the <option> list out of a fill* response. The list is normally
+# under OPTION_LIST_KEYS[endpoint]; any other value holding options is accepted too.
+def parse_option_list(endpoint, response_text):
+    response_data = json.loads(response_text)
+    options_html = response_data.get(OPTION_LIST_KEYS[endpoint])
+    if not options_html:
+        options_html = next(
+            (
+                value
+                for value in response_data.values()
+                if isinstance(value, str) and "<option" in value
+            ),
+            "",
+        )
+    return parse_options(options_html)
+
+
+# Function to POST to a fill* endpoint through the portal session and return its
+# (text, value) options
+async def fetch_options(portal, endpoint, data):
+    status, response_text = await portal.post(endpoint, data)
+    if status != 200:
+        raise RuntimeError(f"{endpoint} returned status {status}")
+    return parse_option_list(endpoint, response_text)
+
+
+# Function to read the state dropdown from the case status page; the GET also gives the
+# portal session the PHPSESSID cookie and app_token the AJAX endpoints expect
+async def fetch_states(portal):
+    page_html = await portal.get_page(CASE_STATUS_PAGE)
+    soup = BeautifulSoup(page_html, "html.parser")
+    state_select = soup.find("select", id="sess_state_code")
+    if state_select is None:
+        raise RuntimeError("No state dropdown on the case status page.")
+    return parse_options(str(state_select))
+
+
+# Function to fetch the districts of a state, save them and queue a 'courts' job for
+# each one. Uses the same job keys as navigator.py, so both crawlers share progress.
+async def crawl_state(portal, connection, writer, state_code):
+    district_options = await fetch_options(
+        portal, FILL_DISTRICT_ENDPOINT, {"state_code": state_code}
+    )
+    save_dropdown_snapshot(
+        connection, "#sess_dist_code", (state_code,), district_options, writer
+    )
+    district_rows = [
+        (state_code, district_text.strip(), district_value)
+        for district_text, district_value in district_options
+        if not is_placeholder(district_text)
+    ]
+    save_districts_to_db(connection, district_rows, writer)
+    enqueue_jobs(
+        connection,
+        STAGE_COURTS,
+        (
+            (f"{state_code}:{district_code}", [state_code, district_code])
+            for state_code, district_name, district_code in district_rows
+        ),
+    )
+    return len(district_rows)
+
+
+# Function to fetch the court complexes of a district and the establishments of every
+# complex at once, and save them as Courts rows the way navigator.py does
+async def crawl_district(portal, connection, writer, state_code, district_code):
+    date_scraped = dt.datetime.now().strftime("%Y-%m-%d %H:%M %p")
+    complex_options = await fetch_options(
+        portal,
+        FILL_COMPLEX_ENDPOINT,
+        {"state_code": state_code, "dist_code": district_code},
+    )
+    save_dropdown_snapshot(
+        connection,
+        "#court_complex_code",
+        (state_code, district_code),
+        complex_options,
+        writer,
+    )
+    complexes = [
+        (complex_text.lower().strip().replace(" ", "_"), complex_value)
+        for complex_text, complex_value in complex_options
+        if not is_placeholder(complex_text)
+    ]
+
+    # Complex values look like "1280004@1,2,3@N"; the endpoint wants the first part
+    est_lists = await asyncio.gather(
+        *(
+            fetch_options(
+                portal,
+                FILL_ESTABLISHMENT_ENDPOINT,
+                {
+                    "state_code": state_code,
+                    "dist_code": district_code,
+                    "court_complex_code": court_code.split("@")[0],
+                },
+            )
+            for _, court_code in complexes
+        )
+    )
+
+    for (court_name, court_code), est_options in zip(complexes, est_lists):
+        # Only a placeholder means the form hides the establishment dropdown
+        if all(is_placeholder(est_text) for est_text, _ in est_options):
+            est_options = []
+        save_dropdown_snapshot(
+            connection,
+            "#court_est_code",
+            (state_code, district_code, court_code),
+            est_options,
+            writer,
+        )
+        save_establishments_to_db(
+            connection,
+            date_scraped,
+            state_code,
+            district_code,
+            court_code,
+            court_name,
+            est_options,
+            writer=writer,
+        )
+    return len(complexes)
+
+
+# Crawls States, Districts and Courts over plain HTTP: `concurrency` workers share one
+# pooled session. With refresh=True districts and courts finished by an earlier run
+# (of this script or navigator.py) are crawled again.
+async def main(concurrency=DEFAULT_CONCURRENCY, refresh=False):
+    connection = setup_db()
+    if refresh:
+        reset_jobs(connection, STAGE_DISTRICTS)
+        reset_jobs(connection, STAGE_COURTS)
+
+    stats = RunStats("get_hierarchy")
+
+    async with create_http_session(concurrency) as session:
+        portal = PortalSession(session)
+        with BatchWriter(DB_FILE) as writer:
+            state_rows = await fetch_states(portal)
+            save_states_to_db(connection, state_rows, writer)
+            enqueue_jobs(
+                connection,
+                STAGE_DISTRICTS,
+                (
+                    (state_code, [state_code])
+                    for state_name, state_code in state_rows
+                    if not is_placeholder(state_name)
+                ),
+            )
+
+            async def state_worker(job):
+                job_id, (state_code,) = job
+                with writer.unit():
+                    try:
+                        district_count = await crawl_state(
+                            portal, connection, writer, state_code
+                        )
+                    except Exception as e:
+                        fail_job(connection, job_id, e)
+                        raise
+                    logging.info(f"State {state_code}: {district_count} districts.")
+                    complete_job(connection, job_id, writer)
+
+            async def district_worker(job):
+                job_id, (state_code, district_code) = job
+                with writer.unit():
+                    try:
+                        complex_count = await crawl_district(
+                            portal, connection, writer, state_code, district_code
+                        )
+                    except Exception as e:
+                        fail_job(connection, job_id, e)
+                        raise
+                    logging.info(
+                        f"District {state_code}:{district_code}: "
+                        f"{complex_count} complexes."
+                    )
+                    complete_job(connection, job_id, writer)
+
+            # States first: the district jobs only exist once their state is crawled
+            for stage, worker in (
+                (STAGE_DISTRICTS, state_worker),
+                (STAGE_COURTS, district_worker),
+            ):
+                await run_workers(
+                    iter_jobs(connection, stage, batch_size=concurrency),
+                    worker,
+                    concurrency=concurrency,
+                    stats=stats,
+                )
+        portal.report()
+
+    stats.report()
+    print(f"District jobs: {job_counts(connection, STAGE_DISTRICTS)}")
+    print(f"Court jobs: {job_counts(connection, STAGE_COURTS)}")
+    connection.close()
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Crawl States, Districts and Courts without a browser."
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=DEFAULT_CONCURRENCY,
+        help="Number of concurrent requests.",
+    )
+    parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="Crawl districts and courts again even if an earlier run finished them.",
+    )
+    add_cache_arguments(parser)
+    args = parser.parse_args()
+    cache = configure_cache(args.cache, args.cache_file)
+    asyncio.run(main(concurrency=args.concurrency, refresh=args.refresh))
+    if cache is not None:
+        cache.report()
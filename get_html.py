@@ -1,17 +1,37 @@
-import requests
+import argparse
+import asyncio
 import re
 from bs4 import BeautifulSoup
 import json
 import logging
 from db2 import (
     save_acts_to_db,
-    create_act_table,
     create_connection,
+    DB_FILE,
     drop_table,
-    fetch_acts_rows,
     save_html_to_db,
-    create_html_table,
+    iter_acts_rows,
 )
+from job_queue import (
+    STAGE_HTML,
+    complete_job,
+    enqueue_jobs,
+    fail_job,
+    iter_jobs,
+    job_counts,
+)
+from db_writer import BatchWriter
+from migrations import migrate
+from response_cache import add_cache_arguments, configure_cache
+from fetch_engine import (
+    DEFAULT_CONCURRENCY,
+    RunStats,
+    create_http_session,
+    post_form_blocking,
+    run_workers,
+)
+from portal_session import PortalSession
+from section_index import ALL_SECTIONS, DEFAULT_SECTION, section_filter
 import datetime
 import os
 
@@ -22,6 +42,10 @@ logging.basicConfig(
     format="%(asctime)s - %(levelname)s - %(message)s",  # Include timestamp
 )
 
+SUBMIT_ACT_ENDPOINT = "casestatus/submitAct"
+# Case status radio of the act form: "Pending" or "Disposed"
+DEFAULT_CASE_STATUS = "Pending"
+
 
 def get_html_content(
     connection=None,
@@ -30,15 +54,15 @@ def get_html_content(
     court_complex_code="1280004",
     est_code="",
     act_code="",
+    section_number=DEFAULT_SECTION,
+    case_status=DEFAULT_CASE_STATUS,
+    writer=None,
 ):
 
     # Get today's date
     date_scraped = datetime.date.today()
     logging.basicConfig(level=logging.INFO)
 
-    # Define the URL
-    url = "https://services.ecourts.gov.in/ecourtindia_v6/?p=casestatus/submitAct"
-
     # Define the headers
     headers = {
         "Content-Type": "application/x-www-form-urlencoded; charset=UTF-8",
@@ -48,8 +72,8 @@ def get_html_content(
     data = {
         "search_act": "",
         "actcode": act_code,
-        "under_sec": "302",
-        "case_status": "Pending",
+        "under_sec": section_filter(section_number),
+        "case_status": case_status,
         "act_captcha_code": "",
         "state_code": state_code,
         "dist_code": district_code,
@@ -60,48 +84,130 @@ def get_html_content(
     }
 
     # Send the POST request
-    response = requests.post(url, headers=headers, data=data)
+    status, response_text = post_form_blocking(
+        SUBMIT_ACT_ENDPOINT, data, headers=headers
+    )
 
     # Print the response
-    print("Status Code:", response.status_code)
-
-    if response.status_code == 200:
-        print("Request Successful")
-
-        response_text = response.text
-        # Parse the JSON response
-
-        if not response_text:
-            logging.error("Response text is None.")
-            save_html_to_db(
-                connection,
-                date_scraped,
-                state_code,
-                district_code,
-                court_complex_code,
-                est_code,
-                act_code,
-                "Pending",
-                "E006: No Records found",
-            )
-        else:
-            # Parse the JSON response
-            response_data = json.loads(response_text)
-
-            # Extract the act_data HTML
-            act_data = response_data.get("act_data", "")
-
-            save_html_to_db(
-                connection,
-                date_scraped,
-                state_code,
-                district_code,
-                court_complex_code,
-                est_code,
-                act_code,
-                "Pending",
-                act_data,
-            )
+    print("Status Code:", status)
+
+    if status != 200:
+        raise RuntimeError(f"submitAct returned status {status}")
+
+    print("Request Successful")
+    save_html_to_db(
+        connection,
+        *html_row_from_response(
+            date_scraped,
+            state_code,
+            district_code,
+            court_complex_code,
+            est_code,
+            act_code,
+            response_text,
+            section_number,
+            case_status,
+        ),
+        writer=writer,
+    )
+
+
+# Function to build the COURTS_HTML row for a submitAct response
+def html_row_from_response(
+    date_scraped,
+    state_code,
+    district_code,
+    court_complex_code,
+    est_code,
+    act_code,
+    response_text,
+    section_number=DEFAULT_SECTION,
+    case_status=DEFAULT_CASE_STATUS,
+):
+    if not response_text:
+        logging.error("Response text is None.")
+        act_data = "E006: No Records found"
+    else:
+        # Parse the JSON response and extract the act_data HTML
+        act_data = json.loads(response_text).get("act_data", "")
+    return (
+        date_scraped,
+        state_code,
+        district_code,
+        court_complex_code,
+        est_code,
+        act_code,
+        case_status,
+        act_data,
+        section_number,
+    )
+
+
+# Function to build the submitAct form of one act query; PortalSession.form adds the
+# AJAX fields
+def act_query_form(
+    state_code,
+    district_code,
+    court_complex_code,
+    est_code,
+    act_code,
+    section_number=DEFAULT_SECTION,
+    case_status=DEFAULT_CASE_STATUS,
+    captcha_code="",
+):
+    return {
+        "search_act": "",
+        "actcode": act_code,
+        "under_sec": section_filter(section_number),
+        "case_status": case_status,
+        "act_captcha_code": captcha_code,
+        "state_code": state_code,
+        "dist_code": district_code,
+        "court_complex_code": court_complex_code,
+        "est_code": est_code,
+    }
+
+
+# Async version of get_html_content that returns the row instead of saving it.
+# Requests go through the shared portal session, which supplies the cookies and
+# app_token and retries transient failures.
+async def get_html_content_async(
+    portal,
+    state_code="28",
+    district_code="1",
+    court_complex_code="1280004",
+    est_code="",
+    act_code="",
+    section_number=DEFAULT_SECTION,
+    case_status=DEFAULT_CASE_STATUS,
+):
+    date_scraped = datetime.date.today()
+
+    data = act_query_form(
+        state_code,
+        district_code,
+        court_complex_code,
+        est_code,
+        act_code,
+        section_number,
+        case_status,
+    )
+
+    status, response_text = await portal.post(SUBMIT_ACT_ENDPOINT, data)
+    if status != 200:
+        raise RuntimeError(f"submitAct returned status {status}")
+
+    return html_row_from_response(
+        date_scraped,
+        state_code,
+        district_code,
+        court_complex_code,
+        est_code,
+        act_code,
+        response_text,
+        section_number,
+        case_status,
+    )
 
 
 def setup_db():
@@ -121,50 +227,205 @@ def setup_db():
     return connection
 
 
-def main():
+# Function to name the job stage of act queries under `section_number`. Section 302
+# keeps the plain 'html' stage it was queued under before sections could be chosen;
+# every other section, ALL_SECTIONS included, gets a stage of its own.
+def html_stage(section_number=DEFAULT_SECTION):
+    if section_number == DEFAULT_SECTION:
+        return STAGE_HTML
+    return f"{STAGE_HTML}:{section_number}"
+
+
+# Function to queue one job per Acts row for `section_number`, in court order; rows
+# queued by an earlier run are kept. With ALL_SECTIONS each (court, establishment,
+# act) is fetched once for every section; process_case_history.py then files the
+# cases under their sections.
+def enqueue_act_jobs(connection, section_number=DEFAULT_SECTION):
+    enqueue_jobs(
+        connection,
+        html_stage(section_number),
+        ((row[0], row) for row in iter_acts_rows(connection)),
+    )
+
+
+def main(section_number=DEFAULT_SECTION):
     connection = setup_db()
     # drop_table(connection, "Acts")
-    create_html_table(connection)
+    migrate(connection)
     date_scraped = datetime.date.today()
-    logging.info("COURTS_HTML Table created.")
-    rows = fetch_acts_rows(connection)
-    if rows:
-        for row in rows:
+    logging.info("Database schema up to date.")
+    enqueue_act_jobs(connection, section_number)
+    stage = html_stage(section_number)
+    if not job_counts(connection, stage):
+        logging.error("No rows found.")
+        return
+
+    with BatchWriter(DB_FILE) as writer:
+        for job_id, row in iter_jobs(connection, stage):
             state_code = row[2]
             district_code = row[3]
             court_code = row[4]
             est_code = row[5]
             act_code = row[6]
             act_name = row[7]
-            if act_code == "E005: No Act Codes list found":
-                save_html_to_db(
-                    connection,
-                    date_scraped,
-                    state_code,
-                    district_code,
-                    court_code,
-                    est_code,
-                    "E005: No Act Codes list found",
-                    "Pending",
-                    "E005: No Act Codes list found",
-                )
-            else:
-                print(
-                    f"State Code: {state_code}, District Name: {district_code}, Court Code: {court_code}, Establishment Code: {est_code}, Act Code: {act_code}, Act Name: {act_name}"
-                )
-                get_html_content(
-                    connection=connection,
-                    state_code=state_code,
-                    district_code=district_code,
-                    court_complex_code=court_code,
-                    est_code=est_code,
-                    act_code=act_code,
-                )
+            with writer.unit():
+                try:
+                    if act_code == "E005: No Act Codes list found":
+                        save_html_to_db(
+                            connection,
+                            date_scraped,
+                            state_code,
+                            district_code,
+                            court_code,
+                            est_code,
+                            "E005: No Act Codes list found",
+                            DEFAULT_CASE_STATUS,
+                            "E005: No Act Codes list found",
+                            section_number,
+                            writer=writer,
+                        )
+                    else:
+                        print(
+                            f"State Code: {state_code}, District Name: {district_code}, Court Code: {court_code}, Establishment Code: {est_code}, Act Code: {act_code}, Act Name: {act_name}"
+                        )
+                        get_html_content(
+                            connection=connection,
+                            state_code=state_code,
+                            district_code=district_code,
+                            court_complex_code=court_code,
+                            est_code=est_code,
+                            act_code=act_code,
+                            section_number=section_number,
+                            writer=writer,
+                        )
+                except Exception as e:
+                    logging.error(f"Error fetching page for Acts row {row[0]}: {e}")
+                    fail_job(connection, job_id, e)
+                    continue
+                complete_job(connection, job_id, writer)
             print("Processing next ACT row.")
-            # break
-    else:
-        logging.error("No rows found.")
+    print(f"HTML jobs ({stage}): {job_counts(connection, stage)}")
+
+
+# Async mode: fetches pending 'html' jobs in court order over a pooled keep-alive session
+# and writes the act_data pages to COURTS_HTML in batches of `batch_size`
+async def main_async(
+    concurrency=DEFAULT_CONCURRENCY, batch_size=100, section_number=DEFAULT_SECTION
+):
+    connection = setup_db()
+    migrate(connection)
+    date_scraped = datetime.date.today()
+    logging.info("Database schema up to date.")
+
+    enqueue_act_jobs(connection, section_number)
+    stage = html_stage(section_number)
+
+    stats = RunStats("get_html")
+
+    async with create_http_session(concurrency) as session:
+        # One handshake for the run; every worker uses its cookies and app_token
+        portal = PortalSession(session)
+        # Jobs are completed through the writer, after their page, so a crash
+        # re-fetches at most the pages that were not yet committed
+        with BatchWriter(DB_FILE, batch_size=batch_size) as writer:
+
+            async def worker(job):
+                job_id, row = job
+                state_code, district_code, court_code, est_code, act_code = row[2:7]
+                with writer.unit():
+                    if act_code == "E005: No Act Codes list found":
+                        save_html_to_db(
+                            connection,
+                            date_scraped,
+                            state_code,
+                            district_code,
+                            court_code,
+                            est_code,
+                            "E005: No Act Codes list found",
+                            DEFAULT_CASE_STATUS,
+                            "E005: No Act Codes list found",
+                            section_number,
+                            writer=writer,
+                        )
+                        complete_job(connection, job_id, writer)
+                        return
+                    try:
+                        row = await get_html_content_async(
+                            portal,
+                            state_code=state_code,
+                            district_code=district_code,
+                            court_complex_code=court_code,
+                            est_code=est_code,
+                            act_code=act_code,
+                            section_number=section_number,
+                        )
+                    except Exception as e:
+                        fail_job(connection, job_id, e)
+                        raise
+                    save_html_to_db(connection, *row, writer=writer)
+                    complete_job(connection, job_id, writer)
+
+            await run_workers(
+                iter_jobs(connection, stage),
+                worker,
+                concurrency=concurrency,
+                stats=stats,
+            )
+        portal.report()
+
+    stats.report()
+    print(f"HTML jobs ({stage}): {job_counts(connection, stage)}")
+    connection.close()
+    return stats
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Fetch submitAct result pages.")
+    parser.add_argument(
+        "--async",
+        dest="use_async",
+        action="store_true",
+        help="Fetch concurrently over a pooled HTTP session.",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=DEFAULT_CONCURRENCY,
+        help="Number of concurrent requests in async mode.",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=100,
+        help="Number of pages written per transaction in async mode.",
+    )
+    parser.add_argument(
+        "--section",
+        default=DEFAULT_SECTION,
+        help="IPC section to search under. --all-sections fetches every section of an "
+        "act in one request per court.",
+    )
+    parser.add_argument(
+        "--all-sections",
+        dest="section",
+        action="store_const",
+        const=ALL_SECTIONS,
+        help="Leave the section filter empty and store the pages under section "
+        f"'{ALL_SECTIONS}'; process_case_history.py files the cases under their "
+        "sections.",
+    )
+    add_cache_arguments(parser)
+    args = parser.parse_args()
+    cache = configure_cache(args.cache, args.cache_file)
+    if args.use_async:
+        asyncio.run(
+            main_async(
+                concurrency=args.concurrency,
+                batch_size=args.batch_size,
+                section_number=args.section,
+            )
+        )
+    else:
+        main(section_number=args.section)
+    if cache is not None:
+        cache.report()
@@ -0,0 +1,225 @@
+import argparse
+import asyncio
+import datetime
+import json
+import logging
+
+from cnr_decoder import NO_COURT, cnr_array, get_prefix_index, validate_cnrs
+from db2 import (
+    DB_FILE,
+    fetch_stored_histories,
+    iter_pending_cnrs,
+    save_case_history,
+    setup_db,
+)
+from db_writer import BatchWriter
+from fetch_engine import DEFAULT_CONCURRENCY, RunStats, create_http_session, run_workers
+from portal_session import PortalSession
+from response_cache import add_cache_arguments, configure_cache
+
+# Configure logging
+logging.basicConfig(
+    filename="court_navigator.log",  # Log to this file
+    level=logging.INFO,  # Log all INFO level and above
+    format="%(asctime)s - %(levelname)s - %(message)s",  # Include timestamp
+)
+
+VIEW_HISTORY_ENDPOINT = "home/viewHistory"
+# CNRs are resolved through the prefix index this many at a time
+RESOLVE_CHUNK = 5000
+
+
+# Function to build the viewHistory form of a CNR from the court it was listed under.
+# Complex codes look like "1280004@1,2,3@N": the part before the first "@" is the
+# complex and the list after it holds its establishment (court) numbers, the first of
+# which stands in when the CNR row has no establishment of its own.
+def history_params(cnr_number, state_code, district_code, court_code, est_code):
+    court_complex_code, _, court_numbers = court_code.partition("@")
+    if not est_code or est_code.startswith("E003"):
+        est_code = court_numbers.split("@")[0].split(",")[0]
+    return {
+        "court_code": est_code,
+        "state_code": state_code,
+        "dist_code": district_code,
+        "court_complex_code": court_complex_code,
+        "case_no": "",
+        "cino": cnr_number,
+        "hideparty": "",
+        "search_flag": "CScaseNumber",
+        "search_by": "CSact",
+    }
+
+
+# Function to replace the court parameters of pending CNR rows with the ones the CNR
+# itself encodes, resolved a chunk at a time through the prefix index (cnr_decoder.py).
+# Rows whose prefix is unknown keep the court they were listed under; rows that are no
+# valid CNR (e.g. the "E004: No CNR found" placeholder) are dropped and counted in
+# skipped["unresolved"].
+def resolve_cnr_rows(cnr_rows, index, skipped, chunk_size=RESOLVE_CHUNK):
+    chunk = []
+    for cnr_row in cnr_rows:
+        chunk.append(cnr_row)
+        if len(chunk) == chunk_size:
+            yield from _resolve_chunk(chunk, index, skipped)
+            chunk = []
+    if chunk:
+        yield from _resolve_chunk(chunk, index, skipped)
+
+
+def _resolve_chunk(cnr_rows, index, skipped):
+    cnrs = [cnr_row[0] for cnr_row in cnr_rows]
+    valid = validate_cnrs(cnr_array(cnrs))
+    positions = index.lookup(cnrs)
+    for cnr_row, is_valid, position in zip(cnr_rows, valid, positions):
+        if not is_valid:
+            skipped["unresolved"] += 1
+        elif position == NO_COURT:
+            yield cnr_row
+        else:
+            yield (cnr_row[0],) + tuple(index.params[position])
+
+
+# Function to stream CNRs from a file (one per line, e.g. CNR_numbers.csv) as request
+# rows. Lines that are not valid CNRs, repeats and CNRs whose history is stored or
+# whose prefix is unknown are left out; the skips are counted in `skipped`.
+def iter_file_cnrs(connection, cnr_file, index, skipped, chunk_size=RESOLVE_CHUNK):
+    seen = set()
+    with open(cnr_file) as fp:
+        while True:
+            lines = [line for _, line in zip(range(chunk_size), fp)]
+            if not lines:
+                break
+            cnrs = [line.strip().upper() for line in lines]
+            cnrs = [cnr for cnr in dict.fromkeys(cnrs) if cnr not in seen]
+            seen.update(cnrs)
+            unresolved = [0]
+            resolved = list(index.resolve(cnrs, unresolved))
+            stored = fetch_stored_histories(connection, [row[0] for row in resolved])
+            skipped["unresolved"] += unresolved[0]
+            skipped["stored"] += len(stored)
+            for cnr_row in resolved:
+                if cnr_row[0] not in stored:
+                    yield cnr_row
+
+
+# Function to pull the case history HTML out of a viewHistory response; raises
+# ValueError when the response holds none
+def parse_history_response(response_text):
+    try:
+        response_data = json.loads(response_text)
+    except ValueError:
+        raise ValueError("viewHistory did not return JSON")
+    html_code = (
+        response_data.get("data_list") if isinstance(response_data, dict) else None
+    )
+    if not html_code:
+        raise ValueError(f"No data_list in viewHistory response: {response_text[:200]}")
+    return html_code.strip()
+
+
+# Function to fetch the case history of one CNR and return its HTML
+async def fetch_view_history(portal, cnr_row):
+    status, response_text = await portal.post(
+        VIEW_HISTORY_ENDPOINT, history_params(*cnr_row)
+    )
+    if status != 200:
+        raise RuntimeError(f"viewHistory returned status {status}")
+    return parse_history_response(response_text)
+
+
+# Streams every CNR without a stored case history into `concurrency` workers sharing one
+# portal session, and stores the pages compressed, `batch_size` per transaction. A
+# failed CNR is stored with its error and tried again by the next run. CNRs come from
+# the CNR table, or from `cnr_file` when given; their request parameters are decoded
+# from the CNR itself; the prefix index is rebuilt when the CNR or Courts table grew,
+# or always with `rebuild_index`.
+async def main(
+    concurrency=DEFAULT_CONCURRENCY, batch_size=100, cnr_file=None, rebuild_index=False
+):
+    connection = setup_db()
+    date_scraped = datetime.date.today()
+    index = get_prefix_index(connection, rebuild=rebuild_index)
+    skipped = {"unresolved": 0, "stored": 0}
+    if cnr_file:
+        cnr_rows = iter_file_cnrs(connection, cnr_file, index, skipped)
+    else:
+        cnr_rows = resolve_cnr_rows(iter_pending_cnrs(connection), index, skipped)
+
+    stats = RunStats("get_view_history")
+
+    async with create_http_session(concurrency) as session:
+        portal = PortalSession(session)
+        with BatchWriter(DB_FILE, batch_size=batch_size) as writer:
+
+            async def worker(cnr_row):
+                cnr_number = cnr_row[0]
+                try:
+                    html_code = await fetch_view_history(portal, cnr_row)
+                except Exception as e:
+                    save_case_history(
+                        connection, cnr_number, date_scraped, None, str(e), writer
+                    )
+                    raise
+                save_case_history(
+                    connection, cnr_number, date_scraped, html_code, writer=writer
+                )
+                print(f"Saved case history of {cnr_number}.")
+
+            await run_workers(
+                cnr_rows,
+                worker,
+                concurrency=concurrency,
+                stats=stats,
+            )
+        portal.report()
+
+    stats.report()
+    if cnr_file:
+        print(
+            f"Skipped {skipped['stored']} CNRs with a stored history and "
+            f"{skipped['unresolved']} invalid or unknown CNRs."
+        )
+    else:
+        print(f"Skipped {skipped['unresolved']} invalid CNRs.")
+    connection.close()
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Fetch the case history (viewHistory) of every CNR."
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=DEFAULT_CONCURRENCY,
+        help="Number of concurrent requests.",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=100,
+        help="Number of case histories written per transaction.",
+    )
+    parser.add_argument(
+        "--cnr-file",
+        help="Fetch the CNRs listed in this file (one per line) instead of the CNR table.",
+    )
+    parser.add_argument(
+        "--rebuild-index",
+        action="store_true",
+        help="Rebuild the CNR prefix index even if the CNR and Courts tables are unchanged.",
+    )
+    add_cache_arguments(parser)
+    args = parser.parse_args()
+    cache = configure_cache(args.cache, args.cache_file)
+    asyncio.run(
+        main(
+            concurrency=args.concurrency,
+            batch_size=args.batch_size,
+            cnr_file=args.cnr_file,
+            rebuild_index=args.rebuild_index,
+        )
+    )
+    if cache is not None:
+        cache.report()
@@ -0,0 +1,56 @@
+import hashlib
+import zlib
+
+try:
+    import zstandard
+except ImportError:  # zstandard is optional, pages are then stored with zlib
+    zstandard = None
+
+# Pages are stored once per distinct content in the HtmlBlobs table (migration 5),
+# keyed by the SHA-256 of the UTF-8 text. The codec is stored with every blob, so a
+# database written with zstd can still be read where only zlib is available for the
+# older blobs and vice versa.
+CODEC_ZSTD = "zstd"
+CODEC_ZLIB = "zlib"
+DEFAULT_CODEC = CODEC_ZSTD if zstandard is not None else CODEC_ZLIB
+
+ZSTD_LEVEL = 10
+ZLIB_LEVEL = 6
+
+
+# Function to hash a page; the hex digest is the HtmlBlobs primary key
+def html_hash(html_content):
+    return hashlib.sha256(html_content.encode("utf-8")).hexdigest()
+
+
+# Function to compress a page with `codec`
+def compress_html(html_content, codec=DEFAULT_CODEC):
+    data = html_content.encode("utf-8")
+    if codec == CODEC_ZSTD:
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    if codec == CODEC_ZLIB:
+        return zlib.compress(data, ZLIB_LEVEL)
+    raise ValueError(f"Unknown HTML codec '{codec}'")
+
+
+# Function to turn a stored blob back into the page text
+def decompress_html(codec, content):
+    if codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise RuntimeError("zstandard is needed to read zstd-compressed pages")
+        data = zstandard.ZstdDecompressor().decompress(content)
+    elif codec == CODEC_ZLIB:
+        data = zlib.decompress(content)
+    else:
+        raise ValueError(f"Unknown HTML codec '{codec}'")
+    return data.decode("utf-8")
+
+
+# Function to build the (hash, codec, size, content) HtmlBlobs row of a page
+def html_blob_row(html_content, codec=DEFAULT_CODEC):
+    return (
+        html_hash(html_content),
+        codec,
+        len(html_content),
+        compress_html(html_content, codec),
+    )
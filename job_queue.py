@@ -0,0 +1,205 @@
+import json
+import logging
+import os
+import socket
+import time
+from sqlite3 import Error
+
+# The Jobs table itself is created by migrations.py
+
+# Stages of the crawl, in pipeline order, and the unit of work of each one
+STAGE_DISTRICTS = "districts"  # one state -> its Districts rows
+STAGE_COURTS = "courts"  # one district -> its Courts (complex/establishment) rows
+STAGE_ACTS = "acts"  # one establishment -> its Acts rows
+STAGE_HTML = "html"  # one act query -> a COURTS_HTML page
+STAGE_PARSE = "parse"  # one COURTS_HTML page -> its CNR rows
+
+DEFAULT_LEASE_SECONDS = 600
+DEFAULT_MAX_ATTEMPTS = 5
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+
+# Function to add one job per (job_key, payload) pair; keys that already exist are
+# left alone, so re-running a stage never re-queues finished work
+def enqueue_jobs(connection, stage, keyed_payloads):
+    insert_sql = """
+    INSERT OR IGNORE INTO Jobs (stage, job_key, payload, created_at)
+    VALUES (?, ?, ?, ?)
+    """
+    now = time.time()
+    try:
+        with connection:
+            cursor = connection.executemany(
+                insert_sql,
+                (
+                    (stage, str(key), json.dumps(payload), now)
+                    for key, payload in keyed_payloads
+                ),
+            )
+        logging.info(f"Enqueued {cursor.rowcount} new '{stage}' jobs.")
+        return cursor.rowcount
+    except Error as e:
+        print(f"Error enqueuing jobs: {e}")
+        return 0
+
+
+# Function to enqueue one job per row of a query whose first column is the job key
+def enqueue_from_query(connection, stage, query_sql):
+    cursor = connection.cursor()
+    cursor.execute(query_sql)
+    return enqueue_jobs(connection, stage, ((row[0], list(row)) for row in cursor))
+
+
+# Function to lease up to `limit` jobs of a stage. Pending jobs come first in id order;
+# running jobs whose lease expired (the worker crashed) are picked up again, or marked
+# failed when that was their last attempt.
+def claim_jobs(
+    connection,
+    stage,
+    limit=1,
+    lease_seconds=DEFAULT_LEASE_SECONDS,
+    max_attempts=DEFAULT_MAX_ATTEMPTS,
+):
+    select_sql = """
+    SELECT id, payload FROM Jobs
+    WHERE stage = ?
+      AND attempts < ?
+      AND (status = 'pending' OR (status = 'running' AND lease_expires < ?))
+    ORDER BY id
+    LIMIT ?
+    """
+    expire_sql = """
+    UPDATE Jobs
+    SET status = 'failed', lease_owner = NULL, lease_expires = NULL,
+        last_error = 'Lease expired on the last attempt'
+    WHERE stage = ? AND status = 'running' AND lease_expires < ? AND attempts >= ?
+    """
+    update_sql = """
+    UPDATE Jobs
+    SET status = 'running', attempts = attempts + 1, lease_owner = ?,
+        lease_expires = ?, started_at = ?
+    WHERE id = ?
+    """
+    now = time.time()
+    try:
+        connection.commit()
+        connection.execute("BEGIN IMMEDIATE")
+        connection.execute(expire_sql, (stage, now, max_attempts))
+        rows = connection.execute(
+            select_sql, (stage, max_attempts, now, limit)
+        ).fetchall()
+        connection.executemany(
+            update_sql,
+            ((WORKER_ID, now + lease_seconds, now, job_id) for job_id, _ in rows),
+        )
+        connection.commit()
+    except Error as e:
+        connection.rollback()
+        print(f"Error claiming jobs: {e}")
+        return []
+    return [(job_id, json.loads(payload)) for job_id, payload in rows]
+
+
+# Function to mark jobs as done so that they are never fetched again. When the job's
+# rows go through a BatchWriter, pass it as `writer` so that the job is only marked
+# done in (or after) the transaction that writes its rows.
+def complete_jobs(connection, job_ids, writer=None):
+    update_sql = """
+    UPDATE Jobs
+    SET status = 'done', finished_at = ?, duration_s = ? - started_at,
+        lease_owner = NULL, lease_expires = NULL, last_error = NULL
+    WHERE id = ?
+    """
+    now = time.time()
+    rows = [(now, now, job_id) for job_id in job_ids]
+    if writer is not None:
+        writer.put_many(update_sql, rows)
+        return
+    try:
+        with connection:
+            connection.executemany(update_sql, rows)
+    except Error as e:
+        print(f"Error completing jobs: {e}")
+
+
+def complete_job(connection, job_id, writer=None):
+    complete_jobs(connection, [job_id], writer)
+
+
+# Function to release a failed job; it goes back to pending until it runs out of attempts
+def fail_job(connection, job_id, error, max_attempts=DEFAULT_MAX_ATTEMPTS):
+    update_sql = """
+    UPDATE Jobs
+    SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END,
+        finished_at = ?, duration_s = ? - started_at,
+        lease_owner = NULL, lease_expires = NULL, last_error = ?
+    WHERE id = ?
+    """
+    now = time.time()
+    try:
+        with connection:
+            connection.execute(update_sql, (max_attempts, now, now, str(error), job_id))
+    except Error as e:
+        print(f"Error failing job: {e}")
+
+
+# Function to extend the lease of a job this worker still holds. Returns False when the
+# lease was lost: it expired and another worker claimed (or finished) the job.
+def renew_lease(connection, job_id, lease_seconds=DEFAULT_LEASE_SECONDS):
+    update_sql = """
+    UPDATE Jobs SET lease_expires = ?
+    WHERE id = ? AND status = 'running' AND lease_owner = ?
+    """
+    try:
+        with connection:
+            cursor = connection.execute(
+                update_sql, (time.time() + lease_seconds, job_id, WORKER_ID)
+            )
+        return cursor.rowcount == 1
+    except Error as e:
+        print(f"Error renewing lease: {e}")
+        return False
+
+
+# Function to stream claimed jobs of a stage, claiming `batch_size` at a time until
+# nothing is left. A batch can take longer than one lease to work through, so each
+# job's lease is renewed when it is handed out, and jobs taken over by another worker
+# in the meantime are skipped. The caller is responsible for completing or failing
+# each job.
+def iter_jobs(connection, stage, batch_size=50, lease_seconds=DEFAULT_LEASE_SECONDS):
+    while True:
+        jobs = claim_jobs(
+            connection, stage, limit=batch_size, lease_seconds=lease_seconds
+        )
+        if not jobs:
+            return
+        for job_id, payload in jobs:
+            if not renew_lease(connection, job_id, lease_seconds):
+                logging.warning(f"Lease of '{stage}' job {job_id} lost, skipping it.")
+                continue
+            yield job_id, payload
+
+
+# Function to put every job of a stage back to pending, e.g. to refresh master data;
+# `key_pattern` (a LIKE pattern) limits it to the matching job keys
+def reset_jobs(connection, stage, key_pattern="%"):
+    update_sql = """
+    UPDATE Jobs
+    SET status = 'pending', attempts = 0, lease_owner = NULL, lease_expires = NULL
+    WHERE stage = ? AND job_key LIKE ?
+    """
+    try:
+        with connection:
+            cursor = connection.execute(update_sql, (stage, key_pattern))
+        logging.info(f"Reset {cursor.rowcount} '{stage}' jobs.")
+        return cursor.rowcount
+    except Error as e:
+        print(f"Error resetting jobs: {e}")
+        return 0
+
+
+# Function to count the jobs of a stage per status, e.g. {"done": 10, "pending": 2}
+def job_counts(connection, stage):
+    query_sql = "SELECT status, COUNT(*) FROM Jobs WHERE stage = ? GROUP BY status"
+    return dict(connection.execute(query_sql, (stage,)).fetchall())
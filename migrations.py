@@ -0,0 +1,452 @@
+import logging
+import sqlite3
+
+# Pragmas applied to every connection. WAL lets the scraper containers and the
+# `process` container read while one of them writes, and busy_timeout makes a
+# writer wait for the lock instead of failing with "database is locked".
+CONNECTION_PRAGMAS = [
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA busy_timeout = 30000",
+    "PRAGMA cache_size = -65536",  # 64 MB page cache
+    "PRAGMA mmap_size = 268435456",  # 256 MB memory-mapped reads
+    "PRAGMA temp_store = MEMORY",
+]
+
+
+# Function to apply CONNECTION_PRAGMAS to a freshly opened connection
+def apply_pragmas(connection):
+    for pragma in CONNECTION_PRAGMAS:
+        connection.execute(pragma)
+
+
+# Function to add a column only when an older database does not have it yet
+def _add_column_if_missing(connection, table_name, column_name, column_definition):
+    columns = [row[1] for row in connection.execute(f"PRAGMA table_info({table_name})")]
+    if column_name not in columns:
+        connection.execute(
+            f"ALTER TABLE {table_name} ADD COLUMN {column_name} {column_definition}"
+        )
+
+
+# Function to delete duplicate rows (keeping the newest one) so that a unique index
+# can be created on `columns`. NULL keys are stored as '' first: GROUP BY puts NULLs
+# together, but a unique index treats every NULL as distinct and would let the legacy
+# rows with a NULL establishment_code pile up next to the ones the upserts write.
+def _dedupe(connection, table_name, columns):
+    for column in columns:
+        connection.execute(
+            f"UPDATE {table_name} SET {column} = '' WHERE {column} IS NULL"
+        )
+    column_list = ", ".join(columns)
+    removed = connection.execute(f"""
+        DELETE FROM {table_name}
+        WHERE rowid NOT IN (
+            SELECT MAX(rowid) FROM {table_name} GROUP BY {column_list}
+        )
+        """).rowcount
+    if removed:
+        print(f"Removed {removed} duplicate rows from {table_name}.")
+        logging.info(f"Removed {removed} duplicate rows from {table_name}.")
+    return removed
+
+
+# Version 1: the tables that used to be created by the create_*_table functions
+_BASELINE_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS States (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        state_name TEXT NOT NULL,
+        state_code TEXT NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS Districts (
+        state_code TEXT NOT NULL,
+        district_name TEXT NOT NULL,
+        district_code TEXT NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS Courts (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        date_scraped TEXT NOT NULL,
+        state_code TEXT NOT NULL,
+        district_code TEXT NOT NULL,
+        court_code TEXT NOT NULL,
+        court_name TEXT NOT NULL,
+        establishment_code TEXT,
+        establishment_name TEXT
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS Acts (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        date_scraped TEXT NOT NULL,
+        state_code TEXT NOT NULL,
+        district_code TEXT NOT NULL,
+        court_code TEXT NOT NULL,
+        establishment_code TEXT,
+        act_code TEXT NOT NULL,
+        act_name TEXT NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS COURTS_HTML (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        date_scraped TEXT NOT NULL,
+        state_code TEXT NOT NULL,
+        district_code TEXT NOT NULL,
+        court_code TEXT NOT NULL,
+        establishment_code TEXT NOT NULL,
+        act_code TEXT NOT NULL,
+        case_status TEXT NOT NULL,
+        html_content TEXT NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS CNR (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        date_processed TEXT NOT NULL,
+        date_scraped TEXT NOT NULL,
+        state_code TEXT NOT NULL,
+        district_code TEXT NOT NULL,
+        court_code TEXT NOT NULL,
+        est_code TEXT NOT NULL,
+        act_code TEXT NOT NULL,
+        section_number TEXT NOT NULL,
+        case_status TEXT NOT NULL,
+        case_type_number_year TEXT NOT NULL,
+        petitioner_responder TEXT NOT NULL,
+        cnr_number TEXT NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS Jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        stage TEXT NOT NULL,
+        job_key TEXT NOT NULL,
+        payload TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'pending',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        lease_owner TEXT,
+        lease_expires REAL,
+        created_at REAL NOT NULL,
+        started_at REAL,
+        finished_at REAL,
+        duration_s REAL,
+        last_error TEXT,
+        UNIQUE (stage, job_key)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_jobs_stage_status ON Jobs (stage, status, id)",
+]
+
+
+# Version 2: section_number used to be added by hand with db2.add_column
+def _add_section_number(connection):
+    _add_column_if_missing(
+        connection, "COURTS_HTML", "section_number", "TEXT NOT NULL DEFAULT '302'"
+    )
+
+
+# Version 3: unique keys the save_* upserts rely on, plus lookup indexes
+_UNIQUE_KEYS = {
+    "States": ["state_code"],
+    "Districts": ["state_code", "district_code"],
+    "Courts": ["state_code", "district_code", "court_code", "establishment_code"],
+    "Acts": [
+        "state_code",
+        "district_code",
+        "court_code",
+        "establishment_code",
+        "act_code",
+    ],
+    "COURTS_HTML": [
+        "state_code",
+        "district_code",
+        "court_code",
+        "establishment_code",
+        "act_code",
+        "section_number",
+        "case_status",
+    ],
+    "CNR": [
+        "state_code",
+        "district_code",
+        "court_code",
+        "est_code",
+        "act_code",
+        "section_number",
+        "case_status",
+        "case_type_number_year",
+        "cnr_number",
+    ],
+}
+
+
+# Function to dedupe a table on its _UNIQUE_KEYS columns and create the unique index
+def _add_unique_key(connection, table_name):
+    columns = _UNIQUE_KEYS[table_name]
+    _dedupe(connection, table_name, columns)
+    connection.execute(
+        f"CREATE UNIQUE INDEX IF NOT EXISTS uq_{table_name.lower()} "
+        f"ON {table_name} ({', '.join(columns)})"
+    )
+
+
+def _add_keys_and_indexes(connection):
+    for table_name in _UNIQUE_KEYS:
+        _add_unique_key(connection, table_name)
+    # Parse jobs of pages removed as duplicates can never succeed
+    connection.execute("""
+        DELETE FROM Jobs
+        WHERE stage = 'parse' AND status != 'done'
+          AND CAST(job_key AS INTEGER) NOT IN (SELECT id FROM COURTS_HTML)
+        """)
+    # Covering index for the CNR number lookups
+    connection.execute(
+        "CREATE INDEX IF NOT EXISTS idx_cnr_cnr_number ON CNR (cnr_number, id)"
+    )
+    # Covering index for "which act queries of this court are already scraped"
+    connection.execute("""
+        CREATE INDEX IF NOT EXISTS idx_courts_html_lookup ON COURTS_HTML (
+            state_code, district_code, court_code, establishment_code, act_code, id
+        )
+        """)
+
+
+# Version 4: incremental processing. ProcessingState holds the high-water mark of each
+# processor; CNR rows remember the page and parser version they came from.
+def _add_processing_state(connection):
+    connection.execute("""
+        CREATE TABLE IF NOT EXISTS ProcessingState (
+            processor TEXT PRIMARY KEY,
+            parser_version INTEGER NOT NULL,
+            high_water_id INTEGER NOT NULL,
+            updated_at TEXT NOT NULL
+        )
+        """)
+    _add_column_if_missing(connection, "CNR", "page_id", "INTEGER")
+    _add_column_if_missing(
+        connection, "CNR", "parser_version", "INTEGER NOT NULL DEFAULT 0"
+    )
+    connection.execute("CREATE INDEX IF NOT EXISTS idx_cnr_page_id ON CNR (page_id)")
+
+
+# Version 5: pages are stored compressed, once per distinct content, in HtmlBlobs.
+# COURTS_HTML.html_hash points at the blob; rows written before this version keep their
+# text in html_content until `python db2.py --compress-html` moves it.
+_HTML_BLOBS_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS HtmlBlobs (
+        hash TEXT PRIMARY KEY,
+        codec TEXT NOT NULL,
+        size INTEGER NOT NULL,
+        content BLOB NOT NULL
+    )
+    """,
+    lambda connection: _add_column_if_missing(
+        connection, "COURTS_HTML", "html_hash", "TEXT"
+    ),
+    "CREATE INDEX IF NOT EXISTS idx_courts_html_hash ON COURTS_HTML (html_hash)",
+]
+
+
+# Version 6: dropdown contents read by the navigator, per (state, district, complex);
+# codes that do not apply to a dropdown are stored as ''
+_DROPDOWN_SNAPSHOTS_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS DropdownSnapshots (
+        dropdown TEXT NOT NULL,
+        state_code TEXT NOT NULL DEFAULT '',
+        district_code TEXT NOT NULL DEFAULT '',
+        court_complex_code TEXT NOT NULL DEFAULT '',
+        options TEXT NOT NULL,
+        captured_at REAL NOT NULL,
+        PRIMARY KEY (dropdown, state_code, district_code, court_complex_code)
+    )
+    """,
+]
+
+
+# Version 7: every captcha submitted with an act query and whether the portal took it
+_CAPTCHA_ATTEMPTS_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS CaptchaAttempts (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        attempted_at REAL NOT NULL,
+        state_code TEXT,
+        district_code TEXT,
+        court_code TEXT,
+        establishment_code TEXT,
+        attempt INTEGER NOT NULL,
+        answer TEXT NOT NULL,
+        confidence REAL NOT NULL,
+        accepted INTEGER NOT NULL
+    )
+    """,
+]
+
+
+# Version 8: the viewHistory page of every CNR, stored compressed in HtmlBlobs. A CNR
+# whose fetch failed keeps html_hash NULL and the error, and is fetched again.
+_CASE_HISTORIES_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS CaseHistories (
+        cnr_number TEXT PRIMARY KEY,
+        date_scraped TEXT NOT NULL,
+        html_hash TEXT,
+        error TEXT
+    )
+    """,
+]
+
+
+# Version 9: CNR prefix (state and district letters, establishment number) to the
+# viewHistory request parameters, built by cnr_decoder.py
+_CNR_PREFIXES_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS CnrPrefixes (
+        prefix TEXT PRIMARY KEY,
+        state_code TEXT NOT NULL,
+        district_code TEXT NOT NULL,
+        court_complex_code TEXT NOT NULL,
+        court_code TEXT NOT NULL,
+        built_at REAL NOT NULL
+    )
+    """,
+]
+
+
+# Version 10: case histories parsed into rows by process_case_history.py. CaseHeaders
+# remembers the page (html_hash) and parser version each case was parsed from; the
+# other tables hold one row per party, act section and hearing.
+_CASE_RECORDS_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS CaseHeaders (
+        cnr_number TEXT PRIMARY KEY,
+        html_hash TEXT NOT NULL,
+        parser_version INTEGER NOT NULL,
+        date_processed TEXT NOT NULL,
+        case_type TEXT,
+        filing_number TEXT,
+        filing_date TEXT,
+        registration_number TEXT,
+        registration_date TEXT,
+        first_hearing_date TEXT,
+        next_hearing_date TEXT,
+        decision_date TEXT,
+        case_status TEXT,
+        stage_of_case TEXT,
+        nature_of_disposal TEXT,
+        court_and_judge TEXT
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS CaseParties (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        cnr_number TEXT NOT NULL,
+        role TEXT NOT NULL,
+        position INTEGER NOT NULL,
+        name TEXT NOT NULL,
+        advocate TEXT
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS CaseActs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        cnr_number TEXT NOT NULL,
+        act TEXT NOT NULL,
+        section TEXT
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS CaseHearings (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        cnr_number TEXT NOT NULL,
+        position INTEGER NOT NULL,
+        judge TEXT,
+        business_date TEXT,
+        hearing_date TEXT,
+        purpose TEXT
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_case_parties_cnr ON CaseParties (cnr_number)",
+    "CREATE INDEX IF NOT EXISTS idx_case_acts_cnr ON CaseActs (cnr_number)",
+    "CREATE INDEX IF NOT EXISTS idx_case_acts_section ON CaseActs (section, cnr_number)",
+    "CREATE INDEX IF NOT EXISTS idx_case_hearings_cnr ON CaseHearings (cnr_number)",
+]
+
+
+# Version 11: the IPC sections of every parsed case, matched against final_ipc_list.csv
+# (section_index.py). Cases fetched without a section filter are found here by section.
+_CASE_SECTIONS_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS CaseSections (
+        cnr_number TEXT NOT NULL,
+        section_number TEXT NOT NULL,
+        PRIMARY KEY (cnr_number, section_number)
+    ) WITHOUT ROWID
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_case_sections_section ON CaseSections (section_number, cnr_number)",
+]
+
+
+# Version 12: databases that reached version 3 before _dedupe stored NULL keys as ''
+# kept their legacy NULL establishment_code rows; the index is rebuilt around them
+def _normalize_null_keys(connection):
+    for table_name in ("Courts", "Acts"):
+        connection.execute(f"DROP INDEX IF EXISTS uq_{table_name.lower()}")
+        _add_unique_key(connection, table_name)
+
+
+# (version, description, steps); a step is an SQL string or a callable(connection).
+# Never edit a released migration, append a new version instead.
+MIGRATIONS = [
+    (1, "baseline schema", _BASELINE_SCHEMA),
+    (2, "COURTS_HTML.section_number", [_add_section_number]),
+    (3, "unique keys for upserts and lookup indexes", [_add_keys_and_indexes]),
+    (4, "processing high-water marks and CNR page ids", [_add_processing_state]),
+    (5, "compressed content-addressed HTML storage", _HTML_BLOBS_SCHEMA),
+    (6, "dropdown snapshots", _DROPDOWN_SNAPSHOTS_SCHEMA),
+    (7, "captcha attempts", _CAPTCHA_ATTEMPTS_SCHEMA),
+    (8, "case histories", _CASE_HISTORIES_SCHEMA),
+    (9, "CNR prefix index", _CNR_PREFIXES_SCHEMA),
+    (10, "parsed case histories", _CASE_RECORDS_SCHEMA),
+    (11, "IPC sections of parsed cases", _CASE_SECTIONS_SCHEMA),
+    (12, "empty instead of NULL establishment codes", [_normalize_null_keys]),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+# Function to read the schema version stored in the database header
+def current_version(connection):
+    return connection.execute("PRAGMA user_version").fetchone()[0]
+
+
+# Function to bring the database up to LATEST_VERSION. Each version is applied in its
+# own transaction; BEGIN IMMEDIATE makes concurrent containers wait for each other.
+def migrate(connection):
+    for version, description, steps in MIGRATIONS:
+        connection.commit()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            if current_version(connection) >= version:
+                connection.rollback()
+                continue
+            logging.info(f"Applying migration {version}: {description}.")
+            for step in steps:
+                if callable(step):
+                    step(connection)
+                else:
+                    connection.execute(step)
+            connection.execute(f"PRAGMA user_version = {version}")
+            connection.commit()
+            print(f"Applied migration {version}: {description}.")
+        except sqlite3.Error as e:
+            connection.rollback()
+            logging.error(f"Migration {version} failed: {e}")
+            raise
+    return current_version(connection)
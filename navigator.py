@@ -7,9 +7,7 @@ import asyncio
 import csv
 import re
 import logging
-from PIL import Image
 import requests
-import pytesseract
 from db import (
     get_database_connection_details,
     connect_to_database,
@@ -18,19 +16,58 @@ from db import (
 )
 from db2 import (
     create_connection,
-    create_table,
     insert_data,
     query_table,
     custom_query,
-    create_district_table,
-    create_court_table,
     save_html_to_db,
     save_codes_to_db,
-    create_html_table,
+    save_establishments_to_db,
+    save_states_to_db,
+    save_districts_to_db,
+    save_dropdown_snapshot,
+    save_captcha_attempt,
+    fetch_dropdown_snapshot,
     fetch_first_two_rows,
     drop_table,
 )
+from db_writer import BatchWriter, write_unit
+from migrations import migrate
+from job_queue import (
+    STAGE_COURTS,
+    STAGE_DISTRICTS,
+    complete_job,
+    enqueue_jobs,
+    fail_job,
+    iter_jobs,
+)
+from fetch_engine import RunStats, run_workers
+from section_index import DEFAULT_SECTION, section_filter
+from browser_session import (
+    DEFAULT_PAGES_PER_CONTEXT,
+    BrowserSession,
+    context_options,
+    launch_chromium,
+    prepare_context,
+    traffic_stats,
+)
+from captcha_ocr import (
+    CaptchaRejected,
+    captcha_stats,
+    close_ocr_pool,
+    solve_captcha,
+)
+from captcha_solver import save_labelled_captcha
+from portal_session import captcha_accepted, captcha_rejected
+from page_waits import (
+    wait_for_ajax,
+    wait_for_ajax_response,
+    wait_for_idle,
+    wait_for_options,
+    wait_stats,
+)
+import argparse
 import os
+import time
 import datetime as dt
 from tenacity import retry, stop_after_attempt, wait_fixed, wait_exponential
 
@@ -41,39 +78,247 @@ logging.basicConfig(
     format="%(asctime)s - %(levelname)s - %(message)s",  # Include timestamp
 )
 
-# TO-DO: Add section number as a parameter
+ECOURTS_CASE_STATUS_URL = "https://services.ecourts.gov.in/ecourtindia_v6/?p=casestatus"
+
+# AJAX calls the case status form makes; the waits in page_waits.py resolve on them
+FILL_DISTRICT_ENDPOINT = "casestatus/fillDistrict"
+FILL_COMPLEX_ENDPOINT = "casestatus/fillcomplex"
+FILL_ESTABLISHMENT_ENDPOINT = "casestatus/fillCourtEstablishment"
+FILL_ACT_TYPE_ENDPOINT = "casestatus/fillActType"
+SUBMIT_ACT_ENDPOINT = "casestatus/submitAct"
+
+# Pool mode: contexts sharing one headless browser
+DEFAULT_CONTEXTS = 4
+# A district can take a long time; keep its job leased for an hour
+DISTRICT_LEASE_SECONDS = 3600
+
+# Submits of one act query before a wrong captcha is given up on
+MAX_CAPTCHA_ATTEMPTS = 4
+CAPTCHA_IMAGE = "#div_captcha_act #captcha_image"
+# The captcha image is served by securimage; its refresh link reloads it
+CAPTCHA_ENDPOINT = "securimage"
+
+
+# Reads every option of a <select> as [text, value] in a single round trip
+SNAPSHOT_OPTIONS_JS = "(options) => options.map(option => [option.textContent, option.getAttribute('value')])"
+# Dropdown snapshots older than this are read from the page again
+SNAPSHOT_MAX_AGE = 30 * 24 * 3600
+
+
+# Function to split the (text, value) options of the court complex dropdown into
+# names and codes, skipping the 'Select Court Complex' placeholder
+def complex_names_and_codes(complex_options):
+    court_complex_names = []
+    court_complex_codes = []
+    for complex_text, complex_value in complex_options:
+        court_complex_name = complex_text.lower().strip().replace(" ", "_")
+        if any(
+            substring in court_complex_name
+            for substring in ["select_court_complex", "select"]
+        ):
+            logging.info("Skipping 'Select Court Complex' option.")
+            continue
+        court_complex_names.append(court_complex_name)
+        court_complex_codes.append(complex_value)
+        logging.info(f"Added court complex: {court_complex_name}.")
+    return court_complex_names, court_complex_codes
 
 
 class CourtNavigator:
-    def __init__(self, url):
+    def __init__(self, url, lean=False):
         self.url = url
+        # Lean mode: headless, small viewport, images/fonts/analytics blocked
+        self.lean = lean
         self.playwright = None
         self.browser = None
+        self.context = None
         self.page = None
+        # browser_session.BrowserSession keeping the page alive between districts
+        self.session = None
+        self.pages_loaded = 0
         self.state_options = None
         self.district_options = None
         self.complex_options = None
         self.complex_2_options = None
         self.connection = None
+        self.writer = None
+        # (selector, *scope) -> [(text, value), ...]; shared by the navigators of a pool
+        self.option_cache = {}
+        self.snapshot_hits = 0
+        self.snapshot_reads = 0
+        # (state_code, district_code, court_code, establishment_code) of the act query
+        # being submitted, as far as known; recorded with every captcha attempt
+        self.captcha_scope = ()
+        # IPC section the act query is filtered on; ALL_SECTIONS leaves the filter empty
+        self.section_number = DEFAULT_SECTION
         self.date = dt.datetime.now().strftime("%Y-%m-%d %H:%M %p")
 
     async def load_page(self):
+        started = time.perf_counter()
         await self.page.goto(self.url)
+        traffic_stats.record_load(time.perf_counter() - started)
+        self.pages_loaded += 1
         if await self.page.locator("#validateError button").is_visible():
             await self.page.locator("#validateError button").click()
         logging.info("Page loaded successfully.")
 
+    # Function to start from a loaded portal page. With a session the page of the last
+    # district is reused and the portal is only loaded into a new or broken page;
+    # without one a browser is launched.
+    async def start_page(self):
+        if self.session is not None:
+            self.page = await self.session.get_page()
+            self.context = self.session.context
+            self.browser = self.session.browser
+            if self.session.ready:
+                if await self.page.locator("#validateError button").is_visible():
+                    await self.page.locator("#validateError button").click()
+            else:
+                await self.load_page()
+                self.session.ready = True
+        else:
+            await self.setup()
+        await self.setup_options()
+
+    # Selecting a state fills the district list through fillDistrict
+    async def select_state(self, state_code):
+        await wait_for_ajax(
+            self.page,
+            FILL_DISTRICT_ENDPOINT,
+            lambda: self.page.locator("#sess_state_code").select_option(state_code),
+            "select state",
+        )
+
+    # Selecting a district fills the court complex list through fillcomplex
+    async def select_district(self, district_code):
+        await wait_for_ajax(
+            self.page,
+            FILL_COMPLEX_ENDPOINT,
+            lambda: self.page.locator("#sess_dist_code").select_option(district_code),
+            "select district",
+        )
+
+    # Selecting a court complex fills the establishment list through
+    # fillCourtEstablishment; waiting on any casestatus call could resolve on an earlier
+    # one and leave the previous complex's establishments in the list
+    async def select_complex(self, complex_code):
+        await wait_for_ajax(
+            self.page,
+            FILL_ESTABLISHMENT_ENDPOINT,
+            lambda: self.page.locator("#court_complex_code").select_option(
+                complex_code
+            ),
+            "select complex",
+        )
+
+    # Selecting an establishment fills the act list through fillActType; like the
+    # complex, waiting on any casestatus call could return before the new acts arrive
+    async def select_establishment(self, est_code):
+        await wait_for_ajax(
+            self.page,
+            FILL_ACT_TYPE_ENDPOINT,
+            lambda: self.page.locator("#court_est_code").select_option(est_code),
+            "select establishment",
+        )
+
+    async def open_act_tab(self):
+        await self.page.locator('//*[@id="act-tabMenu"]').click()
+        await wait_for_options(self.page, "#actcode", "act list")
+
+    # Function to look up the options of the dropdown `selector` for a scope such as
+    # (state_code, district_code), in memory first and then in SQLite. Returns None when
+    # there is no fresh snapshot.
+    def cached_options(self, selector, scope):
+        key = (selector, *scope)
+        options = self.option_cache.get(key)
+        if options is None and self.connection is not None:
+            options = fetch_dropdown_snapshot(
+                self.connection, selector, scope, SNAPSHOT_MAX_AGE
+            )
+            if options is not None:
+                self.option_cache[key] = options
+        if options is not None:
+            self.snapshot_hits += 1
+        return options
+
+    def remember_options(self, selector, scope, options):
+        self.option_cache[(selector, *scope)] = options
+        if self.connection is not None:
+            save_dropdown_snapshot(
+                self.connection, selector, scope, options, self.writer
+            )
+
+    # Function to read all (text, value) options of the dropdown `selector` with one
+    # evaluate_all call instead of two calls per option. With a scope the snapshot is
+    # cached, and a repeat visit is answered without touching the page.
+    async def snapshot_options(self, selector, scope=None):
+        if scope is not None:
+            options = self.cached_options(selector, scope)
+            if options is not None:
+                return options
+        options = [
+            tuple(option)
+            for option in await self.page.locator(f"{selector} option").evaluate_all(
+                SNAPSHOT_OPTIONS_JS
+            )
+        ]
+        self.snapshot_reads += 1
+        logging.info(f"Found {len(options)} options in {selector}.")
+        if scope is not None:
+            self.remember_options(selector, scope, options)
+        return options
+
+    # Function to return (court_code, court_name, establishment options) for every court
+    # complex of a district when all of them are in the snapshot cache, else None
+    def cached_district(self, state_code, district_code):
+        complex_options = self.cached_options(
+            "#court_complex_code", (state_code, district_code)
+        )
+        if complex_options is None:
+            return None
+        courts = []
+        for court_name, code in zip(*complex_names_and_codes(complex_options)):
+            est_options = self.cached_options(
+                "#court_est_code", (state_code, district_code, code)
+            )
+            if est_options is None:
+                return None
+            courts.append((code, court_name, est_options))
+        return courts
+
+    def save_establishments(
+        self, state_code, district_code, code, court_name, est_options
+    ):
+        save_establishments_to_db(
+            self.connection,
+            self.date,
+            state_code,
+            district_code,
+            code,
+            court_name,
+            est_options,
+            writer=self.writer,
+        )
+        logging.info(f"Added {len(est_options)} court_est options of {court_name}.")
+
+    def report_snapshots(self):
+        line = f"{self.snapshot_hits} served from cache, {self.snapshot_reads} read from the page"
+        print(f"Dropdown snapshots: {line}")
+        logging.info(f"Dropdown snapshots: {line}")
+
     @retry(
         stop=stop_after_attempt(5), wait=wait_exponential(multiplier=1, min=2, max=10)
     )
     async def setup(self):
         logging.info("Starting Playwright and launching browser.")
         self.playwright = await async_playwright().start()
-        self.browser = await self.playwright.chromium.launch(headless=False)
-        self.page = await self.browser.new_page()
-        await self.page.goto(self.url)
-        if await self.page.locator("#validateError button").is_visible():
-            await self.page.locator("#validateError button").click()
+        self.browser = await launch_chromium(
+            self.playwright, headless=False, lean=self.lean
+        )
+        self.context = await self.browser.new_context(**context_options(self.lean))
+        await prepare_context(self.context, self.lean)
+        self.page = await self.context.new_page()
+        await self.load_page()
         logging.info("Browser launched and initial page setup completed.")
 
     async def setup_options(self):
@@ -86,19 +331,13 @@ class CourtNavigator:
 
     async def get_districts(self):
         logging.info("Getting district options.")
-        district_options = self.page.locator("#sess_dist_code option")
         await self.page.wait_for_selector("#sess_dist_code", state="visible")
-        await asyncio.sleep(5)  # Ensure content is fully loaded
-        district_count = await district_options.count()
-        logging.info(f"Found {district_count} district options.")
-
-        for district_i in range(district_count):
-            logging.info(f"Processing district {district_i + 1}.")
-            district_option = district_options.nth(district_i)
-            district_text = await district_option.text_content()
+        await wait_for_options(self.page, "#sess_dist_code", "district list")
+
+        for district_text, district_value in await self.snapshot_options(
+            "#sess_dist_code"
+        ):
             district_name_for_filename = district_text.lower().strip().replace(" ", "_")
-            await asyncio.sleep(3)
-            district_value = await district_option.get_attribute("value")
 
             if any(
                 substring in district_name_for_filename
@@ -113,21 +352,15 @@ class CourtNavigator:
         logging.error("No valid district found.")
         return None
 
-    async def download_act_codes(self, output_file="act_codes.csv"):
+    async def download_act_codes(self, output_file="act_codes.csv", scope=None):
         logging.info("Downloading act codes.")
-        act_options = self.page.locator("#actcode option")
         await self.page.wait_for_selector("#actcode", state="visible")
-        await asyncio.sleep(5)  # Ensure content is fully loaded
-
-        act_count = await act_options.count()
-        logging.info(f"Found {act_count} act options.")
+        await wait_for_options(self.page, "#actcode", "act list")
 
-        act_list = []
-        for i in range(act_count):
-            option = act_options.nth(i)
-            act_text = await option.text_content()
-            act_value = await option.get_attribute("value")
-            act_list.append({"Act Name": act_text, "Act Code": act_value})
+        act_list = [
+            {"Act Name": act_text, "Act Code": act_value}
+            for act_text, act_value in await self.snapshot_options("#actcode", scope)
+        ]
 
         with open(output_file, mode="w", newline="") as file:
             writer = csv.DictWriter(file, fieldnames=["Act Name", "Act Code"])
@@ -136,64 +369,31 @@ class CourtNavigator:
 
         logging.info(f"Act codes successfully downloaded to {output_file}")
 
-    async def get_court_complexes(self):
+    # `scope` is (state_code, district_code) to cache the list
+    async def get_court_complexes(self, scope=None):
         logging.info("Getting court complex options.")
-        complex_options = self.page.locator("#court_complex_code option")
         await self.page.wait_for_selector("#court_complex_code", state="visible")
-        await asyncio.sleep(5)  # Ensure content is fully loaded
-
-        complex_count = await complex_options.count()
-        logging.info(f"Found {complex_count} court complex options.")
-        court_complex_names = []
-        court_complex_codes = []
-
-        for complex_i in range(complex_count):
-            logging.info(f"Processing court complex {complex_i + 1}.")
-            complex_option = complex_options.nth(complex_i)
-            complex_text = await complex_option.text_content()
-            court_complex_name = complex_text.lower().strip().replace(" ", "_")
-            complex_value = await complex_option.get_attribute("value")
-
-            if any(
-                substring in court_complex_name
-                for substring in ["select_court_complex", "select"]
-            ):
-                logging.info("Skipping 'Select Court Complex' option.")
-                continue
-            else:
-                court_complex_names.append(court_complex_name)
-                court_complex_codes.append(complex_value)
-                logging.info(f"Added court complex: {court_complex_name}.")
+        await wait_for_options(self.page, "#court_complex_code", "complex list")
 
-        return court_complex_names, court_complex_codes
+        return complex_names_and_codes(
+            await self.snapshot_options("#court_complex_code", scope)
+        )
 
-    async def extract_ipc_related_codes(self):
+    async def extract_ipc_related_codes(self, scope=None):
         logging.info("Extracting IPC-related codes.")
         if await self.page.locator("#validateError button").is_visible():
             await self.page.locator("#validateError button").click()
 
         if await self.page.locator("#actcode").is_visible():
-            act_options = self.page.locator("#actcode option")
             await self.page.wait_for_selector("#actcode", state="visible")
-            await asyncio.sleep(5)  # Ensure content is fully loaded
-
-            act_count = await act_options.count()
-            logging.info(f"Found {act_count} act options.")
+            await wait_for_options(self.page, "#actcode", "act list")
 
             ipc_regex = re.compile(
                 r"^(I.P.C|IPC|Indian Penal Code)\b.*$", re.IGNORECASE
             )
             ipc_related_options = []
 
-            for i in range(act_count):
-                if await self.page.locator("#validateError button").is_visible():
-                    await self.page.locator("#validateError button").click()
-
-                option = act_options.nth(i)
-                if await self.page.locator("#validateError button").is_visible():
-                    await self.page.locator("#validateError button").click()
-
-                act_text = await option.text_content()
+            for act_text, _ in await self.snapshot_options("#actcode", scope):
                 logging.info(f"ACT TEXT: {act_text}")
 
                 if ipc_regex.search(act_text):
@@ -203,8 +403,10 @@ class CourtNavigator:
             logging.info(f"All IPC-related codes: {ipc_related_options}")
             return ipc_related_options
 
-    async def process_act_codes(self, section_number="302"):
+    async def process_act_codes(self, section_number=None):
         logging.info("Processing act codes.")
+        if section_number is None:
+            section_number = self.section_number
         ipc_related_codes = await self.extract_ipc_related_codes()
 
         if ipc_related_codes:
@@ -214,13 +416,11 @@ class CourtNavigator:
                 await self.page.locator("#validateError button").click()
 
             await self.page.locator("#actcode").select_option(value=first_ipc_code)
-            await asyncio.sleep(5)  # Increased wait time after selecting option
 
             if await self.page.locator("#validateError button").is_visible():
                 await self.page.locator("#validateError button").click()
 
-            await self.page.locator("#under_sec").fill("302")
-            await asyncio.sleep(5)  # Increased wait time after filling field
+            await self.page.locator("#under_sec").fill(section_filter(section_number))
 
             if await self.page.locator("#validateError button").is_visible():
                 await self.page.locator("#validateError button").click()
@@ -232,67 +432,120 @@ class CourtNavigator:
             if await self.page.locator("#validateError button").is_visible():
                 await self.page.locator("#validateError button").click()
 
-            answer = await self.fix_captcha()
-            await asyncio.sleep(5)  # Increased wait time after filling captcha
-            await self.page.locator("#act_captcha_code").fill(answer)
-            await asyncio.sleep(60)  # Increased wait time after filling captcha
-            if await self.page.locator("#validateError button").is_visible():
-                await self.page.locator("#validateError button").click()
+            await self.submit_with_captcha()
 
-            logging.info("Captcha entered.")
+            await wait_for_idle(self.page, "results rendered")
 
-            # TO-DO - Add a check for the captcha error message
+            page_content = await self.page.content()
+            # print("Page content from processing code:", page_content)
+            return page_content
+        else:
+            logging.error("No IPC-related codes found.")
+            return None
 
-            await asyncio.sleep(5)  # Increased wait time after filling captcha
+    # Function to fill in the captcha and submit the act form, checking the submitAct
+    # response. A refused captcha is refreshed, solved again and resubmitted, up to
+    # MAX_CAPTCHA_ATTEMPTS times; then CaptchaRejected is raised so that no error page
+    # is stored as a result. So is a submit whose outcome is unknown (no response or
+    # an unclear one); it is counted apart and not recorded as an attempt. Only
+    # captchas the response shows as accepted grow the template solver's corpus.
+    async def submit_with_captcha(self):
+        for attempt in range(1, MAX_CAPTCHA_ATTEMPTS + 1):
+            captcha_image, answer, confidence = await self.read_captcha()
+            await self.page.locator("#act_captcha_code").fill(answer)
+            logging.info(f"Captcha entered (attempt {attempt}).")
 
             if await self.page.locator("#validateError button").is_visible():
                 await self.page.locator("#validateError button").click()
 
-            await self.page.locator(
-                "#frm_act > div:nth-child(5) > div.col-md-auto > button"
-            ).click()
+            # Resolves on the submitAct response; the fixed sleeps this step used to
+            # take (form fields, captcha, results) added up to 90 seconds
+            response_text = await wait_for_ajax_response(
+                self.page,
+                SUBMIT_ACT_ENDPOINT,
+                self.page.locator(
+                    "#frm_act > div:nth-child(5) > div.col-md-auto > button"
+                ).click,
+                "submitAct",
+                replaced_sleep=85,
+            )
             logging.info("Submit button clicked.")
 
-            if await self.page.locator("#validateError button").is_visible():
-                await self.page.locator("#validateError button").click()
-
-            await self.page.wait_for_load_state("networkidle")
-            await asyncio.sleep(5)  # Increased wait time after page load
+            rejected = captcha_rejected(response_text)
+            error_button = self.page.locator("#validateError button")
+            if await error_button.is_visible():
+                error_text = await self.page.locator("#validateError").text_content()
+                rejected = rejected or "captcha" in (error_text or "").lower()
+                await error_button.click()
+
+            if not rejected and not captcha_accepted(response_text):
+                captcha_stats.record_unknown()
+                logging.warning(
+                    f"No clear submitAct response for captcha '{answer}' on attempt "
+                    f"{attempt}; trying again."
+                )
+                await self.refresh_captcha()
+                continue
 
-            page_content = await self.page.content()
-            await self.page.wait_for_timeout(5000)
-            # print("Page content from processing code:", page_content)
-            return page_content
-        else:
-            logging.error("No IPC-related codes found.")
-            return None
+            captcha_stats.record_submit(not rejected)
+            save_captcha_attempt(
+                self.connection,
+                self.captcha_scope,
+                attempt,
+                answer,
+                confidence,
+                not rejected,
+                self.writer,
+            )
+            if not rejected:
+                if captcha_image is not None and answer:
+                    save_labelled_captcha(captcha_image, answer)
+                return attempt
+            logging.warning(f"Captcha '{answer}' rejected on attempt {attempt}.")
+            await self.refresh_captcha()
+
+        captcha_stats.given_up += 1
+        raise CaptchaRejected(
+            f"Captcha not accepted in {MAX_CAPTCHA_ATTEMPTS} submits for "
+            f"{self.captcha_scope}"
+        )
 
-    async def fix_captcha(self):
+    # Function to screenshot and solve the captcha; returns (png bytes, answer,
+    # confidence), or (None, "", 0.0) when there is no captcha on the page
+    async def read_captcha(self):
         if await self.page.locator("#validateError button").is_visible():
             await self.page.locator("#validateError button").click()
 
-        if await self.page.locator("#div_captcha_act #captcha_image").is_visible():
-            captcha_image = await self.page.locator(
-                "#div_captcha_act #captcha_image"
-            ).screenshot(type="png")
-            with open("files/captcha.png", "wb") as fp:
-                # print("Saved as captcha.png")
-                fp.write(captcha_image)
-            image = Image.open("files/captcha.png")
-            # image
-            answer = pytesseract.image_to_string(image).strip()
-            print("Captcha answer:", answer)
-            return answer
+        if await self.page.locator(CAPTCHA_IMAGE).is_visible():
+            captcha_image = await self.page.locator(CAPTCHA_IMAGE).screenshot(
+                type="png"
+            )
+            # Solved in memory on the OCR worker pool; nothing is written to disk
+            answer, confidence = await solve_captcha(captcha_image)
+            print(f"Captcha answer: {answer} (confidence {confidence:.0f})")
+            return captcha_image, answer, confidence
+        logging.error("No captcha image found.")
+        return None, "", 0.0
+
+    # Function to load a new captcha image through the refresh link next to it
+    async def refresh_captcha(self):
+        refresh_link = self.page.locator("#div_captcha_act a").first
+        if await refresh_link.is_visible():
+            await wait_for_ajax(
+                self.page, CAPTCHA_ENDPOINT, refresh_link.click, "captcha refresh"
+            )
         else:
-            logging.error("No captcha image found.")
-            return None
+            await self.page.locator(CAPTCHA_IMAGE).click()
+
+    async def fix_captcha(self):
+        captcha_image, answer, confidence = await self.read_captcha()
+        return answer if captcha_image is not None else None
 
     async def process_state(self, state_option):
         logging.info("Processing state.")
         state_value = await state_option.get_attribute("value")
         state_text = await state_option.text_content()
         state_name_for_filename = state_text.lower().strip().replace(" ", "_")
-        await asyncio.sleep(5)  # Ensure UI is stable
 
         if any(
             substring in state_text for substring in ["select", "state", "select_state"]
@@ -301,27 +554,21 @@ class CourtNavigator:
             return False
         else:
             logging.info(f"Selected state: {state_text}.")
-            await self.page.locator("#sess_state_code").select_option(state_value)
-            await asyncio.sleep(5)  # Wait after selecting state
+            await self.select_state(state_value)
 
             district_value = await self.get_districts()
             if district_value:
                 logging.info(f"Selected district value: {district_value}.")
-                await self.page.locator("#sess_dist_code").select_option(district_value)
-                await asyncio.sleep(5)  # Wait after selecting district
+                await self.select_district(district_value)
 
                 court_names, court_codes = await self.get_court_complexes()
                 if court_codes:
                     for idx, code in enumerate(court_codes):
                         logging.info(f"Selecting court complex with code: {code}.")
-                        await self.page.locator("#court_complex_code").select_option(
-                            code
-                        )
-                        await asyncio.sleep(5)  # Wait after selecting court complex
+                        await self.select_complex(code)
 
                         court_name = court_names[idx]
-                        await self.page.locator('//*[@id="act-tabMenu"]').click()
-                        await asyncio.sleep(5)  # Wait after clicking ACT tab
+                        await self.open_act_tab()
 
                         await self.process_act_codes()
                         logging.info(
@@ -337,7 +584,7 @@ class CourtNavigator:
         logging.info("Navigating state options.")
         state_options = self.page.locator("#sess_state_code option")
         await self.page.wait_for_selector("#sess_state_code", state="visible")
-        await asyncio.sleep(5)  # Ensure content is fully loaded
+        await wait_for_options(self.page, "#sess_state_code", "state list")
 
         state_count = await state_options.count()
         logging.info(f"Found {state_count} state options.")
@@ -363,68 +610,43 @@ class CourtNavigator:
 
         # Locate state options and count them
         # state_options = self.page.locator("#sess_state_code option")
-        state_count = await self.state_options.count()
-        logging.info(f"Found {state_count} state options.")
-
-        # Print and log the state options
-        state_names = await self.state_options.evaluate_all(
-            "(options) => options.map(option => option.textContent)"
-        )
-        state_values = await self.state_options.evaluate_all(
-            "(options) => options.map(option => option.getAttribute('value'))"
-        )
+        state_snapshot = await self.snapshot_options("#sess_state_code")
+        state_names = [state_name for state_name, _ in state_snapshot]
+        state_values = [state_value for _, state_value in state_snapshot]
         print("State Options Available:")
         print("State Names:", state_names)
         print("State Values:", state_values)
 
-        insert_sql = self.create_insert_query(state_names, state_values)
+        state_rows = self.create_state_rows(state_names, state_values)
         try:
-            insert_data(self.connection, insert_sql)
+            save_states_to_db(self.connection, state_rows, self.writer)
         except Exception as e:
             logging.error(f"Error inserting data: {e}")
 
-    def create_insert_query(self, state_names, state_codes):
+    def create_state_rows(self, state_names, state_codes):
         # Ensure the lists are of the same length
         if len(state_names) != len(state_codes):
             raise ValueError("state_names and state_codes must have the same length")
 
-        # Generate the SQL statement
-        insert_sql = "INSERT INTO States (state_name, state_code) VALUES "
+        # Parameterized (state_name, state_code) rows for INSERT_STATE_SQL
+        state_rows = list(zip(state_names, state_codes))
+        print(state_rows)
 
-        # List to hold each row's SQL
-        values_sql = []
-
-        for name, code in zip(state_names, state_codes):
-            values_sql.append(f"('{name}', '{code}')")
-
-        # Join all values into the final SQL statement
-        insert_sql += ", ".join(values_sql) + ";"
-
-        # Print or execute the SQL statement
-        print(insert_sql)
-
-        return insert_sql
+        return state_rows
 
     async def navigate_district(self, state_code):
         logging.info("Navigating district options.")
         # district_options = self.page.locator("#sess_dist_code option")
         await self.page.wait_for_selector("#sess_dist_code", state="visible")
-        await asyncio.sleep(5)
-        district_count = await self.page.locator("#sess_dist_code option").count()
-        logging.info(f"Found {district_count} district options.")
-        # Get all district options in one go
-        district_elements = await self.page.locator(
-            "#sess_dist_code option"
-        ).evaluate_all(
-            "(options) => options.map(option => ({text: option.textContent.trim(), value: option.getAttribute('value')}))"
-        )
+        await wait_for_options(self.page, "#sess_dist_code", "district list")
+        district_options = await self.snapshot_options("#sess_dist_code", (state_code,))
 
         # Filter out invalid options and extract names and codes
         valid_districts = [
-            (district["text"], district["value"])
-            for district in district_elements
+            (district_text.strip(), district_value)
+            for district_text, district_value in district_options
             if not any(
-                substring in district["text"].lower()
+                substring in district_text.lower()
                 for substring in ["select", "select_district"]
             )
         ]
@@ -446,120 +668,121 @@ class CourtNavigator:
         state_codes = custom_query(self.connection, query_sql)
         state_codes = [code[0] for code in state_codes]
 
-        for state_code in state_codes[1:]:
-            logging.info(f"Processing state {state_code}.")
-            await self.page.locator("#sess_state_code").select_option(state_code)
-            await asyncio.sleep(5)
-            district_names, district_codes = await self.navigate_district(state_code)
-            await self.page.locator("#sess_state_code").select_option(state_code)
-            await asyncio.sleep(5)
-            # court_names, court_codes = await self.get_court_complexes()
-            insert_sql = await self.create_district_query(
-                state_code, district_names, district_codes
-            )
-            print("We got the insert sql")
-            print(insert_sql)
-            try:
-                print("We are here")
-                insert_data(self.connection, insert_sql)
-            except Exception as e:
-                logging.error(f"Error inserting data: {e}")
+        # One 'districts' job per state, skipping the 'Select state' placeholder row
+        enqueue_jobs(
+            self.connection,
+            STAGE_DISTRICTS,
+            ((state_code, [state_code]) for state_code in state_codes[1:]),
+        )
 
-            await asyncio.sleep(5)
+        for job_id, (state_code,) in iter_jobs(self.connection, STAGE_DISTRICTS):
+            logging.info(f"Processing state {state_code}.")
+            with write_unit(self.writer):
+                try:
+                    await self.select_state(state_code)
+                    district_names, district_codes = await self.navigate_district(
+                        state_code
+                    )
+                    await self.page.locator("#sess_state_code").select_option(
+                        state_code
+                    )
+                    # court_names, court_codes = await self.get_court_complexes()
+                    district_rows = self.create_district_rows(
+                        state_code, district_names, district_codes
+                    )
+                    save_districts_to_db(self.connection, district_rows, self.writer)
+                except Exception as e:
+                    logging.error(f"Error inserting data: {e}")
+                    fail_job(self.connection, job_id, e)
+                    continue
+                complete_job(self.connection, job_id, self.writer)
 
     async def get_court_complexes_3(self, state_code, district_code):
-        await self.setup()
-        await self.setup_options()
+        cached_courts = self.cached_district(state_code, district_code)
+        if cached_courts is not None:
+            logging.info(
+                f"District {state_code}:{district_code} served from dropdown snapshots."
+            )
+            for code, court_name, est_options in cached_courts:
+                self.save_establishments(
+                    state_code, district_code, code, court_name, est_options
+                )
+            return
+
+        await self.start_page()
         # Wait for the state dropdown to be visible
         await self.page.wait_for_selector("#sess_state_code", state="visible")
-        await self.page.locator("#sess_state_code").select_option(state_code)
+        await self.select_state(state_code)
         # Wait for the district dropdown to be visible
         try:
             await self.page.wait_for_selector("#sess_dist_code", state="visible")
-            await self.page.locator("#sess_dist_code").select_option(district_code)
+            await self.select_district(district_code)
         except Exception as e:
-            await self.setup()
-            await self.setup_options()
+            if self.session is not None:
+                self.session.mark_broken()
+            await self.start_page()
             # Wait for the state dropdown to be visible
             await self.page.wait_for_selector("#sess_state_code", state="visible")
-            await self.page.locator("#sess_state_code").select_option(state_code)
+            await self.select_state(state_code)
             await self.page.wait_for_selector("#sess_dist_code", state="visible")
-            await self.page.locator("#sess_dist_code").select_option(district_code)
-
-        await asyncio.sleep(5)
+            await self.select_district(district_code)
 
-        court_names, court_codes = await self.get_court_complexes()
+        court_names, court_codes = await self.get_court_complexes(
+            (state_code, district_code)
+        )
 
         if court_codes:
             for idx, code in enumerate(court_codes):
                 court_name = court_names[idx]
-                logging.info(f"Selecting court complex with code: {code}.")
-                await self.page.locator("#court_complex_code").select_option(code)
-                await asyncio.sleep(5)  # Wait after selecting court complex
+                est_scope = (state_code, district_code, code)
+                # Complexes read on an earlier, interrupted visit need no selecting
+                est_options = self.cached_options("#court_est_code", est_scope)
+                if est_options is None:
+                    logging.info(f"Selecting court complex with code: {code}.")
+                    await self.select_complex(code)
 
-                if await self.page.locator("#validateError button").is_visible():
-                    await self.page.locator("#validateError button").click()
+                    if await self.page.locator("#validateError button").is_visible():
+                        await self.page.locator("#validateError button").click()
 
-                logging.info(f"Processing court complex_2 {court_names[idx]}.")
-                if await self.page.locator("#court_est_code").is_visible():
-                    logging.info("Selector #court_est_code found. ")
-                    await self.page.wait_for_selector(
-                        "#court_est_code", state="visible"
-                    )
-                    await asyncio.sleep(5)  # Ensure content is fully loaded
-                    court_est_options = self.page.locator("#court_est_code option")
-                    court_est_count = await court_est_options.count()
-                    logging.info(f"Found {court_est_count} court_est options.")
-                    court_est_names = []
-                    court_est_codes = []
-                    for idx in range(court_est_count):
-                        court_est_option = court_est_options.nth(idx)
-                        court_est_text = await court_est_option.text_content()
-                        court_est_value = await court_est_option.get_attribute("value")
-                        save_codes_to_db(
-                            self.connection,
-                            self.date,
-                            state_code,
-                            district_code,
-                            code,
-                            court_name,
-                            court_est_value,
-                            court_est_text,
+                    logging.info(f"Processing court complex_2 {court_names[idx]}.")
+                    if await self.page.locator("#court_est_code").is_visible():
+                        logging.info("Selector #court_est_code found. ")
+                        await self.page.wait_for_selector(
+                            "#court_est_code", state="visible"
                         )
-                        court_est_names.append(court_est_text)
-                        court_est_codes.append(court_est_value)
-                        logging.info(f"Added court_est: {court_est_text}.")
-                else:
-                    save_codes_to_db(
-                        self.connection,
-                        self.date,
-                        state_code,
-                        district_code,
-                        code,
-                        court_name,
-                        "E003: No court establishment found",
-                        "E003: No court establishment found",
-                    )
+                        await wait_for_options(
+                            self.page, "#court_est_code", "establishment list"
+                        )
+                        est_options = await self.snapshot_options(
+                            "#court_est_code", est_scope
+                        )
+                    else:
+                        est_options = []
+                        self.remember_options("#court_est_code", est_scope, est_options)
+                self.save_establishments(
+                    state_code, district_code, code, court_name, est_options
+                )
 
     async def get_court_complexes_2(self, state_code, district_code):
         # await self.setup()
         # await self.setup_options()
         # Wait for the state dropdown to be visible
         await self.page.wait_for_selector("#sess_state_code", state="visible")
-        await self.page.locator("#sess_state_code").select_option(state_code)
+        await self.select_state(state_code)
         # Wait for the district dropdown to be visible
         await self.page.wait_for_selector("#sess_dist_code", state="visible")
-        await self.page.locator("#sess_dist_code").select_option(district_code)
-        await asyncio.sleep(5)
+        await self.select_district(district_code)
 
-        court_names, court_codes = await self.get_court_complexes()
+        court_names, court_codes = await self.get_court_complexes(
+            (state_code, district_code)
+        )
 
         if court_codes:
             for idx, code in enumerate(court_codes):
                 court_name = court_names[idx]
+                est_scope = (state_code, district_code, code)
                 logging.info(f"Selecting court complex with code: {code}.")
-                await self.page.locator("#court_complex_code").select_option(code)
-                await asyncio.sleep(5)  # Wait after selecting court complex
+                await self.select_complex(code)
 
                 if await self.page.locator("#validateError button").is_visible():
                     await self.page.locator("#validateError button").click()
@@ -570,19 +793,14 @@ class CourtNavigator:
                     await self.page.wait_for_selector(
                         "#court_est_code", state="visible"
                     )
-                    await asyncio.sleep(5)  # Ensure content is fully loaded
-                    court_est_options = self.page.locator("#court_est_code option")
-                    court_est_count = await court_est_options.count()
-                    logging.info(f"Found {court_est_count} court_est options.")
-                    court_est_names = []
-                    court_est_codes = []
-                    for idx in range(court_est_count):
-                        court_est_option = court_est_options.nth(idx)
-                        court_est_text = await court_est_option.text_content()
-                        court_est_value = await court_est_option.get_attribute("value")
-                        court_est_names.append(court_est_text)
-                        court_est_codes.append(court_est_value)
-                        logging.info(f"Added court_est: {court_est_text}.")
+                    await wait_for_options(
+                        self.page, "#court_est_code", "establishment list"
+                    )
+                    est_options = await self.snapshot_options(
+                        "#court_est_code", est_scope
+                    )
+                    court_est_names = [text for text, _ in est_options]
+                    court_est_codes = [value for _, value in est_options]
 
                     for idx, code in enumerate(court_est_codes):
                         court_est_name = court_est_names[idx]
@@ -600,25 +818,26 @@ class CourtNavigator:
                             ).is_visible():
                                 await self.page.locator("#validateError button").click()
                             logging.info(f"Selecting court_est with code: {code}.")
-                            await self.page.locator("#court_est_code").select_option(
-                                code
-                            )
-                            await asyncio.sleep(5)
+                            await self.select_establishment(code)
 
                             if await self.page.locator(
                                 "#validateError button"
                             ).is_visible():
                                 await self.page.locator("#validateError button").click()
 
-                            await self.page.locator('//*[@id="act-tabMenu"]').click()
-                            await asyncio.sleep(5)  # Wait after clicking ACT tab
+                            await self.open_act_tab()
 
                             if await self.page.locator(
                                 "#validateError button"
                             ).is_visible():
                                 await self.page.locator("#validateError button").click()
 
-                            page_content = await self.process_act_codes()
+                            self.captcha_scope = est_scope + (code,)
+                            try:
+                                page_content = await self.process_act_codes()
+                            except CaptchaRejected as e:
+                                logging.error(f"Skipping {court_est_name}: {e}")
+                                continue
                             if page_content is None:
                                 logging.info(
                                     f"Completed processing for {court_name}. No page content."
@@ -664,13 +883,17 @@ class CourtNavigator:
                     if await self.page.locator("#validateError button").is_visible():
                         await self.page.locator("#validateError button").click()
 
-                    await self.page.locator('//*[@id="act-tabMenu"]').click()
-                    await asyncio.sleep(5)  # Wait after clicking ACT tab
+                    await self.open_act_tab()
 
                     if await self.page.locator("#validateError button").is_visible():
                         await self.page.locator("#validateError button").click()
 
-                    page_content = await self.process_act_codes()
+                    self.captcha_scope = (state_code, district_code, code, "")
+                    try:
+                        page_content = await self.process_act_codes()
+                    except CaptchaRejected as e:
+                        logging.error(f"Skipping {court_name}: {e}")
+                        continue
                     if page_content is None:
                         logging.info(
                             f"Completed processing for {court_name}. No page content."
@@ -709,31 +932,21 @@ class CourtNavigator:
 
                 # return False
 
-    async def create_district_query(self, state_code, district_names, district_codes):
+    def create_district_rows(self, state_code, district_names, district_codes):
         # Ensure the lists are of the same length
         if len(district_names) != len(district_codes):
             raise ValueError(
                 "district_names and district_codes must have the same length"
             )
 
-        # Generate the SQL statement
-        insert_sql = (
-            "INSERT INTO Districts (state_code, district_name, district_code) VALUES "
-        )
-
-        # List to hold each row's SQL
-        values_sql = []
-
-        for name, code in zip(district_names, district_codes):
-            values_sql.append(f"('{state_code}', '{name}', '{code}')")
-
-        # Join all values into the final SQL statement
-        insert_sql += ", ".join(values_sql) + ";"
-
-        # Print or execute the SQL statement
-        print(insert_sql)
+        # Parameterized (state_code, district_name, district_code) rows for INSERT_DISTRICT_SQL
+        district_rows = [
+            (state_code, name, code)
+            for name, code in zip(district_names, district_codes)
+        ]
+        print(district_rows)
 
-        return insert_sql
+        return district_rows
 
     async def process_state_2(self, state_name, state_value):
         # Process each state and break after the first successful processing
@@ -748,12 +961,22 @@ class CourtNavigator:
 
     async def set_state(self, state_name, state_value):
         logging.info(f"Setting state to {state_name}.")
-        await self.state_options.select_option(state_value)
-        await asyncio.sleep(5)
+        await wait_for_ajax(
+            self.page,
+            FILL_DISTRICT_ENDPOINT,
+            lambda: self.state_options.select_option(state_value),
+            "select state",
+        )
 
         state_name_for_filename = state_name.lower().strip().replace(" ", "_")
 
     async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session.report()
+            return
+        if self.browser is None:
+            return
         logging.info("Closing the browser.")
         await self.browser.close()
         await self.playwright.stop()
@@ -772,8 +995,11 @@ class CourtNavigator:
         else:
             logging.info("Connection to SQLite database established.")
 
-        # Create a table
-        create_table(self.connection)
+        # Inserts are batched by a background writer with its own connection
+        self.writer = BatchWriter(db_file)
+
+        # Create or upgrade the tables
+        migrate(self.connection)
 
         # return self.connection
         return self.connection
@@ -866,10 +1092,12 @@ class CourtNavigator:
                     )
 
 
-async def main():
+async def main(lean=False):
     print("----------------Starting main function----------------")
-    url = "https://services.ecourts.gov.in/ecourtindia_v6/?p=casestatus"
-    navigator = CourtNavigator(url)
+    url = ECOURTS_CASE_STATUS_URL
+    navigator = CourtNavigator(url, lean=lean)
+    # One browser for the whole run instead of one per district
+    navigator.session = BrowserSession(headless=False, lean=lean)
 
     try:
         # await navigator.setup()
@@ -877,27 +1105,39 @@ async def main():
         connect = await navigator.setup_db()
         navigator.connection = connect
         # await navigator.navigate_state()
-        # print("Creating district table.")
-        # print(navigator.connection)
-        # create_district_table(navigator.connection)
-        # print("District table created.")
         # await navigator.process_states_3()
         # drop_table(navigator.connection, "CourtPages")
-        # create_html_table(navigator.connection)
-        create_court_table(navigator.connection)
-        print("Courts table created.")
         rows = fetch_first_two_rows(navigator.connection)
         if rows:
-            for row in rows:
-                state_code, district_name, district_code = row
+            # One 'courts' job per district; districts finished by an earlier run are skipped
+            enqueue_jobs(
+                navigator.connection,
+                STAGE_COURTS,
+                (
+                    (f"{state_code}:{district_code}", [state_code, district_code])
+                    for state_code, district_name, district_code in rows
+                ),
+            )
+            for job_id, (state_code, district_code) in iter_jobs(
+                navigator.connection, STAGE_COURTS
+            ):
                 print(f"State Code: {state_code}, District Name: {district_code}")
                 # State - Karnataka - 3, District - Udupi - 16
                 # State - Karnataka - 3, District - Chamrajnagar - 27
                 # State - Assam - 6, District - Hojai - 30
                 # State - Punjab - 22, District - Amritsar - 8
                 # await navigator.get_court_complexes_2("22", "8")
-                await navigator.get_court_complexes_3(state_code, district_code)
-                await navigator.browser.close()
+                with write_unit(navigator.writer):
+                    try:
+                        await navigator.get_court_complexes_3(state_code, district_code)
+                    except Exception as e:
+                        logging.error(f"Error processing district {district_code}: {e}")
+                        fail_job(navigator.connection, job_id, e)
+                        navigator.session.mark_broken()
+                    else:
+                        complete_job(navigator.connection, job_id, navigator.writer)
+                    finally:
+                        await navigator.session.save_state()
                 print("Processing next row.")
                 # break
         else:
@@ -908,10 +1148,153 @@ async def main():
         # connect.close()
         logging.error(f"An error occurred: {e}")
     finally:
+        if navigator.writer:
+            navigator.writer.close()
         connect.commit()
         connect.close()
         await navigator.close()
+        wait_stats.report()
+        traffic_stats.report()
+        captcha_stats.report()
+        close_ocr_pool()
+        navigator.report_snapshots()
+
+
+# Pool mode: one headless browser and `contexts` navigators, each with a BrowserSession
+# (own context, cookies and state file) in that browser, taking district ('courts')
+# jobs from the shared queue. A context is recycled after `pages_per_context` districts
+# or when its page outgrows the memory budget; after an error the page is reloaded.
+async def main_pool(
+    contexts=DEFAULT_CONTEXTS,
+    pages_per_context=DEFAULT_PAGES_PER_CONTEXT,
+    headless=True,
+    lean=False,
+):
+    print("----------------Starting pool mode----------------")
+    coordinator = CourtNavigator(ECOURTS_CASE_STATUS_URL)
+    connection = await coordinator.setup_db()
+    rows = fetch_first_two_rows(connection)
+    if not rows:
+        logging.error("No rows found.")
+        coordinator.writer.close()
+        connection.close()
+        return
+    enqueue_jobs(
+        connection,
+        STAGE_COURTS,
+        (
+            (f"{state_code}:{district_code}", [state_code, district_code])
+            for state_code, district_name, district_code in rows
+        ),
+    )
+
+    stats = RunStats("navigator_pool")
+    playwright = await async_playwright().start()
+    browser = await launch_chromium(playwright, headless=headless, lean=lean)
+    idle_navigators = asyncio.Queue()
+    navigators = []
+    try:
+        for index in range(contexts):
+            navigator = CourtNavigator(ECOURTS_CASE_STATUS_URL, lean=lean)
+            navigator.connection = connection
+            navigator.writer = coordinator.writer
+            navigator.option_cache = coordinator.option_cache
+            navigator.session = BrowserSession(
+                state_file=f"browser-state-{index}.json",
+                pages_per_context=pages_per_context,
+                browser=browser,
+                lean=lean,
+            )
+            navigators.append(navigator)
+            idle_navigators.put_nowait(navigator)
+
+        async def worker(job):
+            job_id, (state_code, district_code) = job
+            navigator = await idle_navigators.get()
+            with coordinator.writer.unit():
+                try:
+                    print(f"State Code: {state_code}, District Name: {district_code}")
+                    await navigator.get_court_complexes_3(state_code, district_code)
+                except Exception as e:
+                    logging.error(f"Error processing district {district_code}: {e}")
+                    fail_job(connection, job_id, e)
+                    navigator.session.mark_broken()
+                    raise
+                else:
+                    complete_job(connection, job_id, coordinator.writer)
+                finally:
+                    await navigator.session.save_state()
+                    idle_navigators.put_nowait(navigator)
+
+        await run_workers(
+            iter_jobs(
+                connection,
+                STAGE_COURTS,
+                batch_size=contexts,
+                lease_seconds=DISTRICT_LEASE_SECONDS,
+            ),
+            worker,
+            concurrency=contexts,
+            stats=stats,
+        )
+    finally:
+        for navigator in navigators:
+            await navigator.close()
+        await browser.close()
+        await playwright.stop()
+        coordinator.writer.close()
+        connection.commit()
+        connection.close()
+    stats.report()
+    wait_stats.report()
+    traffic_stats.report()
+    captcha_stats.report()
+    close_ocr_pool()
+    for navigator in navigators:
+        coordinator.snapshot_hits += navigator.snapshot_hits
+        coordinator.snapshot_reads += navigator.snapshot_reads
+    coordinator.report_snapshots()
+    return stats
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    parser = argparse.ArgumentParser(description="Crawl courts and establishments.")
+    parser.add_argument(
+        "--pool",
+        action="store_true",
+        help="Share one headless browser between several contexts.",
+    )
+    parser.add_argument(
+        "--contexts",
+        type=int,
+        default=DEFAULT_CONTEXTS,
+        help="Number of browser contexts (districts crawled at once) in pool mode.",
+    )
+    parser.add_argument(
+        "--pages-per-context",
+        type=int,
+        default=DEFAULT_PAGES_PER_CONTEXT,
+        help="Districts after which a context is replaced in pool mode.",
+    )
+    parser.add_argument(
+        "--headed",
+        action="store_true",
+        help="Show the browser in pool mode.",
+    )
+    parser.add_argument(
+        "--lean",
+        action="store_true",
+        help="Headless, small viewport, and block images, fonts and analytics.",
+    )
+    args = parser.parse_args()
+    if args.pool:
+        asyncio.run(
+            main_pool(
+                contexts=args.contexts,
+                pages_per_context=args.pages_per_context,
+                headless=not args.headed,
+                lean=args.lean,
+            )
+        )
+    else:
+        asyncio.run(main(lean=args.lean))
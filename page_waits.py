@@ -0,0 +1,140 @@
+import logging
+import time
+
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+
+DEFAULT_WAIT_TIMEOUT = 20  # seconds
+
+
+# Collects how long each kind of wait really took, next to the fixed sleep it replaced,
+# so that a run can report the time saved
+class WaitStats:
+    def __init__(self):
+        self.steps = {}
+
+    def record(self, step, elapsed, replaced_sleep, timed_out):
+        count, waited, replaced, timeouts = self.steps.get(step, (0, 0.0, 0.0, 0))
+        self.steps[step] = (
+            count + 1,
+            waited + elapsed,
+            replaced + replaced_sleep,
+            timeouts + int(timed_out),
+        )
+
+    def report(self):
+        total_waited = sum(waited for _, waited, _, _ in self.steps.values())
+        total_replaced = sum(replaced for _, _, replaced, _ in self.steps.values())
+        for step, (count, waited, replaced, timeouts) in sorted(self.steps.items()):
+            line = (
+                f"{step}: {count} waits, {waited:.1f}s waited "
+                f"(fixed sleeps: {replaced:.1f}s), {timeouts} timeouts"
+            )
+            print(f"Wait report: {line}")
+            logging.info(f"Wait report: {line}")
+        line = f"total {total_waited:.1f}s waited, {total_replaced - total_waited:.1f}s saved"
+        print(f"Wait report: {line}")
+        logging.info(f"Wait report: {line}")
+
+
+wait_stats = WaitStats()
+
+
+def _finish(step, started, replaced_sleep, timed_out):
+    elapsed = time.perf_counter() - started
+    wait_stats.record(step, elapsed, replaced_sleep, timed_out)
+    if timed_out:
+        logging.warning(f"Wait '{step}' timed out after {elapsed:.2f}s.")
+    else:
+        logging.info(f"Wait '{step}' resolved in {elapsed:.2f}s.")
+    return elapsed
+
+
+# Function to run `action` (e.g. a select_option) and wait for the AJAX response of
+# `endpoint` it triggers, e.g. "casestatus/fillDistrict". A timeout is logged and the
+# caller carries on, like it did after the fixed sleep.
+async def wait_for_ajax(
+    page,
+    endpoint,
+    action,
+    step,
+    timeout=DEFAULT_WAIT_TIMEOUT,
+    replaced_sleep=5,
+):
+    started = time.perf_counter()
+    timed_out = False
+    try:
+        async with page.expect_response(
+            lambda response: endpoint in response.url, timeout=timeout * 1000
+        ) as response_info:
+            await action()
+        response = await response_info.value
+        await response.finished()
+    except PlaywrightTimeoutError:
+        timed_out = True
+    return _finish(step, started, replaced_sleep, timed_out)
+
+
+# Function like wait_for_ajax that returns the body of the response, or None when it
+# timed out, so the caller can check what the portal answered
+async def wait_for_ajax_response(
+    page,
+    endpoint,
+    action,
+    step,
+    timeout=DEFAULT_WAIT_TIMEOUT,
+    replaced_sleep=5,
+):
+    started = time.perf_counter()
+    timed_out = False
+    body = None
+    try:
+        async with page.expect_response(
+            lambda response: endpoint in response.url, timeout=timeout * 1000
+        ) as response_info:
+            await action()
+        response = await response_info.value
+        body = await response.text()
+    except PlaywrightTimeoutError:
+        timed_out = True
+    _finish(step, started, replaced_sleep, timed_out)
+    return body
+
+
+# Function to wait until the <select> `selector` holds at least `min_count` options;
+# the placeholder option is there before the AJAX fill, so the default is 2
+async def wait_for_options(
+    page,
+    selector,
+    step,
+    min_count=2,
+    timeout=DEFAULT_WAIT_TIMEOUT,
+    replaced_sleep=5,
+):
+    started = time.perf_counter()
+    timed_out = False
+    try:
+        await page.wait_for_function(
+            "([selector, minCount]) => "
+            "document.querySelectorAll(selector + ' option').length >= minCount",
+            arg=[selector, min_count],
+            timeout=timeout * 1000,
+        )
+    except PlaywrightTimeoutError:
+        timed_out = True
+    return _finish(step, started, replaced_sleep, timed_out)
+
+
+# Function to wait until the page has had no network traffic for 500 ms
+async def wait_for_idle(
+    page,
+    step,
+    timeout=DEFAULT_WAIT_TIMEOUT,
+    replaced_sleep=5,
+):
+    started = time.perf_counter()
+    timed_out = False
+    try:
+        await page.wait_for_load_state("networkidle", timeout=timeout * 1000)
+    except PlaywrightTimeoutError:
+        timed_out = True
+    return _finish(step, started, replaced_sleep, timed_out)
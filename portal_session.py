@@ -0,0 +1,223 @@
+import asyncio
+import json
+import logging
+import re
+
+from yarl import URL
+
+from fetch_engine import ECOURTS_BASE_URL, post_form_with_retry
+
+# The page that opens a portal session: it sets the PHPSESSID cookie and carries the
+# first app_token
+HANDSHAKE_PAGE = "casestatus"
+# The captcha image of the current session (securimage)
+CAPTCHA_IMAGE_PATH = "vendor/securimage/securimage_show.php"
+# The app_token of a page sits in a hidden input or in a script variable
+APP_TOKEN_PATTERNS = [
+    re.compile(r"id=[\"']app_token[\"'][^>]*value=[\"']([0-9a-f]+)[\"']", re.I),
+    re.compile(r"value=[\"']([0-9a-f]+)[\"'][^>]*id=[\"']app_token[\"']", re.I),
+    re.compile(r"app_token\s*[=:]\s*[\"']([0-9a-f]+)[\"']", re.I),
+]
+APP_TOKEN_JS = "() => { const input = document.querySelector('#app_token, input[name=app_token]'); return input ? input.value : (window.app_token || ''); }"
+# Error messages of a response whose session or app_token is no longer valid
+EXPIRED_MARKERS = ("invalid request", "session expired", "invalid token")
+
+
+# Function to find the app_token in a portal page, or "" if it has none
+def find_app_token(page_html):
+    for pattern in APP_TOKEN_PATTERNS:
+        match = pattern.search(page_html or "")
+        if match:
+            return match.group(1)
+    return ""
+
+
+# Function to read a JSON response into a dict; anything else gives {}
+def response_json(response_text):
+    try:
+        response_data = json.loads(response_text or "")
+    except ValueError:
+        return {}
+    return response_data if isinstance(response_data, dict) else {}
+
+
+def _error_message(response_data):
+    return " ".join(
+        str(response_data.get(key, "")) for key in ("errormsg", "error", "message")
+    ).lower()
+
+
+# Function to tell from a submitAct response whether the portal refused the captcha.
+# A refusal comes back as JSON with an error message mentioning the captcha.
+def captcha_rejected(response_text):
+    return "captcha" in _error_message(response_json(response_text))
+
+
+# Function to tell from a submitAct response whether the portal clearly accepted the
+# captcha: a JSON answer without any error message. No response at all (a timeout) or
+# another error leaves the outcome unknown, which is neither.
+def captcha_accepted(response_text):
+    response_data = response_json(response_text)
+    return bool(response_data) and not _error_message(response_data).strip()
+
+
+# Function to tell whether the portal refused a request because its session or
+# app_token expired
+def session_expired(response_text):
+    message = _error_message(response_json(response_text))
+    return any(marker in message for marker in EXPIRED_MARKERS)
+
+
+# One portal session shared by every HTTP worker of a run: the PHPSESSID cookie lives
+# in the cookie jar of the pooled aiohttp session and the app_token here. The
+# handshake runs once, on first use; every response hands out the next app_token and
+# post() sends the latest one. When the portal says the session expired, one worker
+# starts a new session and the others wait for it instead of starting their own.
+# A captcha answer solved for the session is kept and shared the same way.
+class PortalSession:
+    def __init__(self, http_session):
+        self.http = http_session
+        self.app_token = ""
+        self.captcha_code = ""
+        self.started = False
+        # Bumped with every new session, so that workers holding a response of an
+        # older session know that someone else already started a new one
+        self.generation = 0
+        self.handshakes = 0
+        self.rotations = 0
+        self.captchas = 0
+        # Requests that reached the portal, and those answered by the response cache
+        self.requests = 0
+        self.cache_hits = 0
+        self._lock = asyncio.Lock()
+
+    # Function to GET a portal page with the session cookies and take its app_token.
+    # The first page loaded opens the session, so no separate handshake is needed.
+    async def get_page(self, page):
+        async with self.http.get(f"{ECOURTS_BASE_URL}?p={page}") as response:
+            if response.status != 200:
+                raise RuntimeError(f"{page} returned status {response.status}")
+            page_html = await response.text()
+        self.set_token(find_app_token(page_html))
+        if not self.started:
+            logging.info("Started a portal session.")
+            self.started = True
+            self.generation += 1
+            self.handshakes += 1
+        return page_html
+
+    async def _handshake(self):
+        self.started = False
+        self.captcha_code = ""
+        await self.get_page(HANDSHAKE_PAGE)
+
+    # Function to start the session unless a worker already did
+    async def start(self):
+        if self.started:
+            return
+        async with self._lock:
+            if not self.started:
+                await self._handshake()
+
+    # Function to start a new session after `generation` expired; a no-op when another
+    # worker already replaced it
+    async def restart(self, generation):
+        async with self._lock:
+            if generation == self.generation:
+                await self._handshake()
+
+    # Function to take over the session of a Playwright page (its cookies and current
+    # app_token), e.g. one that navigator.py already loaded, instead of a handshake
+    async def adopt_page(self, page):
+        self.load_cookies(await page.context.cookies())
+        self.set_token(await page.evaluate(APP_TOKEN_JS))
+        self.started = True
+        self.generation += 1
+
+    # Function to copy cookies in Playwright's format ({"name", "value", "domain", ...})
+    # into the cookie jar of the HTTP session
+    def load_cookies(self, cookies):
+        for cookie in cookies:
+            domain = cookie.get("domain", "").lstrip(".")
+            if domain and not URL(ECOURTS_BASE_URL).host.endswith(domain):
+                continue
+            self.http.cookie_jar.update_cookies(
+                {cookie["name"]: cookie["value"]}, response_url=URL(ECOURTS_BASE_URL)
+            )
+
+    # Function to load the cookies of a browser-state file written by BrowserSession;
+    # returns False when there is no such file
+    def load_browser_state(self, state_file):
+        try:
+            with open(state_file) as fp:
+                state = json.load(fp)
+        except (OSError, ValueError):
+            return False
+        self.load_cookies(state.get("cookies", []))
+        return True
+
+    def set_token(self, app_token):
+        if app_token and app_token != self.app_token:
+            if self.app_token:
+                self.rotations += 1
+            self.app_token = app_token
+
+    # Function to fill in the AJAX fields every portal form carries
+    def form(self, data):
+        return dict(data, ajax_req="true", app_token=self.app_token)
+
+    # Function to POST a form with the current app_token and take the next one from the
+    # response. A request refused for an expired session is sent once more in a new one.
+    # Responses from the response cache leave the session alone: their app_token
+    # belongs to the session that first fetched them.
+    async def post(self, endpoint, data):
+        await self.start()
+        for retry in (False, True):
+            generation = self.generation
+            status, response_text, from_cache = await post_form_with_retry(
+                self.http, endpoint, self.form(data)
+            )
+            if from_cache:
+                self.cache_hits += 1
+                break
+            self.requests += 1
+            if status == 200:
+                self.set_token(response_json(response_text).get("app_token", ""))
+            if retry or not session_expired(response_text):
+                break
+            logging.warning(f"Portal session expired during {endpoint}.")
+            await self.restart(generation)
+        return status, response_text
+
+    # Function to return the captcha answer of the session, solving the captcha image
+    # once with `solver` (an async function from PNG bytes to (answer, confidence),
+    # e.g. captcha_ocr.solve_captcha); every worker then submits the same answer
+    async def captcha(self, solver):
+        await self.start()
+        async with self._lock:
+            if not self.captcha_code:
+                captcha_url = f"{ECOURTS_BASE_URL}{CAPTCHA_IMAGE_PATH}"
+                async with self.http.get(captcha_url) as response:
+                    captcha_image = await response.read()
+                self.captcha_code, confidence = await solver(captcha_image)
+                self.captchas += 1
+                logging.info(
+                    f"Session captcha solved as '{self.captcha_code}' "
+                    f"(confidence {confidence:.0f})."
+                )
+        return self.captcha_code
+
+    # Function to drop a captcha answer the portal refused, so the next caller of
+    # captcha() solves a new image
+    def reject_captcha(self, answer):
+        if answer == self.captcha_code:
+            self.captcha_code = ""
+
+    def report(self):
+        line = (
+            f"{self.handshakes} handshakes, {self.requests} requests, "
+            f"{self.cache_hits} answered from the cache, "
+            f"{self.rotations} app_token rotations, {self.captchas} captchas solved"
+        )
+        print(f"Portal session: {line}")
+        logging.info(f"Portal session: {line}")
@@ -0,0 +1,178 @@
+import argparse
+import datetime as dt
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import (
+    ALL_COMPLETED,
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    wait,
+)
+from itertools import islice
+
+from case_history_parser import parse_case_history
+from db2 import (
+    DB_FILE,
+    create_connection,
+    fetch_case_histories,
+    iter_unparsed_histories,
+    save_case_records,
+    setup_db,
+)
+from db_writer import BatchWriter
+from section_index import default_section_index
+
+# Configure logging
+logging.basicConfig(
+    filename="court_navigator.log",  # Log to this file
+    level=logging.INFO,  # Log all INFO level and above
+    format="%(asctime)s - %(levelname)s - %(message)s",  # Include timestamp
+)
+
+# Bump whenever case_history_parser changes what it extracts; every case is then
+# parsed again
+PARSER_VERSION = 2
+
+# Case histories per chunk handed to a worker process
+DEFAULT_CHUNK_SIZE = 200
+
+# Connection of a worker process, opened once by _init_parse_worker
+_worker_connection = None
+
+
+def _init_parse_worker(db_file):
+    global _worker_connection
+    _worker_connection = create_connection(db_file)
+
+
+# Function to read and parse the case histories of `cnr_numbers` with `connection`,
+# filing each case under the IPC sections of its acts table. Returns (records, errors):
+# records as save_case_records takes them and errors as (cnr_number, message).
+def parse_chunk(connection, cnr_numbers):
+    section_index = default_section_index()
+    records = []
+    errors = []
+    for cnr_number, content_hash, html_content in fetch_case_histories(
+        connection, cnr_numbers
+    ):
+        try:
+            parsed = parse_case_history(html_content)
+            parsed["sections"] = section_index.assign(parsed["acts"])
+            records.append((cnr_number, content_hash, parsed))
+        except Exception as e:
+            errors.append((cnr_number, f"{type(e).__name__}: {e}"))
+    return records, errors
+
+
+# Function run in a worker process
+def parse_chunk_in_worker(cnr_numbers):
+    return parse_chunk(_worker_connection, cnr_numbers)
+
+
+# Function to yield the unparsed CNR numbers in lists of `chunk_size`
+def iter_chunks(connection, chunk_size=DEFAULT_CHUNK_SIZE):
+    cnr_numbers = iter_unparsed_histories(connection, PARSER_VERSION)
+    while True:
+        chunk = list(islice(cnr_numbers, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+# Function to store the result of one chunk; returns the number of cases stored
+def save_chunk_result(connection, writer, result, date_processed):
+    records, errors = result
+    for cnr_number, error in errors:
+        logging.error(f"Error parsing the case history of {cnr_number}: {error}")
+    save_case_records(connection, records, PARSER_VERSION, date_processed, writer)
+    return len(records)
+
+
+# Function to parse every unparsed case history. With a pool, chunks are parsed by the
+# worker processes (each reads its own pages) while this process, the only writer,
+# stores the rows; two chunks per worker are kept in flight.
+def process_case_histories(
+    connection, writer, pool=None, workers=1, chunk_size=DEFAULT_CHUNK_SIZE
+):
+    date_processed = dt.datetime.now().strftime("%Y-%m-%d %H:%M %p")
+    parsed = 0
+    in_flight = set()
+
+    def collect(return_when):
+        nonlocal parsed, in_flight
+        done, in_flight = wait(in_flight, return_when=return_when)
+        for future in done:
+            parsed += save_chunk_result(
+                connection, writer, future.result(), date_processed
+            )
+
+    for chunk in iter_chunks(connection, chunk_size):
+        if pool is None:
+            parsed += save_chunk_result(
+                connection, writer, parse_chunk(connection, chunk), date_processed
+            )
+            continue
+        in_flight.add(pool.submit(parse_chunk_in_worker, chunk))
+        if len(in_flight) >= workers * 2:
+            collect(FIRST_COMPLETED)
+    if in_flight:
+        collect(ALL_COMPLETED)
+    return parsed
+
+
+def main(workers=1, chunk_size=DEFAULT_CHUNK_SIZE):
+    connection = setup_db()
+    if not connection:
+        logging.error("No connection to database.")
+        return
+
+    if workers == 0:
+        workers = os.cpu_count() or 1
+    pool = None
+    if workers > 1:
+        # Workers are started on demand, after the BatchWriter thread; spawning them
+        # (rather than forking) keeps them clear of locks held by that thread
+        pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_parse_worker,
+            initargs=(DB_FILE,),
+        )
+        print(f"Parsing with {workers} worker processes.")
+
+    started = time.time()
+    try:
+        with BatchWriter(DB_FILE) as writer:
+            parsed = process_case_histories(
+                connection, writer, pool, workers, chunk_size
+            )
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    elapsed = time.time() - started
+    print(f"Parsed {parsed} case histories in {elapsed:.1f}s.")
+    connection.close()
+    return parsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Parse stored case histories into CaseHeaders, CaseParties, "
+        "CaseActs, CaseHearings and CaseSections."
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Parser processes; 1 parses in this process, 0 uses every core.",
+    )
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=DEFAULT_CHUNK_SIZE,
+        help="Case histories per chunk handed to a worker process.",
+    )
+    args = parser.parse_args()
+    main(workers=args.workers, chunk_size=args.chunk_size)
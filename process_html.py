@@ -1,10 +1,46 @@
 import os
 import pandas as pd
-from bs4 import BeautifulSoup
-from db2 import fetch_court_pages, create_connection, create_cnr_table, drop_table
+from cnr_extractors import DEFAULT_ENGINE, ENGINES, extract_cnr
+from db2 import (
+    DB_FILE,
+    fetch_court_page,
+    fetch_court_pages_in_range,
+    create_connection,
+    drop_table,
+    save_cnr_to_db,
+    delete_stale_cnr_rows,
+    delete_orphan_parse_jobs,
+    fetch_processing_state,
+    save_processing_state,
+)
+from db_writer import BatchWriter
+from migrations import migrate
+from job_queue import (
+    STAGE_PARSE,
+    claim_jobs,
+    complete_job,
+    enqueue_jobs,
+    fail_job,
+    iter_jobs,
+    reset_jobs,
+)
+import argparse
 import logging
+import multiprocessing
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+import time
 import datetime as dt
 
+# Bump whenever parse_html_files changes what it extracts; every page is then parsed again
+PARSER_VERSION = 1
+PROCESSOR_NAME = "process_html"
+
+# Pages per chunk handed to a worker process; a chunk is a run of consecutive ids
+DEFAULT_CHUNK_SIZE = 200
+
+# Connection of a worker process, opened once by _init_parse_worker
+_worker_connection = None
+
 
 def drop_CNR_table(connection):
     drop_table(connection, "CNR")
@@ -21,16 +57,140 @@ def setup_db():
     if not connection:
         return
     else:
-        # create table
-        create_cnr_table(connection)
-        print("Connection to SQLite database established and CNR Table created.")
+        # create or upgrade the tables
+        migrate(connection)
+        print("Connection to SQLite database established and schema up to date.")
     return connection
 
 
-def main():
-    # Initialize an empty list to store CNR numbers
-    date_processed = dt.datetime.now().strftime("%Y-%m-%d %H:%M %p")
-    all_CNR_HTMLS = [["Case_Type_Number_Year", "Petitioner_Responder", "CNR_Number"]]
+# Function to queue a parse job for every page added since the last run. The mark is
+# (high-water page id, parser version): when PARSER_VERSION changes, or with
+# full=True, the table is scanned from the start again. Jobs that are already done
+# for this parser version are never queued twice, except with full=True, which puts
+# them back to pending so every page is parsed again.
+def enqueue_new_pages(connection, full=False):
+    state = fetch_processing_state(connection, PROCESSOR_NAME)
+    high_water_id = 0
+    if state is not None and state[0] == PARSER_VERSION and not full:
+        high_water_id = state[1]
+
+    cursor = connection.execute(
+        "SELECT id FROM COURTS_HTML WHERE id > ? ORDER BY id", (high_water_id,)
+    )
+    page_ids = [row[0] for row in cursor]
+    enqueue_jobs(
+        connection,
+        STAGE_PARSE,
+        ((f"{page_id}:v{PARSER_VERSION}", [page_id]) for page_id in page_ids),
+    )
+    if full:
+        removed = delete_orphan_parse_jobs(connection)
+        if removed:
+            logging.info(f"Deleted {removed} parse jobs of pages no longer stored.")
+        reset_jobs(connection, STAGE_PARSE, f"%:v{PARSER_VERSION}")
+    if page_ids:
+        high_water_id = page_ids[-1]
+    save_processing_state(connection, PROCESSOR_NAME, PARSER_VERSION, high_water_id)
+    return len(page_ids)
+
+
+# Function to parse one page into a (job_id, page_id, cnr_rows, error) result
+def parse_page(job_id, page_id, row, date_processed, engine):
+    if row is None:
+        return job_id, page_id, None, f"COURTS_HTML row {page_id} not found"
+    try:
+        return job_id, page_id, extract_cnr_rows(row, date_processed, engine), None
+    except Exception as e:
+        return job_id, page_id, None, f"{type(e).__name__}: {e}"
+
+
+# Function to store a parse result; CNR rows and the job completion go through the
+# writer so that both are committed together. The CNR upsert is idempotent, so a page
+# parsed twice (e.g. after an expired lease) leaves the same rows.
+def save_parse_result(connection, writer, result):
+    job_id, page_id, cnr_rows, error = result
+    if error is not None:
+        logging.error(f"Error parsing COURTS_HTML row {page_id}: {error}")
+        fail_job(connection, job_id, error)
+        return False
+    with writer.unit():
+        delete_stale_cnr_rows(connection, page_id, PARSER_VERSION, writer)
+        for cnr_row in cnr_rows:
+            save_cnr_to_db(connection, cnr_row, writer)
+        complete_job(connection, job_id, writer)
+    return True
+
+
+# Function to parse every claimed page in this process
+def process_pending_pages(connection, writer, date_processed, engine=DEFAULT_ENGINE):
+    parsed = 0
+    for job_id, (page_id,) in iter_jobs(connection, STAGE_PARSE):
+        # Fetch the HTML content from the database
+        row = fetch_court_page(connection, page_id)
+        result = parse_page(job_id, page_id, row, date_processed, engine)
+        parsed += save_parse_result(connection, writer, result)
+    return parsed
+
+
+def _init_parse_worker(db_file):
+    global _worker_connection
+    _worker_connection = create_connection(db_file)
+
+
+# Function run in a worker process: read the id range covered by `job_pages`, a list
+# of (job_id, page_id) sorted by page id, in one query and parse its pages
+def parse_page_range(job_pages, date_processed, engine):
+    first_id, last_id = job_pages[0][1], job_pages[-1][1]
+    rows = {
+        row[0]: row
+        for row in fetch_court_pages_in_range(_worker_connection, first_id, last_id)
+    }
+    return [
+        parse_page(job_id, page_id, rows.get(page_id), date_processed, engine)
+        for job_id, page_id in job_pages
+    ]
+
+
+# Function to parse the claimed pages on a process pool. The main process claims jobs
+# one chunk (a run of consecutive page ids) at a time, keeps two chunks per worker in
+# flight and is the only writer: workers only read pages and return CNR rows.
+def process_pending_pages_parallel(
+    connection,
+    pool,
+    workers,
+    writer,
+    date_processed,
+    engine=DEFAULT_ENGINE,
+    chunk_size=DEFAULT_CHUNK_SIZE,
+):
+    parsed = 0
+    in_flight = set()
+
+    def collect(return_when):
+        nonlocal parsed, in_flight
+        done, in_flight = wait(in_flight, return_when=return_when)
+        for future in done:
+            for result in future.result():
+                parsed += save_parse_result(connection, writer, result)
+
+    while True:
+        jobs = claim_jobs(connection, STAGE_PARSE, limit=chunk_size)
+        if not jobs:
+            if not in_flight:
+                break
+            # Failed pages go back to pending, so claim again once results are in
+            collect(FIRST_COMPLETED)
+            continue
+        job_pages = sorted(
+            ((job_id, page_id) for job_id, (page_id,) in jobs), key=lambda x: x[1]
+        )
+        in_flight.add(pool.submit(parse_page_range, job_pages, date_processed, engine))
+        if len(in_flight) >= workers * 2:
+            collect(FIRST_COMPLETED)
+    return parsed
+
+
+def main(full=False, follow=False, poll_interval=30, engine=DEFAULT_ENGINE, workers=1):
     connection = None
     try:
         connection = setup_db()
@@ -40,196 +200,153 @@ def main():
     # drop CNR table
     # drop_CNR_table(connection)
 
-    # Fetch the HTML content from the database
-    if connection:
-        rows = fetch_court_pages(connection)
-        if rows:
-            for row in rows:
-                date_scraped = row[1]
-                state_code = row[2]
-                district_code = row[3]
-                court_code = row[4]
-                est_code = row[5]
-                act_code = row[6]
-                case_status = row[7]
-                html_content = row[8]
-                section_number = row[9]
-                html_content_with_triple_quotes = f'"""{html_content}"""'
-                print(
-                    f"State Code: {state_code}, District Name: {district_code}, Court Code: {court_code}, Establishment Code: {est_code}, Act Code: {act_code}, Section Number: {section_number}"
-                )
-                all_CNR = parse_html_files(html_content_with_triple_quotes)
-                print("All CNR: ", all_CNR)
-                # Iterate over each list in all_CNR_HTMLS
-                if all_CNR == []:
-                    # Insert the values with error code into the database table
-                    cursor = connection.cursor()
-                    cursor.execute(
-                        """
-                        INSERT INTO CNR (date_processed, date_scraped, state_code, district_code, court_code, est_code, act_code, section_number, case_status, case_type_number_year, petitioner_responder, cnr_number)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    """,
-                        (
-                            date_processed,
-                            date_scraped,
-                            state_code,
-                            district_code,
-                            court_code,
-                            est_code,
-                            act_code,
-                            section_number,
-                            case_status,
-                            "E007: No CNR numbers found as No Records Found",
-                            "E007: No CNR numbers found as No Records Found",
-                            "E007: No CNR numbers found as No Records Found",
-                        ),
-                    )
-                    connection.commit()
-                    cursor.close()
-                else:
-                    for cnr_list in all_CNR:
-                        print("CNR List: ", cnr_list)
-                        # Extract the values from the list
-                        case_type_number_year = cnr_list[0]
-                        petitioner_responder = cnr_list[1]
-                        cnr_number = cnr_list[2]
-
-                        # Insert the values into the database table
-                        cursor = connection.cursor()
-                        cursor.execute(
-                            """
-                            INSERT INTO CNR (date_processed, date_scraped, state_code, district_code, court_code, est_code, act_code, section_number, case_status, case_type_number_year, petitioner_responder, cnr_number)
-                            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                        """,
-                            (
-                                date_processed,
-                                date_scraped,
-                                state_code,
-                                district_code,
-                                court_code,
-                                est_code,
-                                act_code,
-                                section_number,
-                                case_status,
-                                case_type_number_year,
-                                petitioner_responder,
-                                cnr_number,
-                            ),
-                        )
-                        connection.commit()
-                        cursor.close()
-                    all_CNR_HTMLS.append(cnr_list)
-
-        print("Processing complete. CNR numbers extracted and saved to CNR Table.")
-
-    else:
+    if not connection:
         logging.error("No connection to database.")
+        return
 
+    if workers == 0:
+        workers = os.cpu_count() or 1
+    pool = None
+    if workers > 1:
+        # Workers are started on demand, after the BatchWriter thread; spawning them
+        # (rather than forking) keeps them clear of locks held by that thread
+        pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_parse_worker,
+            initargs=(DB_FILE,),
+        )
+        print(f"Parsing with {workers} worker processes.")
 
-def parse_html_files(html_content):
-    # Parse the HTML content using BeautifulSoup
-
-    onclick_value = None
-    all_CNR_2 = []
-    soup = BeautifulSoup(html_content, "html.parser")
-
-    # Find all "table" tags
-    table_tags = soup.find_all("table")
-
-    # print("Table tags: ", table_tags)
-
-    if table_tags:
-        for each_table in table_tags:
-            # print("here")
-            pretty_table = each_table.prettify()
-
-            # Re-parse the pretty table to search for specific elements
-            soup_doc = BeautifulSoup(pretty_table, "html.parser")
-
-            # Find all elements with class "someclass"
-            # elements_with_someclass = soup_doc.find_all("a", class_="someclass")
-
-            # print("ELements with somclass as class ", elements_with_someclass)
-
-            all_trs = soup_doc.find_all("tr")
-
-            # trs_with_case_info = []
-            # trs_with_court_name = []
-
-            # for tr in all_trs:
-
-            #     if len(tr) > 2:
-            #         tds_with_case_info.append(td)
-            #         td[]
-
-            rows = all_trs
-
-            # print("all_rows: ", all_trs)
-
-            for row in rows:
-                all_CNR = []
-                # print("HERE in row")
-                # print("Row: ", row)
-                columns = row.find_all("td")  # This will give you a list of columns
-                if not columns:
-                    # print("HERE IN TH")
-                    columns = row.find_all(
-                        "th"
-                    )  # This will give you a list of columns from headers
-                # print("FINDING TDS")
-                # print("Columns: ", columns)
-                print("Length of columns: ", len(columns))
-                if len(columns) >= 3:
-                    case_type_number_year = columns[1].text.strip()
-                    petitioner_vs_respondent = (
-                        columns[2]
-                        .text.replace("<br/>", " ")
-                        .replace("Vs", " Vs ")
-                        .strip()
+    try:
+        with BatchWriter(DB_FILE) as writer:
+            while True:
+                date_processed = dt.datetime.now().strftime("%Y-%m-%d %H:%M %p")
+                queued = enqueue_new_pages(connection, full=full)
+                full = False
+                started = time.time()
+                if pool is None:
+                    parsed = process_pending_pages(
+                        connection, writer, date_processed, engine
                     )
-                    # print("Case Type Number Year: ", case_type_number_year)
-                    # print("Petitioner vs respondent ", petitioner_vs_respondent)
-                    all_CNR.append(case_type_number_year)
-                    all_CNR.append(petitioner_vs_respondent)
-
-                    i = 1
-                    # print("ALL CNR: ", all_CNR)
-                    # Find all elements with class "someclass"
-                    elements_with_someclass = columns[3].find_all(
-                        "a", class_="someclass"
+                else:
+                    parsed = process_pending_pages_parallel(
+                        connection, pool, workers, writer, date_processed, engine
                     )
-
-                    if not elements_with_someclass:
-                        print("No elements with someclass found.")
-                        all_CNR.append("E004: No CNR found")
-
-                    for element in elements_with_someclass:
-                        # print("Loop counter: ", i)
-                        # print(" HERE IN ELEMENTS")
-                        onclick_value = element.get("onclick")
-
-                        # Extract the CNR number from the onclick attribute
-                        data_values = onclick_value.split("'")[
-                            1:-1
-                        ]  # This will give you a list of data values
-                        CNR_number = data_values[0]
-                        # print("CNR Number: ", CNR_number)
-                        i += 1
-
-                        # Add the CNR number to the list
-                        all_CNR.append(CNR_number)
-                        # print("First CNR: ", all_CNR[0])
-
-                    # print("All CNR: ", all_CNR)
-                    all_CNR_2.append(all_CNR)
-                    # print("First CNR: ", all_CNR_2[0])
-    else:
-        print(f"No tables found in the HTML file. ")
-
-    print("Sending all CNR 2: ", all_CNR_2)
-
-    return all_CNR_2
+                writer.flush()
+                elapsed = time.time() - started
+                print(
+                    f"Parsed {parsed} pages ({queued} newly queued) in {elapsed:.1f}s."
+                )
+                if not follow:
+                    break
+                # Follow mode: wait for the scrapers to commit more pages
+                if parsed == 0:
+                    time.sleep(poll_interval)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    print("Processing complete. CNR numbers extracted and saved to CNR Table.")
+
+
+# Function to turn one COURTS_HTML row into the CNR table rows it yields
+def extract_cnr_rows(row, date_processed, engine=DEFAULT_ENGINE):
+    date_scraped = row[1]
+    state_code = row[2]
+    district_code = row[3]
+    court_code = row[4]
+    est_code = row[5]
+    act_code = row[6]
+    case_status = row[7]
+    html_content = row[8]
+    section_number = row[9]
+    logging.debug(
+        f"State Code: {state_code}, District Name: {district_code}, Court Code: {court_code}, Establishment Code: {est_code}, Act Code: {act_code}, Section Number: {section_number}"
+    )
+    all_CNR = parse_html_files(html_content, engine)
+    page_columns = (
+        date_processed,
+        date_scraped,
+        state_code,
+        district_code,
+        court_code,
+        est_code,
+        act_code,
+        section_number,
+        case_status,
+    )
+    page_source = (row[0], PARSER_VERSION)
+    if all_CNR == []:
+        # Insert the values with error code into the database table
+        return [
+            page_columns
+            + (
+                "E007: No CNR numbers found as No Records Found",
+                "E007: No CNR numbers found as No Records Found",
+                "E007: No CNR numbers found as No Records Found",
+            )
+            + page_source
+        ]
+
+    cnr_rows = []
+    for cnr_list in all_CNR:
+        # Extract the values from the list
+        case_type_number_year = cnr_list[0]
+        petitioner_responder = cnr_list[1]
+        cnr_number = cnr_list[2]
+        cnr_rows.append(
+            page_columns
+            + (case_type_number_year, petitioner_responder, cnr_number)
+            + page_source
+        )
+    return cnr_rows
+
+
+# Function to extract [case_type_number_year, petitioner_vs_respondent, CNR...] rows
+# from a page (see cnr_extractors.py); "bs4" is the original prettify/reparse parser
+# and "stream", the default, returns the same rows.
+def parse_html_files(html_content, engine=DEFAULT_ENGINE):
+    return extract_cnr(html_content, engine)
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(
+        description="Extract CNR numbers from COURTS_HTML."
+    )
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="Parse every COURTS_HTML page again, including pages already parsed.",
+    )
+    parser.add_argument(
+        "--follow",
+        action="store_true",
+        help="Keep running and parse pages as the scrapers commit them.",
+    )
+    parser.add_argument(
+        "--poll-interval",
+        type=float,
+        default=30,
+        help="Seconds to wait for new pages in follow mode.",
+    )
+    parser.add_argument(
+        "--engine",
+        choices=ENGINES,
+        default=DEFAULT_ENGINE,
+        help="HTML extractor to use; bs4 is the original (slow) reference parser.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Parser processes; 1 parses in this process, 0 uses every core.",
+    )
+    args = parser.parse_args()
+    main(
+        full=args.full,
+        follow=args.follow,
+        poll_interval=args.poll_interval,
+        engine=args.engine,
+        workers=args.workers,
+    )
@@ -0,0 +1,229 @@
+import hashlib
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+
+from html_store import DEFAULT_CODEC, compress_html, decompress_html
+from migrations import apply_pragmas
+
+DEFAULT_CACHE_FILE = "response-cache.db"
+DEFAULT_MAX_BYTES = 2 * 1024**3
+
+# off     - always hit the portal
+# on      - serve fresh entries from the cache, store every 200 response
+# refresh - always hit the portal, store every 200 response
+# replay  - never hit the portal; serve any cached entry regardless of age and raise
+#           CacheMiss for the rest (offline re-runs and benchmarks)
+CACHE_MODES = ("off", "on", "refresh", "replay")
+
+# How long a cached response stays fresh, per endpoint. The court hierarchy and the act
+# list of an establishment barely change; case lists and case histories change with hearings.
+ENDPOINT_TTLS = {
+    "casestatus/fillDistrict": 7 * 24 * 3600,
+    "casestatus/fillcomplex": 7 * 24 * 3600,
+    "casestatus/fillCourtEstablishment": 7 * 24 * 3600,
+    "casestatus/fillActType": 7 * 24 * 3600,
+    "casestatus/submitAct": 24 * 3600,
+    "home/viewHistory": 3 * 24 * 3600,
+}
+DEFAULT_TTL = 24 * 3600
+
+# Form fields that do not change the answer and are left out of the key; the captcha
+# answer changes with every session but the result page it unlocks does not
+_VOLATILE_PARAMS = {"app_token", "ajax_req", "act_captcha_code"}
+# Refusals (a wrong captcha, an expired session) come back as status 200 with an
+# error message; they are not stored, so that a retry asks the portal again
+_REFUSAL = re.compile(r'"errormsg"\s*:\s*"[^"]')
+
+# Check the cache size after this many stores
+_EVICTION_CHECK_EVERY = 200
+# A hit only moves last_used forward once it is this old; eviction does not need it
+# to the second, and a replay would otherwise write to the cache on every read
+_LAST_USED_RESOLUTION = 3600
+
+
+class CacheMiss(Exception):
+    pass
+
+
+# Function to build the cache key of a request: the endpoint plus its form fields with
+# volatile fields dropped, values stripped and keys sorted
+def cache_key(endpoint, data):
+    params = {
+        str(name): str(value).strip()
+        for name, value in (data or {}).items()
+        if name not in _VOLATILE_PARAMS
+    }
+    normalized = json.dumps([endpoint, params], sort_keys=True)
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest(), normalized
+
+
+# On-disk cache of portal responses in its own SQLite file, so that it can be copied
+# around or deleted without touching the crawl database. Safe to share between threads.
+class ResponseCache:
+    def __init__(self, cache_file=DEFAULT_CACHE_FILE, mode="on", max_bytes=None):
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Unknown cache mode '{mode}', pick one of {CACHE_MODES}")
+        self.cache_file = cache_file
+        self.mode = mode
+        self.max_bytes = DEFAULT_MAX_BYTES if max_bytes is None else max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evicted = 0
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(
+            cache_file, timeout=30, check_same_thread=False
+        )
+        apply_pragmas(self._connection)
+        with self._connection:
+            self._connection.execute("""
+                CREATE TABLE IF NOT EXISTS Responses (
+                    key TEXT PRIMARY KEY,
+                    endpoint TEXT NOT NULL,
+                    params TEXT NOT NULL,
+                    status INTEGER NOT NULL,
+                    codec TEXT NOT NULL,
+                    body BLOB NOT NULL,
+                    size INTEGER NOT NULL,
+                    fetched_at REAL NOT NULL,
+                    last_used REAL NOT NULL
+                )
+                """)
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS idx_responses_last_used "
+                "ON Responses (last_used)"
+            )
+
+    # Returns (status, text) when the request can be answered from the cache, else
+    # None. In replay mode a miss raises CacheMiss instead.
+    def get(self, endpoint, data):
+        if self.mode in ("off", "refresh"):
+            return None
+        key, normalized = cache_key(endpoint, data)
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT status, codec, body, fetched_at, last_used FROM Responses "
+                "WHERE key = ?",
+                (key,),
+            ).fetchone()
+            ttl = ENDPOINT_TTLS.get(endpoint, DEFAULT_TTL)
+            if row is None or (self.mode == "on" and time.time() - row[3] > ttl):
+                self.misses += 1
+                if self.mode == "replay":
+                    raise CacheMiss(f"No cached response for {normalized}")
+                return None
+            self.hits += 1
+            now = time.time()
+            if now - row[4] > _LAST_USED_RESOLUTION:
+                with self._connection:
+                    self._connection.execute(
+                        "UPDATE Responses SET last_used = ? WHERE key = ?",
+                        (now, key),
+                    )
+        return row[0], decompress_html(row[1], row[2])
+
+    # Stores a successful response
+    def put(self, endpoint, data, status, text):
+        if self.mode in ("off", "replay") or status != 200:
+            return
+        if _REFUSAL.search(text or ""):
+            return
+        key, normalized = cache_key(endpoint, data)
+        body = compress_html(text, DEFAULT_CODEC)
+        now = time.time()
+        with self._lock:
+            with self._connection:
+                self._connection.execute(
+                    """
+                    INSERT INTO Responses (key, endpoint, params, status, codec, body, size, fetched_at, last_used)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (key) DO UPDATE SET status = excluded.status,
+                        codec = excluded.codec, body = excluded.body, size = excluded.size,
+                        fetched_at = excluded.fetched_at, last_used = excluded.last_used
+                    """,
+                    (
+                        key,
+                        endpoint,
+                        normalized,
+                        status,
+                        DEFAULT_CODEC,
+                        body,
+                        len(body),
+                        now,
+                        now,
+                    ),
+                )
+            self.stores += 1
+            if self.stores % _EVICTION_CHECK_EVERY == 0:
+                self._evict()
+
+    # Deletes the least recently used entries until the cache fits in max_bytes
+    def _evict(self):
+        total = self._connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM Responses"
+        ).fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        target = self.max_bytes * 0.9
+        doomed = []
+        for key, size in self._connection.execute(
+            "SELECT key, size FROM Responses ORDER BY last_used"
+        ):
+            if total <= target:
+                break
+            doomed.append((key,))
+            total -= size
+        with self._connection:
+            self._connection.executemany("DELETE FROM Responses WHERE key = ?", doomed)
+        self.evicted += len(doomed)
+        logging.info(f"Response cache evicted {len(doomed)} entries.")
+
+    def report(self):
+        line = (
+            f"mode={self.mode}, hits={self.hits}, misses={self.misses}, "
+            f"stored={self.stores}, evicted={self.evicted}"
+        )
+        print(f"Response cache: {line}")
+        logging.info(f"Response cache: {line}")
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+# The cache used by fetch_engine; None means caching is off
+_active_cache = None
+
+
+# Function to turn the cache on for this process (mode "off" turns it off)
+def configure_cache(mode="on", cache_file=DEFAULT_CACHE_FILE, max_bytes=None):
+    global _active_cache
+    if _active_cache is not None:
+        _active_cache.close()
+    _active_cache = None
+    if mode != "off":
+        _active_cache = ResponseCache(cache_file, mode, max_bytes)
+    return _active_cache
+
+
+def get_cache():
+    return _active_cache
+
+
+# Function to add the --cache / --cache-file options to a script's parser
+def add_cache_arguments(parser, default_mode="on"):
+    parser.add_argument(
+        "--cache",
+        choices=CACHE_MODES,
+        default=default_mode,
+        help="Response cache mode; 'replay' runs offline from the cache only.",
+    )
+    parser.add_argument(
+        "--cache-file",
+        default=DEFAULT_CACHE_FILE,
+        help="SQLite file holding the cached portal responses.",
+    )
@@ -0,0 +1,134 @@
+import argparse
+import csv
+import logging
+import re
+
+from db2 import DB_FILE, create_connection
+from migrations import migrate
+
+# IPC sections as listed on devgan.in: link, section_number, description, section_name
+SECTIONS_FILE = "final_ipc_list.csv"
+
+# Section searched when none is given, and the marker of a search without a section
+# filter: such a page lists every case of the act and is stored under section "*"
+DEFAULT_SECTION = "302"
+ALL_SECTIONS = "*"
+
+# Same filter get_act_codes.py applies to the act dropdown
+IPC_ACT = re.compile(r"^(I.P.C|IPC|Indian Penal Code)\b", re.IGNORECASE)
+# "302", "498A", "498-A", "498 A", "120(B)": the number and an optional letter suffix
+_SECTION_TOKEN = re.compile(r"(\d+)\s*(?:-|\()?\s*([A-Za-z]{1,2})?(?![A-Za-z])")
+# Clauses such as "(2)", "(ii)" or "(g)" in "376(2)(g)" belong to the section before
+# them and are dropped, so they are not read as sections of their own
+_CLAUSE = re.compile(r"\(\s*(?:\d+|[ivx]+|[a-z])\s*\)")
+
+
+# Function to give the under_sec form value for a section; ALL_SECTIONS leaves the
+# field empty, which the portal treats as every section of the act
+def section_filter(section_number):
+    return "" if section_number == ALL_SECTIONS else section_number
+
+
+# Maps the section text of the acts table of a case ("302", "498-A", "376(2)(g)",
+# "Sec. 34 IPC") to the section numbers of final_ipc_list.csv. With it a case fetched
+# without a section filter can be filed under every IPC section it was booked under.
+class SectionIndex:
+    def __init__(self, sections):
+        # section_number -> section_name
+        self.sections = dict(sections)
+
+    @classmethod
+    def from_csv(cls, csv_file=SECTIONS_FILE):
+        with open(csv_file, newline="", encoding="utf-8") as fp:
+            return cls(
+                (row["section_number"].strip().upper(), row["section_name"].strip())
+                for row in csv.DictReader(fp)
+                if row["section_number"].strip()
+            )
+
+    def __len__(self):
+        return len(self.sections)
+
+    def __contains__(self, section_number):
+        return section_number in self.sections
+
+    # Function to read the known sections named in `text`, in order of appearance.
+    # A suffix that makes no known section ("302 r" of "302 r/w 34") is dropped.
+    def match(self, text):
+        found = []
+        for number, suffix in _SECTION_TOKEN.findall(_CLAUSE.sub(" ", text or "")):
+            number = str(int(number))
+            section_number = number + suffix.upper()
+            if section_number not in self.sections:
+                section_number = number
+            if section_number in self.sections and section_number not in found:
+                found.append(section_number)
+        return found
+
+    # Function to list the IPC sections of a case from its (act, section) rows, as
+    # parse_acts returns them; sections of other acts are ignored
+    def assign(self, acts):
+        sections = []
+        for act, section in acts:
+            if not IPC_ACT.search(act or ""):
+                continue
+            for section_number in self.match(section):
+                if section_number not in sections:
+                    sections.append(section_number)
+        return sections
+
+
+# Index of SECTIONS_FILE, read once per process
+_default_index = None
+
+
+def default_section_index():
+    global _default_index
+    if _default_index is None:
+        _default_index = SectionIndex.from_csv()
+        logging.info(f"Loaded {len(_default_index)} IPC sections from {SECTIONS_FILE}.")
+    return _default_index
+
+
+def main(top=20):
+    connection = create_connection(DB_FILE)
+    migrate(connection)
+    index = default_section_index()
+    print(f"{len(index)} IPC sections in {SECTIONS_FILE}.")
+
+    rows = connection.execute(
+        """
+        SELECT section_number, COUNT(*) FROM CaseSections
+        GROUP BY section_number ORDER BY COUNT(*) DESC LIMIT ?
+        """,
+        (top,),
+    ).fetchall()
+    for section_number, cases in rows:
+        print(f"{section_number:>6}  {cases:>8}  {index.sections.get(section_number)}")
+
+    # Cases whose acts name no known IPC section, e.g. cases under other acts only
+    unmatched = connection.execute("""
+        SELECT COUNT(DISTINCT a.cnr_number) FROM CaseActs a
+        WHERE NOT EXISTS (
+            SELECT 1 FROM CaseSections s WHERE s.cnr_number = a.cnr_number
+        )
+        """).fetchone()[0]
+    print(f"{unmatched} parsed cases without an IPC section.")
+    connection.close()
+
+
+if __name__ == "__main__":
+    # Configure logging
+    logging.basicConfig(
+        filename="court_navigator.log",  # Log to this file
+        level=logging.INFO,  # Log all INFO level and above
+        format="%(asctime)s - %(levelname)s - %(message)s",  # Include timestamp
+    )
+    parser = argparse.ArgumentParser(
+        description="Show how many parsed cases fall under each IPC section."
+    )
+    parser.add_argument(
+        "--top", type=int, default=20, help="Number of sections to list."
+    )
+    args = parser.parse_args()
+    main(top=args.top)
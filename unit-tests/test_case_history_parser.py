@@ -0,0 +1,81 @@
+import pytest
+
+import case_history_parser
+from case_history_parser import normalize_date, parse_case_history
+from db2 import HEADER_COLUMNS
+
+# A viewHistory page as the portal returns it in data_list
+PAGE = """<div><h2>District and Sessions Court, Hojai</h2>
+<table class="table case_details_table table-bordered"><tr><td>Case Type</td><td>Session Case</td></tr>
+<tr><td>Filing Number</td><td>360/2021</td><td>Filing Date</td><td>23-03-2021</td></tr>
+<tr><td>Registration Number</td><td>3/2021</td><td>Registration Date:</td><td>24-03-2021</td></tr>
+<tr><td>CNR Number</td><td>ASHJ010003602021</td></tr></table>
+<table class="table case_status_table table-bordered"><tr><td>First Hearing Date</td><td>27th March 2021</td></tr>
+<tr><td>Next Hearing Date</td><td>5th  November 2024</td></tr><tr><td>Case Status</td><td>Case pending</td></tr>
+<tr><td>Stage of Case</td><td>Evidence</td></tr><tr><td>Court Number and Judge</td><td>1-District and Sessions Judge</td></tr></table>
+<table class="table table_r Petitioner_Advocate_table"><tr><td>1) State of Assam<br>&nbsp;&nbsp;Advocate- P.P.</td></tr></table>
+<table class="table table_r Respondent_Advocate_table"><tr><td>1) Abdul Rahman<br>2) Md. Karim Uddin<br>Ahmed<br>Advocate - A. Das</td></tr></table>
+<table id="act_table" class="table acts_table"><tr><th>Under Act(s)</th><th>Under Section(s)</th></tr>
+<tr><td>Indian Penal Code</td><td>302,34</td></tr><tr><td>Arms Act</td><td>25</td></tr></table>
+<table class="history_table table"><thead><tr><th>Judge</th><th>Business on Date</th><th>Hearing Date</th><th>Purpose of hearing</th></tr></thead>
+<tr><td>District and Sessions Judge</td><td><a href="#">27-03-2021</a></td><td>10-05-2021</td><td>Appearance</td></tr>
+<tr><td>District and Sessions Judge</td><td><a>10-05-2021</a></td><td>Not Available</td><td>Charge</td></tr></table></div>"""
+
+EXPECTED = {
+    "header": {
+        "case_type": "Session Case",
+        "filing_number": "360/2021",
+        "filing_date": "2021-03-23",
+        "registration_number": "3/2021",
+        "registration_date": "2021-03-24",
+        "first_hearing_date": "2021-03-27",
+        "next_hearing_date": "2024-11-05",
+        "decision_date": None,
+        "case_status": "Case pending",
+        "stage_of_case": "Evidence",
+        "nature_of_disposal": None,
+        "court_and_judge": "1-District and Sessions Judge",
+    },
+    "parties": [
+        ("petitioner", 1, "State of Assam", "P.P."),
+        ("respondent", 1, "Abdul Rahman", None),
+        ("respondent", 2, "Md. Karim Uddin Ahmed", "A. Das"),
+    ],
+    "acts": [
+        ("Indian Penal Code", "302"),
+        ("Indian Penal Code", "34"),
+        ("Arms Act", "25"),
+    ],
+    "hearings": [
+        (1, "District and Sessions Judge", "2021-03-27", "2021-05-10", "Appearance"),
+        (2, "District and Sessions Judge", "2021-05-10", "Not Available", "Charge"),
+    ],
+}
+
+
+def test_parse_case_history():
+    assert parse_case_history(PAGE) == EXPECTED
+
+
+# The BeautifulSoup fallback reads the same rows as lxml
+def test_parse_without_lxml(monkeypatch):
+    monkeypatch.setattr(case_history_parser, "lxml", None)
+    assert parse_case_history(PAGE) == EXPECTED
+
+
+def test_header_has_every_column():
+    assert list(parse_case_history("<div></div>")["header"]) == HEADER_COLUMNS
+
+
+@pytest.mark.parametrize(
+    "text, date",
+    [
+        ("23-03-2021", "2021-03-23"),
+        ("23/03/2021", "2021-03-23"),
+        ("27th March 2021", "2021-03-27"),
+        ("1st Feb 2020", "2020-02-01"),
+        ("Not Available", "Not Available"),
+    ],
+)
+def test_normalize_date(text, date):
+    assert normalize_date(text) == date
@@ -0,0 +1,95 @@
+import sqlite3
+
+import pytest
+
+from cnr_decoder import (
+    NO_COURT,
+    PrefixIndex,
+    cnr_array,
+    get_prefix_index,
+    validate_cnrs,
+)
+from migrations import migrate
+
+
+@pytest.fixture
+def index():
+    return PrefixIndex(
+        [b"UPAG01", b"ASHJ01", b"UPAG02"],
+        [
+            ("13", "1", "1010001", "1"),
+            ("6", "30", "1060030", "1"),
+            ("13", "1", "1010001", "2"),
+        ],
+    )
+
+
+def test_validate_cnrs():
+    cnrs = [
+        "UPAG010000012020",
+        " upag010000012020 ",
+        "E004: No CNR found",
+        "UPAG010000002020",
+        "UPAG010000011900",
+        "UPAG01000001202",
+        "UP1G010000012020",
+    ]
+    assert validate_cnrs(cnr_array(cnrs)).tolist() == [
+        True,
+        True,
+        False,
+        False,
+        False,
+        False,
+        False,
+    ]
+
+
+def test_lookup(index):
+    positions = index.lookup(
+        ["UPAG020000012020", "ASHJ010003602021", "UPAG030000012020", "bogus"]
+    )
+    assert index.params[positions[0]] == ("13", "1", "1010001", "2")
+    assert index.params[positions[1]] == ("6", "30", "1060030", "1")
+    assert positions[2] == NO_COURT
+    assert positions[3] == NO_COURT
+
+
+def test_lookup_on_empty_index():
+    assert PrefixIndex([], []).lookup(["UPAG010000012020"]).tolist() == [NO_COURT]
+
+
+def test_resolve_counts_unresolved(index):
+    unresolved = [0]
+    rows = list(index.resolve(["upag010000012020", "ZZZZ010000012020"], unresolved))
+    assert rows == [("UPAG010000012020", "13", "1", "1010001", "1")]
+    assert unresolved == [1]
+
+
+# The saved index is rebuilt once the CNR table gains rows
+def test_index_is_rebuilt_when_cnr_grows():
+    connection = sqlite3.connect(":memory:")
+    migrate(connection)
+    connection.execute(
+        "INSERT INTO Courts (date_scraped, state_code, district_code, court_code, "
+        "court_name, establishment_code, establishment_name) "
+        "VALUES ('d', '13', '1', '1010001@1,2@N', 'Court', '1', 'Establishment')"
+    )
+
+    def add_cnr(cnr_number, court_code):
+        connection.execute(
+            "INSERT INTO CNR (date_processed, date_scraped, state_code, district_code, "
+            "court_code, est_code, act_code, section_number, case_status, "
+            "case_type_number_year, petitioner_responder, cnr_number) "
+            "VALUES ('d', 'd', '13', '1', ?, '1', 'a', '302', 'Pending', 'x', 'y', ?)",
+            (court_code, cnr_number),
+        )
+        connection.commit()
+
+    add_cnr("UPAG010000012020", "1010001@1,2@N")
+    index = get_prefix_index(connection)
+    assert index.lookup(["UPAG020000012020", "UPKA010000012020"])[1] == NO_COURT
+    add_cnr("UPKA010000012020", "1010001@1,2@N")
+    index = get_prefix_index(connection)
+    assert index.lookup(["UPKA010000012020"])[0] != NO_COURT
+    connection.close()
@@ -0,0 +1,51 @@
+import pytest
+
+from cnr_extractors import ENGINES, extract_cnr
+
+# Result pages as COURTS_HTML holds them, including the malformed markup the portal
+# sends: unclosed cells, comments, nested tables and rows that break the reference
+PAGES = [
+    """<html><body><table><tr><th>Sr</th><th>Case</th><th>Party</th><th>View</th></tr>
+<tr><td>1</td><td>SC/12/2019</td><td>State<br/>Vs<br/>Ram &amp; Sons</td><td><a class="someclass" onclick="viewHistory('UPAG010012342019','x')">View</a></td></tr>
+<tr><td colspan=3>Court: <b>ABC</b></td></tr>
+<tr><td>2</td><td> CR/1/2020 </td><td>A Vs B</td><td>no link</td></tr>
+</table></body></html>""",
+    """<table><tr><td>1</td><td>x<!-- c -->y</td><td>P Vs Q</td><td><a class="someclass other" onclick="f('CNR1','a')">v</a><a class=someclass onclick="f('CNR2')">w</a></td></tr><tr><td><table><tr><td>a</td><td>b</td><td>c</td><td><a class="someclass" onclick="g('N1','2')">z</a></td></tr></table></td><td>k</td><td>l</td><td>m</td></tr></table>""",
+    """<table><tr><td>1</td><td>Only</td><td>three</td></tr></table>""",
+    """<div>No Records found</div>""",
+    """<table><tbody><tr><td>1</td><td>&nbsp;X&nbsp;</td><td>Vsx Vs y</td><td><span><a class='someclass' onclick="h('AB', 1)">q</a></span></td></tr></tbody></table>""",
+    """<table><tr><td>1<td>unclosed<td>cells<td><a class="someclass" onclick="h('Z9','')">q</a></tr></table>""",
+]
+
+
+# Function to run an engine and return its rows, or the type of error it raised
+def _outcome(html_content, engine):
+    try:
+        return extract_cnr(html_content, engine)
+    except Exception as e:
+        return type(e)
+
+
+@pytest.mark.parametrize("html_content", PAGES)
+def test_stream_matches_reference(html_content):
+    assert _outcome(html_content, "stream") == _outcome(html_content, "bs4")
+
+
+# lxml closes an unclosed <td> at the next one, where html.parser nests them
+def test_lxml_differs_on_unclosed_cells():
+    assert _outcome(PAGES[-1], "lxml") != _outcome(PAGES[-1], "bs4")
+
+
+# The header row has four cells too and comes back without a CNR
+def test_cnr_is_read_from_onclick():
+    rows = extract_cnr(PAGES[0], "stream")
+    assert rows[0][2] == "E004: No CNR found"
+    assert rows[1][0] == "SC/12/2019"
+    assert rows[1][2] == "UPAG010012342019"
+    assert rows[2][2] == "E004: No CNR found"
+
+
+def test_unknown_engine():
+    with pytest.raises(ValueError):
+        extract_cnr(PAGES[0], "regex")
+    assert "stream" in ENGINES
@@ -0,0 +1,72 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+from db_writer import BatchWriter, write_unit
+
+
+@pytest.fixture
+def db_file(tmp_path):
+    db_file = str(tmp_path / "writer.db")
+    connection = sqlite3.connect(db_file)
+    connection.execute("CREATE TABLE Pages (page INTEGER NOT NULL)")
+    connection.execute("CREATE TABLE Done (job INTEGER NOT NULL)")
+    connection.commit()
+    connection.close()
+    return db_file
+
+
+def _rows(db_file, table_name):
+    connection = sqlite3.connect(db_file)
+    rows = [row[0] for row in connection.execute(f"SELECT * FROM {table_name}")]
+    connection.close()
+    return sorted(rows)
+
+
+def test_rows_are_written_in_batches(db_file):
+    with BatchWriter(db_file, batch_size=2) as writer:
+        writer.put_many("INSERT INTO Pages VALUES (?)", [(1,), (2,), (3,)])
+    assert _rows(db_file, "Pages") == [1, 2, 3]
+    assert writer.rows_written == 3
+
+
+# A bad row makes the batch fall back to one unit at a time: the other rows are kept
+def test_fallback_drops_only_the_bad_row(db_file):
+    with BatchWriter(db_file) as writer:
+        writer.put_many("INSERT INTO Pages VALUES (?)", [(1,), (None,), (3,)])
+    assert _rows(db_file, "Pages") == [1, 3]
+
+
+# The completion of a job whose page row fails must not be committed without it
+def test_fallback_drops_a_unit_whole(db_file):
+    with BatchWriter(db_file) as writer:
+        for job, page in ((1, 1), (2, None), (3, 3)):
+            with writer.unit():
+                writer.put("INSERT INTO Pages VALUES (?)", (page,))
+                writer.put("INSERT INTO Done VALUES (?)", (job,))
+    assert _rows(db_file, "Pages") == [1, 3]
+    assert _rows(db_file, "Done") == [1, 3]
+
+
+# Units of concurrent asyncio tasks stay apart even when their rows interleave
+def test_units_of_concurrent_tasks(db_file):
+    writer = BatchWriter(db_file)
+
+    async def job(number, page):
+        with write_unit(writer):
+            writer.put("INSERT INTO Pages VALUES (?)", (page,))
+            await asyncio.sleep(0.01)
+            writer.put("INSERT INTO Done VALUES (?)", (number,))
+
+    async def run():
+        await asyncio.gather(job(1, 1), job(2, None), job(3, 3))
+
+    asyncio.run(run())
+    writer.close()
+    assert _rows(db_file, "Done") == [1, 3]
+
+
+def test_write_unit_without_writer():
+    with write_unit(None):
+        pass
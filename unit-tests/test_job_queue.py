@@ -0,0 +1,78 @@
+import sqlite3
+import time
+
+import pytest
+
+import job_queue
+from migrations import migrate
+
+
+@pytest.fixture
+def connection():
+    connection = sqlite3.connect(":memory:")
+    migrate(connection)
+    yield connection
+    connection.close()
+
+
+def test_claim_leases_pending_jobs_once(connection):
+    job_queue.enqueue_jobs(connection, "t", ((i, [i]) for i in range(3)))
+    assert job_queue.claim_jobs(connection, "t", limit=2) == [(1, [0]), (2, [1])]
+    assert job_queue.claim_jobs(connection, "t", limit=2) == [(3, [2])]
+    assert job_queue.claim_jobs(connection, "t") == []
+
+
+def test_enqueue_keeps_existing_keys(connection):
+    job_queue.enqueue_jobs(connection, "t", [(1, [1])])
+    job_queue.complete_job(connection, job_queue.claim_jobs(connection, "t")[0][0])
+    assert job_queue.enqueue_jobs(connection, "t", [(1, [1])]) == 0
+    assert job_queue.job_counts(connection, "t") == {"done": 1}
+
+
+def test_expired_lease_is_claimed_again(connection):
+    job_queue.enqueue_jobs(connection, "t", [(1, [1])])
+    job_queue.claim_jobs(connection, "t", lease_seconds=-1)
+    assert job_queue.claim_jobs(connection, "t") == [(1, [1])]
+
+
+def test_expired_lease_on_last_attempt_fails(connection):
+    job_queue.enqueue_jobs(connection, "t", [(1, [1])])
+    job_queue.claim_jobs(connection, "t", lease_seconds=-1, max_attempts=1)
+    assert job_queue.claim_jobs(connection, "t", max_attempts=1) == []
+    assert job_queue.job_counts(connection, "t") == {"failed": 1}
+
+
+def test_failed_job_goes_back_to_pending(connection):
+    job_queue.enqueue_jobs(connection, "t", [(1, [1])])
+    job_id, _ = job_queue.claim_jobs(connection, "t")[0]
+    job_queue.fail_job(connection, job_id, "boom", max_attempts=2)
+    assert job_queue.job_counts(connection, "t") == {"pending": 1}
+    job_queue.claim_jobs(connection, "t")
+    job_queue.fail_job(connection, job_id, "boom", max_attempts=2)
+    assert job_queue.job_counts(connection, "t") == {"failed": 1}
+
+
+# A batch outliving its lease: each job's lease is renewed when it is handed out, and a
+# job another worker took over in the meantime is skipped
+def test_iter_jobs_renews_and_skips_lost_leases(connection):
+    job_queue.enqueue_jobs(connection, "t", ((i, [i]) for i in range(3)))
+    jobs = job_queue.iter_jobs(connection, "t", batch_size=3, lease_seconds=600)
+    assert next(jobs) == (1, [0])
+    connection.execute(
+        "UPDATE Jobs SET lease_owner = 'other', lease_expires = ? WHERE id = 2",
+        (time.time() + 600,),
+    )
+    connection.commit()
+    assert list(jobs) == [(3, [2])]
+    lease_expires = connection.execute(
+        "SELECT lease_expires FROM Jobs WHERE id = 3"
+    ).fetchone()[0]
+    assert lease_expires > time.time() + 500
+
+
+def test_reset_jobs_by_key_pattern(connection):
+    job_queue.enqueue_jobs(connection, "t", [("1:v1", [1]), ("1:v2", [1])])
+    for job_id, _ in job_queue.iter_jobs(connection, "t"):
+        job_queue.complete_job(connection, job_id)
+    assert job_queue.reset_jobs(connection, "t", "%:v2") == 1
+    assert job_queue.job_counts(connection, "t") == {"done": 1, "pending": 1}
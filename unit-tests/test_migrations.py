@@ -0,0 +1,93 @@
+import sqlite3
+
+import pytest
+
+from db2 import fetch_court_page, save_html_to_db
+from migrations import LATEST_VERSION, _BASELINE_SCHEMA, current_version, migrate
+
+COURT = ("2020-01-01", "13", "1", "1010001", "Court", "1", "Establishment")
+PAGE = ("2020-01-01", "13", "1", "1010001", "1", "12", "Pending", "<table></table>")
+
+
+# A database as the scrapers created it before migrations existed: the baseline
+# tables, user_version 0 and duplicate rows
+@pytest.fixture
+def baseline(tmp_path):
+    connection = sqlite3.connect(str(tmp_path / "baseline.db"))
+    for statement in _BASELINE_SCHEMA:
+        connection.execute(statement)
+    connection.executemany(
+        "INSERT INTO Courts (date_scraped, state_code, district_code, court_code, "
+        "court_name, establishment_code, establishment_name) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        [COURT, COURT],
+    )
+    connection.executemany(
+        "INSERT INTO COURTS_HTML (date_scraped, state_code, district_code, court_code, "
+        "establishment_code, act_code, case_status, html_content) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        [PAGE, PAGE],
+    )
+    connection.commit()
+    yield connection
+    connection.close()
+
+
+def test_migrates_baseline_to_latest(baseline):
+    assert current_version(baseline) == 0
+    assert migrate(baseline) == LATEST_VERSION
+    assert migrate(baseline) == LATEST_VERSION
+
+
+def test_duplicates_are_removed(baseline):
+    migrate(baseline)
+    assert baseline.execute("SELECT COUNT(*) FROM Courts").fetchone()[0] == 1
+    assert baseline.execute("SELECT COUNT(*) FROM COURTS_HTML").fetchone()[0] == 1
+
+
+# GROUP BY treats NULLs as equal but a unique index does not; legacy NULL
+# establishment codes are stored as '' so the upserts match them
+def test_null_establishment_codes_are_deduped(baseline):
+    court = COURT[:5] + (None, "Establishment")
+    baseline.executemany(
+        "INSERT INTO Courts (date_scraped, state_code, district_code, court_code, "
+        "court_name, establishment_code, establishment_name) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        [court, court],
+    )
+    migrate(baseline)
+    rows = baseline.execute(
+        "SELECT establishment_code FROM Courts ORDER BY establishment_code"
+    ).fetchall()
+    assert rows == [("",), ("1",)]
+
+
+# Databases already past migration 3 have their NULL rows cleaned up by migration 12
+def test_null_establishment_codes_after_migration_3(baseline):
+    migrate(baseline)
+    court = COURT[:5] + (None, "Establishment")
+    baseline.executemany(
+        "INSERT INTO Courts (date_scraped, state_code, district_code, court_code, "
+        "court_name, establishment_code, establishment_name) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        [court, court],
+    )
+    baseline.execute("PRAGMA user_version = 11")
+    baseline.commit()
+    assert migrate(baseline) == LATEST_VERSION
+    assert baseline.execute("SELECT COUNT(*) FROM Courts").fetchone()[0] == 2
+
+
+# Pages stored as text before migration 5 are still read as they were
+def test_legacy_pages_stay_readable(baseline):
+    migrate(baseline)
+    page_id = baseline.execute("SELECT id FROM COURTS_HTML").fetchone()[0]
+    row = fetch_court_page(baseline, page_id)
+    assert row[8] == "<table></table>"
+    assert row[9] == "302"
+
+
+# A page saved again with other content replaces the stored one
+def test_changed_page_is_replaced(baseline):
+    migrate(baseline)
+    save_html_to_db(baseline, *PAGE[:7], "<table>new</table>", "302")
+    rows = baseline.execute("SELECT id FROM COURTS_HTML").fetchall()
+    assert len(rows) == 1
+    assert fetch_court_page(baseline, rows[0][0])[8] == "<table>new</table>"
@@ -0,0 +1,51 @@
+import pytest
+
+from section_index import SectionIndex, section_filter
+
+
+@pytest.fixture
+def index():
+    return SectionIndex(
+        [
+            ("34", "Common intention"),
+            ("120B", "Criminal conspiracy"),
+            ("302", "Murder"),
+            ("376", "Rape"),
+            ("498A", "Cruelty by husband"),
+        ]
+    )
+
+
+@pytest.mark.parametrize(
+    "text, sections",
+    [
+        ("302", ["302"]),
+        ("302, 34", ["302", "34"]),
+        ("498-A", ["498A"]),
+        ("498 A", ["498A"]),
+        ("120(B)", ["120B"]),
+        ("376(2)(g)", ["376"]),
+        ("302 r/w 34", ["302", "34"]),
+        ("Sec. 34 IPC", ["34"]),
+        ("302/302", ["302"]),
+        ("999", []),
+        ("", []),
+        (None, []),
+    ],
+)
+def test_match(index, text, sections):
+    assert index.match(text) == sections
+
+
+def test_assign_keeps_ipc_acts_only(index):
+    acts = [
+        ("Indian Penal Code", "302,34"),
+        ("Arms Act", "25"),
+        ("I.P.C.", "498-A"),
+    ]
+    assert index.assign(acts) == ["302", "34", "498A"]
+
+
+def test_section_filter():
+    assert section_filter("*") == ""
+    assert section_filter("302") == "302"